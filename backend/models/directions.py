@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import List
+from backend.models.coords import Coordinates
+
+class BatchDirectionsRequest(BaseModel):
+    origins: List[Coordinates]
+    end: str = Field(..., example="hunt library")
+    profile: str = "default"
@@ -0,0 +1,504 @@
+"""
+In-process stand-in for the Motor client, used when DB_BACKEND=memory.
+
+It implements the subset of the async collection API the app uses (find
+with projection/sort/limit, single and bulk writes, $set update pipelines,
+$geoWithin/$near on GeoJSON points, TTL indexes) over plain dicts, so the
+service can boot, route and be benchmarked offline. Data lives only as
+long as the process; change streams are not supported, so the obstacle
+index falls back to polling.
+"""
+import copy
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+EARTH_RADIUS_M = 6378100
+_MISSING = object()
+
+
+def _get(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set(doc: Dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def _unset(doc: Dict, path: str):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+
+_BSON_TYPES = {"string": str, "date": datetime, "bool": bool, "object": dict, "array": list, "objectId": ObjectId}
+
+
+def _is_type(value, name: str) -> bool:
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if name == "null":
+        return value is None
+    return name in _BSON_TYPES and isinstance(value, _BSON_TYPES[name])
+
+
+def _haversine_m(lng1, lat1, lng2, lat2) -> float:
+    lat1, lat2, dlat, dlng = map(math.radians, (lat1, lat2, lat2 - lat1, lng2 - lng1))
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _point(value):
+    """(lng, lat) of a GeoJSON Point or legacy [lng, lat] pair, else None"""
+    if isinstance(value, dict) and value.get("type") == "Point":
+        value = value.get("coordinates")
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return float(value[0]), float(value[1])
+    return None
+
+
+def _in_ring(lng: float, lat: float, ring) -> bool:
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > lat) != (y2 > lat) and lng < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+def _geo_within(value, shape: Dict) -> bool:
+    point = _point(value)
+    if point is None:
+        return False
+    if "$centerSphere" in shape:
+        (lng, lat), radians = shape["$centerSphere"]
+        return _haversine_m(lng, lat, *point) <= radians * EARTH_RADIUS_M
+    if "$geometry" in shape and shape["$geometry"].get("type") == "Polygon":
+        outer, *holes = shape["$geometry"]["coordinates"]
+        return _in_ring(*point, outer) and not any(_in_ring(*point, hole) for hole in holes)
+    raise OperationFailure(f"Unsupported $geoWithin shape: {list(shape)}")
+
+
+def _near_distance(value, spec: Dict) -> Optional[float]:
+    point = _point(value)
+    center = _point(spec["$geometry"])
+    if point is None or center is None:
+        return None
+    return _haversine_m(*center, *point)
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$type":
+        return value is not _MISSING and _is_type(value, operand)
+    if operator == "$eq":
+        return _equals(value, operand)
+    if operator == "$ne":
+        return not _equals(value, operand)
+    if operator == "$in":
+        return any(_equals(value, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in operand)
+    if operator == "$geoWithin":
+        return _geo_within(value, operand)
+    if operator == "$near":
+        distance = _near_distance(value, operand)
+        return distance is not None and distance <= operand.get("$maxDistance", math.inf) and distance >= operand.get("$minDistance", 0)
+    if operator == "$not":
+        return not _match_value(value, operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        return {"$gt": value > operand, "$gte": value >= operand, "$lt": value < operand, "$lte": value <= operand}[operator]
+    except TypeError:
+        return False
+    except KeyError:
+        raise OperationFailure(f"Unsupported query operator {operator}")
+
+
+def _equals(value, operand) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_compare(value, operator, operand) for operator, operand in condition.items())
+    return _equals(value, condition)
+
+
+def matches(doc: Dict, query: Optional[Dict]) -> bool:
+    """Whether doc satisfies a MongoDB query document"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, part) for part in condition):
+                return False
+        elif not _match_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _evaluate(expression, doc: Dict):
+    """Aggregation expression subset used by update pipelines: field paths, literals and $add"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [_evaluate(item, doc) for item in expression]
+    if isinstance(expression, dict):
+        if "$add" in expression:
+            values = [_evaluate(item, doc) for item in expression["$add"]]
+            if any(value is None for value in values):
+                return None
+            dates = [value for value in values if isinstance(value, datetime)]
+            total = sum(value for value in values if not isinstance(value, datetime))
+            return dates[0] + timedelta(milliseconds=total) if dates else total
+        if "$literal" in expression:
+            return expression["$literal"]
+        return {key: _evaluate(value, doc) for key, value in expression.items()}
+    return expression
+
+
+def _apply_update(doc: Dict, update) -> Dict:
+    """New version of doc after an update document, update pipeline or replacement"""
+    doc = copy.deepcopy(doc)
+    if isinstance(update, list):
+        for stage in update:
+            for operator, fields in stage.items():
+                if operator in ("$set", "$addFields"):
+                    for path, expression in fields.items():
+                        _set(doc, path, _evaluate(expression, doc))
+                elif operator == "$unset":
+                    for path in [fields] if isinstance(fields, str) else fields:
+                        _unset(doc, path)
+                else:
+                    raise OperationFailure(f"Unsupported pipeline stage {operator}")
+        return doc
+    if not any(key.startswith("$") for key in update):
+        return {"_id": doc.get("_id"), **copy.deepcopy(update)} if "_id" in doc else copy.deepcopy(update)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                _set(doc, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                continue
+            elif operator == "$unset":
+                _unset(doc, path)
+            elif operator == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            else:
+                raise OperationFailure(f"Unsupported update operator {operator}")
+    return doc
+
+
+def _project(doc: Dict, projection) -> Dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        projected = {}
+        for path in fields:
+            value = _get(doc, path)
+            if value is not _MISSING:
+                _set(projected, path, value)
+    else:
+        projected = copy.deepcopy(doc)
+        for path in fields:
+            _unset(projected, path)
+    if include_id and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    else:
+        projected.pop("_id", None)
+    return projected
+
+
+def _sort_key(value):
+    # Missing/None sort first, then numbers, strings and everything else, like MongoDB's BSON order
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (4, value)
+    return (3, str(value))
+
+
+class MemoryCursor:
+    """Async cursor over a snapshot of matching documents"""
+
+    def __init__(self, docs: List[Dict], projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key_or_list, direction: int = 1):
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self) -> List[Dict]:
+        docs = self._docs
+        for key, direction in reversed(self._sort or []):
+            docs = sorted(docs, key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(copy.deepcopy(doc), self._projection) for doc in docs]
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        results = self._results()
+        return results if length is None else results[:length]
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict = {}  # _id -> document, in insertion order
+        self._indexes: Dict[str, Dict] = {}
+        self._ttl_fields: Dict[str, float] = {}  # field -> expireAfterSeconds
+
+    def _expire(self):
+        if not self._ttl_fields:
+            return
+        now = datetime.utcnow()
+        expired = [
+            doc_id for doc_id, doc in self._docs.items()
+            for field, seconds in self._ttl_fields.items()
+            if isinstance(doc.get(field), datetime) and doc[field] + timedelta(seconds=seconds) <= now
+        ]
+        for doc_id in expired:
+            self._docs.pop(doc_id, None)
+
+    def _matching(self, query) -> List[Dict]:
+        self._expire()
+        docs = [doc for doc in self._docs.values() if matches(doc, query)]
+        near = [(path, condition["$near"]) for path, condition in (query or {}).items()
+                if isinstance(condition, dict) and "$near" in condition]
+        if near:
+            path, spec = near[0]
+            docs.sort(key=lambda doc: _near_distance(_get(doc, path), spec))
+        return docs
+
+    def find(self, filter: Optional[Dict] = None, projection=None, *args, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self._matching(filter), projection)
+
+    async def find_one(self, filter: Optional[Dict] = None, projection=None, *args, **kwargs) -> Optional[Dict]:
+        docs = self._matching(filter)
+        return _project(copy.deepcopy(docs[0]), projection) if docs else None
+
+    async def count_documents(self, filter: Dict, **kwargs) -> int:
+        return len(self._matching(filter))
+
+    def _insert(self, doc: Dict):
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()  # Set on the caller's dict, as the driver does
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: {{ _id: {doc['_id']!r} }}")
+        self._docs[doc["_id"]] = copy.deepcopy(doc)
+        return doc["_id"]
+
+    async def insert_one(self, document: Dict, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs) -> InsertManyResult:
+        return InsertManyResult([self._insert(doc) for doc in documents], True)
+
+    def _update(self, filter: Dict, update, upsert: bool, many: bool) -> Dict:
+        """Raw write result: n (matched), nModified and upserted (_id) when a document was inserted"""
+        docs = self._matching(filter)
+        if not many:
+            docs = docs[:1]
+        if not docs:
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            seed = {key: value for key, value in filter.items()
+                    if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))}
+            base = {}
+            for path, value in seed.items():
+                _set(base, path, copy.deepcopy(value))
+            if isinstance(update, dict) and "$setOnInsert" in update:
+                for path, value in update["$setOnInsert"].items():
+                    _set(base, path, copy.deepcopy(value))
+            new_doc = _apply_update(base, update)
+            if "_id" not in new_doc and "_id" in base:
+                new_doc["_id"] = base["_id"]
+            return {"n": 1, "nModified": 0, "upserted": self._insert(new_doc)}
+        modified = 0
+        for doc in docs:
+            new_doc = _apply_update(doc, update)
+            if new_doc.get("_id", doc["_id"]) != doc["_id"]:
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            new_doc["_id"] = doc["_id"]
+            if new_doc != doc:
+                self._docs[doc["_id"]] = new_doc
+                modified += 1
+        return {"n": len(docs), "nModified": modified}
+
+    async def update_one(self, filter: Dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    async def update_many(self, filter: Dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    async def replace_one(self, filter: Dict, replacement: Dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, many=False), True)
+
+    async def find_one_and_update(self, filter: Dict, update, projection=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs) -> Optional[Dict]:
+        docs = self._matching(filter)
+        before = copy.deepcopy(docs[0]) if docs else None
+        result = self._update({"_id": before["_id"]} if before else filter, update, upsert, many=False)
+        doc_id = before["_id"] if before else result.get("upserted")
+        after = copy.deepcopy(self._docs.get(doc_id)) if doc_id is not None else None
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return _project(doc, projection) if doc is not None else None
+
+    def _delete(self, filter: Dict, many: bool) -> int:
+        docs = self._matching(filter)
+        if not many:
+            docs = docs[:1]
+        for doc in docs:
+            self._docs.pop(doc["_id"], None)
+        return len(docs)
+
+    async def delete_one(self, filter: Dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    async def delete_many(self, filter: Dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        """InsertOne / ReplaceOne / UpdateOne / UpdateMany / DeleteOne / DeleteMany operations"""
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for index, request in enumerate(requests):
+            kind = type(request).__name__
+            try:
+                if kind == "InsertOne":
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif kind in ("DeleteOne", "DeleteMany"):
+                    result["nRemoved"] += self._delete(request._filter, many=kind == "DeleteMany")
+                else:
+                    raw = self._update(request._filter, request._doc, bool(request._upsert), many=kind == "UpdateMany")
+                    if "upserted" in raw:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": raw["upserted"]})
+                    else:
+                        result["nMatched"] += raw["n"]
+                        result["nModified"] += raw["nModified"]
+            except (DuplicateKeyError, OperationFailure) as e:
+                result["writeErrors"].append({"index": index, "code": getattr(e, "code", None) or 11000, "errmsg": str(e), "op": request._doc if hasattr(request, "_doc") else None})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys, name: Optional[str] = None, expireAfterSeconds: Optional[float] = None, **kwargs) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self._indexes[name] = {"key": keys, **kwargs}
+        if expireAfterSeconds is not None:
+            self._indexes[name]["expireAfterSeconds"] = expireAfterSeconds
+            self._ttl_fields[keys[0][0]] = expireAfterSeconds
+        return name
+
+    async def create_indexes(self, indexes, **kwargs) -> List[str]:
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            keys = list(spec.pop("key").items())
+            names.append(await self.create_index(keys, **spec))
+        return names
+
+    async def index_information(self) -> Dict[str, Dict]:
+        return {"_id_": {"key": [("_id", 1)]}, **copy.deepcopy(self._indexes)}
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("Change streams are not supported by the in-memory database")
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient backed by process memory"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def close(self):
+        pass
@@ -9,3 +9,6 @@ class Obstacle(BaseModel):
     photoUrl: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     active: bool = True
+    obstacle_type: Optional[str] = Field(None, example="stairs")
+    severity: Optional[str] = Field(None, example="HIGH")  # NONE/LOW/MEDIUM/HIGH
+    ai_confidence: Optional[float] = Field(None, example=0.85)
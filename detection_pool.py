@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DetectionPoolFull(Exception):
+    """Raised when too many detection jobs are already running or waiting"""
+
+
+class DetectionPool:
+    """
+    Runs blocking image work (PIL decoding, Gemini calls) on a dedicated
+    thread pool so the event loop keeps serving /directions meanwhile.
+
+    At most max_workers jobs run at once and at most max_queue more wait
+    for a worker. Anything beyond that is rejected right away with
+    DetectionPoolFull instead of piling up, unless the caller uses
+    run_when_free() to wait for a slot.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detection")
+        self._pending = 0  # Running + queued jobs
+        self._waiters = deque()  # Futures of run_when_free() callers waiting for a slot, oldest first
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool sized by GEMINI_MAX_CONCURRENCY / GEMINI_MAX_QUEUE"""
+        return cls(
+            max_workers=int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "16")),
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self):
+        return {
+            "running_and_queued": self._pending,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+        }
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        if self._pending >= self.max_workers + self.max_queue:
+            raise DetectionPoolFull(f"{self._pending} detection jobs already in flight")
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        self._pending += 1
+        # Release the slot when the work itself finishes, even if the caller
+        # stopped waiting (e.g. the client disconnected)
+        future.add_done_callback(lambda _: self._release_from_worker(loop))
+        return await asyncio.wrap_future(future)
+
+    async def run_when_free(self, fn, *args, **kwargs):
+        """Like run(), but wait for a slot instead of raising DetectionPoolFull.
+
+        Waiters are woken one at a time as jobs finish, oldest first, so
+        nothing polls while the pool is full.
+        """
+        while self._pending >= self.max_workers + self.max_queue:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_next()  # Pass on the slot we were woken for
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return await self.run(fn, *args, **kwargs)
+
+    def _wake_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _release_from_worker(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # Event loop already closed during shutdown
+
+    def _release(self):
+        self._pending -= 1
+        self._wake_next()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
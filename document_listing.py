@@ -0,0 +1,184 @@
+import json
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.responses import Response, StreamingResponse
+
+LIST_FORMATS = ("json", "ndjson", "geojson")
+MAX_PAGE_SIZE = 10000
+STREAM_PREFETCH = 100  # Documents read before a streamed listing starts (about one cursor batch)
+MEDIA_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson", "geojson": "application/geo+json"}
+
+BBox = Tuple[float, float, float, float]  # min_lng, min_lat, max_lng, max_lat
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[BBox]:
+    """'min_lng,min_lat,max_lng,max_lat' (GeoJSON order) -> tuple; raises ValueError"""
+    if bbox is None:
+        return None
+    values = tuple(float(v) for v in bbox.split(","))
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    return values
+
+
+def in_bbox(bbox: BBox, lat: float, lng: float) -> bool:
+    return bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]
+
+
+def bbox_query(bbox: Optional[BBox], field: str) -> Dict:
+    """Mongo filter keeping documents whose {field}.lat / {field}.lng fall inside bbox"""
+    if bbox is None:
+        return {}
+    return {
+        f"{field}.lng": {"$gte": bbox[0], "$lte": bbox[2]},
+        f"{field}.lat": {"$gte": bbox[1], "$lte": bbox[3]},
+    }
+
+
+def point_feature(doc: Dict, field: str) -> Optional[Dict]:
+    """GeoJSON Point feature for a document with {field}: {lat, lng}"""
+    coords = doc.get(field)
+    if not coords:
+        return None
+    properties = {k: v for k, v in doc.items() if k != field}
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [coords["lng"], coords["lat"]]}, "properties": properties}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode(item) -> str:
+    return json.dumps(item, default=_json_default)
+
+
+async def list_documents(
+    collection,
+    query: Dict,
+    shape: Callable[[Dict], Dict],
+    fmt: str = "json",
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    feature: Optional[Callable[[Dict], Optional[Dict]]] = None,
+    keep: Optional[Callable[[Dict], bool]] = None,
+) -> Response:
+    """
+    List a collection as JSON, NDJSON or a GeoJSON FeatureCollection.
+
+    Documents are read in _id order. With limit set, one page is returned
+    and, if more may follow, its last _id is sent in the X-Next-Cursor
+    header; pass it back as after= for the next page. A page can hold
+    fewer than limit items when documents don't render (e.g. GeoJSON
+    without coordinates), so follow the header rather than the page size
+    to know when the listing ends. Without a limit the
+    whole result is streamed as documents arrive from the cursor. The
+    first STREAM_PREFETCH documents are read before the response starts,
+    so a failing query still raises here (and becomes a proper error
+    status); if the cursor fails after that, NDJSON ends with an
+    {"error": ...} line and JSON / GeoJSON bodies are left unterminated,
+    so clients can tell the listing is incomplete.
+
+    fields (comma separated) projects the documents; otherwise each one
+    goes through shape(). keep() filters documents that the query alone
+    can't (they still advance the cursor).
+    """
+    query = dict(query)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    projection = None
+    if fields:
+        projection = {field.strip(): 1 for field in fields.split(",") if field.strip()}
+
+    def render(doc: Dict) -> Optional[Dict]:
+        if "_id" not in (projection or {}):
+            doc.pop("_id", None)
+        item = doc if projection else shape(doc)
+        if fmt == "geojson":
+            item = feature(item) if feature else None
+        return item
+
+    cursor = collection.find(query, projection).sort("_id", 1)
+    read_limit = limit if keep is None else None  # keep() may drop any number of documents
+    if limit is not None and read_limit is not None:
+        cursor = cursor.limit(read_limit)
+
+    headers = {}
+    if limit is not None:
+        # Bounded page: collect it so the cursor for the next page can go in a header
+        page, last_id, read = [], None, 0
+        async for doc in cursor:
+            read += 1
+            last_id = doc["_id"]
+            if keep is not None and not keep(doc):
+                continue
+            item = render(doc)
+            if item is not None:
+                page.append(item)
+            if len(page) >= limit:
+                break
+        # A full read means more may follow, even if render() dropped some of it
+        if last_id is not None and (len(page) >= limit or read == read_limit):
+            headers["X-Next-Cursor"] = str(last_id)
+        items = _aiter(page)
+    else:
+        items = await _prefetched(_rendered(cursor, render, keep), STREAM_PREFETCH)
+
+    return StreamingResponse(_serialize(items, fmt), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def _prefetched(items, count: int):
+    """Read the first count items now (so their errors raise here) and chain the rest after them"""
+    head = []
+    try:
+        while len(head) < count:
+            head.append(await items.__anext__())
+    except StopAsyncIteration:
+        return _aiter(head)
+
+    async def chained():
+        for item in head:
+            yield item
+        async for item in items:
+            yield item
+    return chained()
+
+
+async def _rendered(cursor, render, keep):
+    async for doc in cursor:
+        if keep is not None and not keep(doc):
+            continue
+        item = render(doc)
+        if item is not None:
+            yield item
+
+
+async def _serialize(items, fmt: str):
+    if fmt == "ndjson":
+        try:
+            async for item in items:
+                yield _encode(item) + "\n"
+        except Exception as e:
+            print(f"❌ Listing failed mid-stream: {e}")
+            yield _encode({"error": f"Listing interrupted: {e}"}) + "\n"
+        return
+    opening, closing = ('{"type": "FeatureCollection", "features": [', "]}") if fmt == "geojson" else ("[", "]")
+    yield opening
+    first = True
+    try:
+        async for item in items:
+            yield ("" if first else ",") + _encode(item)
+            first = False
+    except Exception as e:
+        # Leave the body unterminated so it can't be mistaken for a complete listing
+        print(f"❌ Listing failed mid-stream: {e}")
+        return
+    yield closing
@@ -1,22 +1,34 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 
 from typing import List, Optional
 from datetime import datetime
 import uuid
 import json
 import os
+import asyncio
 import io  # ← ADD THIS IMPORT
 from PIL import Image as PILImage  # ← ADD THIS IMPORT
-from navigation.navigation_service import navigation_service
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from navigation.navigation_service import navigation_service, ROUTING_ALGORITHMS
+from navigation.graph_geojson import etag_matches
+from navigation.route_cache import RouteCache
+from navigation.single_flight import SingleFlight
 
 from backend.models.obstacle import Obstacle, Coordinates
 from backend.models.graph_node import GraphNode
 from backend.models.graph_edge import GraphEdge
-from backend.models.database import obstacles_collection, nodes_collection, edges_collection
+from backend.models.directions import BatchDirectionsRequest
+from backend.models.database import obstacles_collection, nodes_collection, edges_collection, obstacle_images_collection
+from backend.models.database import ensure_indexes, close_client, obstacle_geo_fields, geo_within_bbox, near_point, obstacle_locations_migrated
 from gemini_obstacle_detector import GeminiObstacleDetector
+from detection_pool import DetectionPool, DetectionPoolFull
+from obstacle_jobs import ObstacleJobQueue, JobQueueFull, FINAL_STATES
+from verdict_cache import VerdictCache, ImageFingerprint
+from document_listing import LIST_FORMATS, MAX_PAGE_SIZE, parse_bbox, bbox_query, in_bbox, point_feature, list_documents
 
 app = FastAPI(title="Hackathon Navigation API")
 
@@ -26,6 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files for frontend
@@ -41,15 +54,326 @@ except Exception as e:
     gemini_detector = None
     gemini_available = False
 
+# Image decoding and Gemini calls are blocking, so they run on their own
+# bounded thread pool instead of the event loop
+detection_pool = DetectionPool.from_env()
+
+# Verdicts for images we have already analysed, so repeat uploads skip Gemini
+verdict_cache = VerdictCache.from_env()
+
+# /report-obstacle/batch limits
+BATCH_MAX_IMAGES = int(os.getenv("OBSTACLE_BATCH_MAX_IMAGES", "100"))
+BATCH_CONCURRENCY = int(os.getenv("GEMINI_BATCH_CONCURRENCY", os.getenv("GEMINI_MAX_CONCURRENCY", "4")))  # Pool slots one batch may hold at once
+
+# Serialized /directions bodies, keyed by route and routing epoch
+route_cache = RouteCache.from_env()
+# Concurrent cache misses for the same key share one find_path call
+directions_flight = SingleFlight()
+# Most origins accepted by one POST /directions/batch
+DIRECTIONS_BATCH_MAX = int(os.getenv("DIRECTIONS_BATCH_MAX", "1000"))
+
+# Documents per bulk_write call in /nodes/bulk and /edges/bulk
+GRAPH_BULK_CHUNK_SIZE = int(os.getenv("GRAPH_BULK_CHUNK_SIZE", "1000"))
+
+
+def _busy_response():
+    """Fast rejection while the detection pool is saturated"""
+    return JSONResponse(
+        content={"error": "Obstacle detection is busy, retry shortly", "is_obstacle": False},
+        status_code=429,
+        headers={"Retry-After": "1"}
+    )
+
+
+def _probe_image(image_bytes: bytes):
+    """Decode the image header; raises if the bytes are not an image"""
+    test_image = PILImage.open(io.BytesIO(image_bytes))
+    return test_image.size, test_image.format
+
+
+async def _read_obstacle_upload(image: UploadFile, gps_coordinates: str):
+    """Validate an obstacle upload and return (image_bytes, lat, lng)"""
+    # Check if Gemini is available
+    if not gemini_available or not gemini_detector:
+        print("❌ Gemini service not available")
+        raise HTTPException(
+            status_code=503, 
+            detail="Gemini AI service is not available. Please check API key configuration."
+        )
+    
+    # Validate image file
+    if not image.content_type or not image.content_type.startswith('image/'):
+        print(f"❌ Invalid content type: {image.content_type}")
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    # Parse GPS coordinates
+    try:
+        coords_data = json.loads(gps_coordinates)
+        lat = float(coords_data['lat'])
+        lng = float(coords_data['lng'])
+        print(f"📍 GPS coordinates: {lat}, {lng}")
+    except (json.JSONDecodeError, KeyError, ValueError) as e:
+        print(f"❌ GPS parsing error: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid GPS coordinates format: {e}")
+    
+    # Read image data
+    print("📸 Reading image data...")
+    image_bytes = await image.read()
+    if len(image_bytes) == 0:
+        print("❌ Empty image file")
+        raise HTTPException(status_code=400, detail="Empty image file")
+    
+    print(f"📊 Image size: {len(image_bytes)} bytes")
+    return image_bytes, lat, lng
+
+
+def _check_analysis(analysis_result: dict) -> dict:
+    """Replace JSON-parsing failures with a 'not an obstacle' verdict; raise on other errors"""
+    if analysis_result.get('error'):
+        error_msg = analysis_result['error']
+        print(f"❌ Gemini analysis error: {error_msg}")
+        
+        # For JSON parsing errors, try to provide a fallback response
+        if "Expecting value" in error_msg or "JSON" in error_msg:
+            print("🔄 Using fallback analysis due to JSON error")
+            return {
+                "is_obstacle": False,
+                "obstacle_type": "analysis_failed",
+                "confidence": 0.0,
+                "severity": "NONE",
+                "error": f"AI analysis failed: {error_msg}"
+            }
+        raise RuntimeError(f"Image analysis failed: {error_msg}")
+    return analysis_result
+
+
+def _analysis_fields(analysis_result: dict) -> dict:
+    """Obstacle document fields recorded from a Gemini verdict"""
+    return {
+        "ai_verified": analysis_result.get('is_obstacle', False),
+        "obstacle_type": analysis_result.get('obstacle_type', 'unknown'),
+        "severity": analysis_result.get('severity', 'NONE'),
+        "ai_confidence": analysis_result.get('confidence', 0.0),
+        "ai_error": analysis_result.get('error'),
+    }
+
+
+def _analysis_summary(analysis_result: dict) -> dict:
+    """Verdict as returned to clients"""
+    return {
+        "is_obstacle": analysis_result.get('is_obstacle', False),
+        "obstacle_type": analysis_result.get('obstacle_type', 'unknown'),
+        "severity": analysis_result.get('severity', 'NONE'),
+        "confidence": analysis_result.get('confidence', 0.0),
+        "raw_response": analysis_result.get('raw_response', ''),
+        "error": analysis_result.get('error'),
+        "cached": analysis_result.get('cached', False)
+    }
+
+
+async def _run_detection_when_free(fn, *args):
+    """Like detection_pool.run, but background jobs wait for a free slot instead of failing"""
+    return await detection_pool.run_when_free(fn, *args)
+
+
+def _fingerprint(image_bytes: bytes):
+    """Verdict cache key for an upload, or None if it can't be decoded"""
+    try:
+        return ImageFingerprint.from_bytes(image_bytes)
+    except Exception:
+        return None  # Let the detector report the error as before
+
+
+def _ndjson_line(item: dict) -> bytes:
+    return (json.dumps(item, default=str) + "\n").encode()
+
+
+def _obstacle_document(description: str, lat: float, lng: float, analysis_result: dict) -> dict:
+    """Obstacle report stored for an analysed upload"""
+    return {
+        "description": description,
+        "coords": {
+            "lat": lat,
+            "lng": lng
+        },
+        "photoUrl": None,  # Could implement photo storage later
+        "timestamp": datetime.utcnow(),
+        "active": True,
+        **_analysis_fields(analysis_result),
+        "ai_status": "done",
+        "_id": str(uuid.uuid4()),
+        **obstacle_geo_fields(lat, lng)
+    }
+
+
+async def _verify_obstacle(image_bytes: bytes, coords: tuple, run=None) -> dict:
+    """Gemini verdict for an image, served from verdict_cache when it was seen before"""
+    run = run or detection_pool.run
+    # Hashing runs on the default executor so cache hits don't queue behind Gemini calls
+    fingerprint = await asyncio.to_thread(_fingerprint, image_bytes)
+    if fingerprint is not None:
+        cached = await asyncio.to_thread(verdict_cache.get, fingerprint, coords)
+        if cached is not None:
+            print(f"♻️ Verdict cache hit: {cached.get('obstacle_type')} ({cached.get('severity')})")
+            return {**cached, "cached": True}
+    analysis_result = await run(gemini_detector.verify_obstacle, image_bytes, coords)
+    if fingerprint is not None and not analysis_result.get('error'):
+        await asyncio.to_thread(verdict_cache.put, fingerprint, coords, analysis_result)
+    return analysis_result
+
+
+async def _process_obstacle_job(job) -> dict:
+    """Analyse a queued obstacle report and record the verdict"""
+    obstacle_data = job.payload["obstacle"]
+    image_bytes = job.payload["image_bytes"]
+    coords = obstacle_data["coords"]
+    try:
+        await _run_detection_when_free(_probe_image, image_bytes)
+        analysis_result = await _verify_obstacle(
+            image_bytes, (coords["lat"], coords["lng"]), run=_run_detection_when_free
+        )
+        analysis_result = _check_analysis(analysis_result)
+    except Exception as e:
+        await _finish_obstacle_report(obstacle_data["_id"], {"ai_status": "failed", "ai_error": str(e)})
+        raise
+    
+    fields = _analysis_fields(analysis_result)
+    fields["ai_status"] = "done"
+    await _finish_obstacle_report(obstacle_data["_id"], fields)
+    # Routing picks up the verdict right away, without waiting for the change stream
+    navigation_service.on_obstacle_reported({**obstacle_data, **fields})
+    print(f"✅ Obstacle job {job.id} analysed: {fields['obstacle_type']} ({fields['severity']})")
+    return _analysis_summary(analysis_result)
+
+
+async def _finish_obstacle_report(obstacle_id: str, fields: dict):
+    """Record a queued report's outcome and drop its stored image (kept until then so a restart can resume it)"""
+    await obstacles_collection.update_one({"_id": obstacle_id}, {"$set": fields})
+    await obstacle_images_collection.delete_one({"_id": obstacle_id})
+
+
+async def _resume_obstacle_jobs():
+    """Re-queue reports still pending from before a restart; ones that can't be re-queued are marked failed"""
+    resumed = 0
+    async for obstacle in obstacles_collection.find({"ai_status": "pending"}):
+        stored = await obstacle_images_collection.find_one({"_id": obstacle["_id"]})
+        if stored is None:
+            error = "Image lost before analysis"
+        else:
+            try:
+                obstacle_jobs.submit(obstacle["_id"], {"obstacle": obstacle, "image_bytes": bytes(stored["image"])})
+                resumed += 1
+                continue
+            except JobQueueFull:
+                error = "Analysis queue full"
+        await _finish_obstacle_report(obstacle["_id"], {"ai_status": "failed", "ai_error": error})
+        print(f"❌ Pending obstacle report {obstacle['_id']} not resumed: {error}")
+    if resumed:
+        print(f"🔁 Resumed {resumed} pending obstacle analyses")
+
+
+async def _read_bulk_items(request: Request) -> list:
+    """Items of a JSON array or NDJSON body; unparseable NDJSON lines become ValueError entries"""
+    body = await request.body()
+    if "ndjson" not in request.headers.get("content-type", "") and body.lstrip().startswith(b"["):
+        try:
+            items = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+        return items
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            items.append(ValueError(f"Invalid JSON: {e}"))
+    return items
+
+
+async def _bulk_upsert(request: Request, model, id_field: str, collection):
+    """Validate and upsert bulk graph documents; returns (report, written documents)"""
+    items = await _read_bulk_items(request)
+    errors = []
+    docs, item_indices = [], []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            errors.append({"index": index, "error": str(item)})
+            continue
+        try:
+            doc = model(**item).dict(by_alias=True)
+        except Exception as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        doc["_id"] = doc[id_field]  # Same ids as the single-document endpoints
+        doc["updatedAt"] = datetime.utcnow()  # Lets /refresh-navigation pick up only what changed
+        docs.append(doc)
+        item_indices.append(index)
+    
+    upserted = modified = 0
+    written = []
+    for start in range(0, len(docs), GRAPH_BULK_CHUNK_SIZE):
+        chunk = docs[start:start + GRAPH_BULK_CHUNK_SIZE]
+        failed = set()
+        try:
+            result = await collection.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in chunk], ordered=False
+            )
+            upserted += result.upserted_count
+            modified += result.modified_count
+        except BulkWriteError as e:
+            upserted += e.details.get("nUpserted", 0)
+            modified += e.details.get("nModified", 0)
+            for write_error in e.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                errors.append({"index": item_indices[start + write_error["index"]], "error": write_error.get("errmsg")})
+        written.extend(doc for i, doc in enumerate(chunk) if i not in failed)
+    
+    print(f"💾 Bulk upsert into {collection.name}: {len(written)}/{len(items)} written, {len(errors)} errors")
+    report = {
+        "received": len(items),
+        "written": len(written),
+        "upserted": upserted,
+        "modified": modified,
+        "errors": sorted(errors, key=lambda error: error["index"]),
+        "graph_reloaded": False,
+    }
+    return report, written
+
+
+# Queued /report-obstacle/async analyses
+obstacle_jobs = ObstacleJobQueue.from_env(_process_obstacle_job)
+
 # Initialize navigation service on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
+    try:
+        await ensure_indexes()
+        print("✅ Database indexes ready")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not create database indexes: {e}")
     try:
         await navigation_service.initialize()
         print("✅ Navigation service initialized successfully")
     except Exception as e:
         print(f"⚠️ Warning: Navigation service initialization failed: {e}")
+    navigation_service.start_obstacle_sync()
+    obstacle_jobs.start()
+    try:
+        await _resume_obstacle_jobs()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not resume pending obstacle analyses: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks"""
+    await navigation_service.stop_obstacle_sync()
+    await obstacle_jobs.stop()
+    detection_pool.shutdown()
+    close_client()
 
 
 @app.get("/buildings")
@@ -74,15 +398,69 @@ async def root():
         "gemini_available": gemini_available
     }
 
+def _list_params(format: str, bbox: Optional[str]):
+    """Validate the shared list query parameters; returns the parsed bbox"""
+    if format not in LIST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(LIST_FORMATS)}")
+    try:
+        return parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _graph_geojson_response(request: Request, kind: str) -> Optional[Response]:
+    """The in-memory graph's nodes/edges as cached GeoJSON (304 if the client's copy is current), or None without a graph"""
+    cached = await navigation_service.graph_geojson(kind)
+    if cached is None:
+        return None
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # Cache, but revalidate on every use
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/geo+json", headers=headers)
+
 # Obstacle Endpoints 
 @app.get("/obstacles", response_model=List[Obstacle])
-async def get_obstacles():
-    """Get all active obstacles"""
+async def get_obstacles(
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    format: str = "json",
+    bbox: Optional[str] = None,
+):
+    """
+    Get active obstacles, streamed in _id order.
+    Page with ?limit= and ?after=<X-Next-Cursor>, project with ?fields=a,b,
+    pick ?format=json|ndjson|geojson and clip to ?bbox=min_lng,min_lat,max_lng,max_lat.
+    """
+    box = _list_params(format, bbox)
+    if box is None:
+        region = {}
+    elif obstacle_locations_migrated():
+        region = geo_within_bbox(*box)
+    else:
+        region = bbox_query(box, "coords")  # Older obstacles may not have location yet
     try:
-        cursor = obstacles_collection.find({"active": True})
+        return await list_documents(
+            obstacles_collection, {"active": True, **region},
+            shape=lambda doc: Obstacle(**doc).dict(), fmt=format, after=after, limit=limit, fields=fields,
+            feature=lambda doc: point_feature(doc, "coords"),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+@app.get("/obstacles/near", response_model=List[Obstacle])
+async def get_obstacles_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(100, gt=0, le=50000, description="Meters"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Active obstacles within radius meters of a point, nearest first"""
+    try:
+        cursor = obstacles_collection.find({"active": True, **near_point(lat, lng, radius)}).limit(limit)
         obstacles = []
         async for obstacle in cursor:
-            # Convert MongoDB _id to string and remove it
             obstacle.pop("_id", None)
             obstacles.append(Obstacle(**obstacle))
         return obstacles
@@ -104,12 +482,14 @@ async def detect(file: UploadFile = File(...)):
         image_bytes = await file.read()
         coords = (0, 0)  # replace with actual coords if needed
 
-        # Call Gemini
-        result = gemini_detector.verify_obstacle(image_bytes, coords)
+        # Call Gemini off the event loop (or reuse the verdict for a known image)
+        result = await _verify_obstacle(image_bytes, coords)
 
         # Ensure JSON response
         return JSONResponse(content=result)
 
+    except DetectionPoolFull:
+        return _busy_response()
     except Exception as e:
         # Log error clearly in server logs
         print(f"🔥 ERROR in /detect: {e}")
@@ -125,9 +505,11 @@ async def add_obstacle(obstacle: Obstacle):
         # Convert Pydantic model to dict
         obstacle_dict = obstacle.dict()
         obstacle_dict["_id"] = str(uuid.uuid4())  # Add unique ID
+        obstacle_dict.update(obstacle_geo_fields(obstacle.coords.lat, obstacle.coords.lng, obstacle.timestamp))
         
         # Store in MongoDB
         result = await obstacles_collection.insert_one(obstacle_dict)
+        navigation_service.on_obstacle_reported(obstacle_dict)
         
         return {
             "message": "Obstacle added successfully",
@@ -147,110 +529,47 @@ async def report_obstacle(
     Report a potential obstacle with image analysis using Gemini AI
     """
     try:
-        # Check if Gemini is available
-        if not gemini_available or not gemini_detector:
-            print("❌ Gemini service not available")
-            raise HTTPException(
-                status_code=503, 
-                detail="Gemini AI service is not available. Please check API key configuration."
-            )
-        
-        # Validate image file
-        if not image.content_type or not image.content_type.startswith('image/'):
-            print(f"❌ Invalid content type: {image.content_type}")
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Parse GPS coordinates
-        try:
-            coords_data = json.loads(gps_coordinates)
-            lat = float(coords_data['lat'])
-            lng = float(coords_data['lng'])
-            print(f"📍 GPS coordinates: {lat}, {lng}")
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            print(f"❌ GPS parsing error: {e}")
-            raise HTTPException(status_code=400, detail=f"Invalid GPS coordinates format: {e}")
-        
-        # Read image data
-        print("📸 Reading image data...")
-        image_bytes = await image.read()
-        if len(image_bytes) == 0:
-            print("❌ Empty image file")
-            raise HTTPException(status_code=400, detail="Empty image file")
-        
-        print(f"📊 Image size: {len(image_bytes)} bytes")
+        image_bytes, lat, lng = await _read_obstacle_upload(image, gps_coordinates)
         
         # Test if we can create a PIL image from the bytes
         try:
-            test_image = PILImage.open(io.BytesIO(image_bytes))
-            print(f"✅ Valid image: {test_image.size}, format: {test_image.format}")
+            image_size, image_format = await detection_pool.run(_probe_image, image_bytes)
+            print(f"✅ Valid image: {image_size}, format: {image_format}")
+        except DetectionPoolFull:
+            raise
         except Exception as img_error:
             print(f"❌ Invalid image data: {img_error}")
             raise HTTPException(status_code=400, detail=f"Invalid image data: {img_error}")
         
         # Analyze image with Gemini
         print(f"🔍 Analyzing image for obstacle detection...")
-        analysis_result = gemini_detector.verify_obstacle(image_bytes, (lat, lng))
+        analysis_result = await _verify_obstacle(image_bytes, (lat, lng))
         
         print(f"📊 Raw analysis result: {analysis_result}")
         
         # Check for analysis errors
-        if analysis_result.get('error'):
-            error_msg = analysis_result['error']
-            print(f"❌ Gemini analysis error: {error_msg}")
-            
-            # For JSON parsing errors, try to provide a fallback response
-            if "Expecting value" in error_msg or "JSON" in error_msg:
-                print("🔄 Using fallback analysis due to JSON error")
-                analysis_result = {
-                    "is_obstacle": False,
-                    "obstacle_type": "analysis_failed",
-                    "confidence": 0.0,
-                    "severity": "NONE",
-                    "error": f"AI analysis failed: {error_msg}"
-                }
-            else:
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Image analysis failed: {error_msg}"
-                )
+        try:
+            analysis_result = _check_analysis(analysis_result)
+        except RuntimeError as analysis_error:
+            raise HTTPException(status_code=500, detail=str(analysis_error))
         
         print(f"✅ Analysis completed successfully")
         
         # Create obstacle object with AI analysis data
-        obstacle_data = {
-            "description": description,
-            "coords": {
-                "lat": lat,
-                "lng": lng
-            },
-            "photoUrl": None,  # Could implement photo storage later
-            "timestamp": datetime.utcnow(),
-            "active": True,
-            "ai_verified": analysis_result.get('is_obstacle', False),
-            "obstacle_type": analysis_result.get('obstacle_type', 'unknown'),
-            "ai_confidence": analysis_result.get('confidence', 0.0),
-            "ai_error": analysis_result.get('error'),
-            "_id": str(uuid.uuid4())
-        }
+        obstacle_data = _obstacle_document(description, lat, lng, analysis_result)
         
         # Always save to database (whether obstacle detected or not, for data collection)
         try:
             await obstacles_collection.insert_one(obstacle_data)
             print(f"💾 Obstacle report saved to database with ID: {obstacle_data['_id']}")
+            navigation_service.on_obstacle_reported(obstacle_data)
         except Exception as db_error:
             print(f"⚠️ Database save failed: {db_error}")
             # Continue anyway, just log the error
         
         return {
             "message": "Image analysis completed successfully",
-            "analysis": {
-                "is_obstacle": analysis_result.get('is_obstacle', False),
-                "obstacle_type": analysis_result.get('obstacle_type', 'unknown'),
-                "severity": analysis_result.get('severity', 'NONE'),
-                "confidence": analysis_result.get('confidence', 0.0),
-                "raw_response": analysis_result.get('raw_response', ''),
-                "error": analysis_result.get('error')
-            },
+            "analysis": _analysis_summary(analysis_result),
             "coordinates": {"lat": lat, "lng": lng},
             "user_description": description,
             "obstacle_saved": True,
@@ -259,12 +578,227 @@ async def report_obstacle(
         
     except HTTPException:
         raise
+    except DetectionPoolFull:
+        print("⏳ Detection pool full, rejecting report")
+        return _busy_response()
     except Exception as e:
         print(f"❌ Unexpected error in report_obstacle: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/report-obstacle/batch")
+async def report_obstacle_batch(
+    images: List[UploadFile] = File(..., description="Images of potential obstacles"),
+    gps_coordinates: str = Form(..., description="JSON array with one {lat, lng} per image, or a single {lat, lng} for all"),
+    description: str = Form("", description="User description applied to every image")
+):
+    """
+    Analyse many obstacle photos in one request.
+    Streams one NDJSON line per image as soon as its verdict is ready, so
+    lines arrive in completion order; use "index" to match them to uploads.
+    Uncached images are analysed min(GEMINI_BATCH_CONCURRENCY,
+    GEMINI_MAX_CONCURRENCY) at a time (4 by default) and share those pool
+    workers with /detect, so n images take about ceil(n / 4) Gemini round
+    trips, and no less than GEMINI_REQUESTS_PER_MINUTE allows. Raise both
+    settings to overlap larger batches.
+    """
+    if not gemini_available or not gemini_detector:
+        raise HTTPException(
+            status_code=503,
+            detail="Gemini AI service is not available. Please check API key configuration."
+        )
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IMAGES} images per batch")
+    
+    try:
+        coords_data = json.loads(gps_coordinates)
+        if isinstance(coords_data, dict):
+            coords_data = [coords_data] * len(images)
+        coords = [(float(c['lat']), float(c['lng'])) for c in coords_data]
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid GPS coordinates format: {e}")
+    if len(coords) != len(images):
+        raise HTTPException(status_code=400, detail=f"Got {len(coords)} coordinates for {len(images)} images")
+    
+    uploads = []
+    for image in images:
+        if not image.content_type or not image.content_type.startswith('image/'):
+            uploads.append((image.filename, None, "File must be an image"))
+            continue
+        image_bytes = await image.read()
+        uploads.append((image.filename, image_bytes, None if image_bytes else "Empty image file"))
+    print(f"📸 Batch of {len(uploads)} images received")
+    
+    async def finish(index: int, analysis_result: dict) -> bytes:
+        filename = uploads[index][0]
+        lat, lng = coords[index]
+        try:
+            analysis_result = _check_analysis(analysis_result)
+        except RuntimeError as analysis_error:
+            return _ndjson_line({"index": index, "filename": filename, "error": str(analysis_error)})
+        
+        obstacle_data = _obstacle_document(description, lat, lng, analysis_result)
+        try:
+            await obstacles_collection.insert_one(obstacle_data)
+            navigation_service.on_obstacle_reported(obstacle_data)
+        except Exception as db_error:
+            print(f"⚠️ Database save failed: {db_error}")
+        return _ndjson_line({
+            "index": index,
+            "filename": filename,
+            "analysis": _analysis_summary(analysis_result),
+            "coordinates": {"lat": lat, "lng": lng},
+            "database_id": obstacle_data["_id"]
+        })
+    
+    fingerprints = await asyncio.gather(*(
+        asyncio.to_thread(_fingerprint, image_bytes) if image_bytes else asyncio.sleep(0)
+        for _, image_bytes, _ in uploads
+    ))
+    cached = {}
+    pending = []
+    for index, (filename, image_bytes, error) in enumerate(uploads):
+        if error:
+            continue
+        if fingerprints[index] is not None:
+            verdict = await asyncio.to_thread(verdict_cache.get, fingerprints[index], coords[index])
+            if verdict is not None:
+                cached[index] = {**verdict, "cached": True}
+                continue
+        pending.append(index)
+    
+    # Batch images share detection_pool with /detect; refuse the batch outright when it has no room
+    if pending and detection_pool.pending >= detection_pool.max_workers + detection_pool.max_queue:
+        print("⏳ Detection pool full, rejecting batch")
+        return _busy_response()
+    if pending:
+        print(f"🔍 Analyzing {len(pending)} images ({len(uploads) - len(pending)} answered from cache or rejected)...")
+    
+    async def results():
+        for index, (filename, image_bytes, error) in enumerate(uploads):
+            if error:
+                yield _ndjson_line({"index": index, "filename": filename, "error": error})
+            elif index in cached:
+                yield await finish(index, cached[index])
+        
+        # At most BATCH_CONCURRENCY of this batch's images hold pool slots at once
+        verdicts = gemini_detector.verify_obstacles(
+            [(uploads[index][1], coords[index]) for index in pending],
+            run=_run_detection_when_free, max_concurrency=BATCH_CONCURRENCY
+        )
+        try:
+            async for position, analysis_result in verdicts:
+                index = pending[position]
+                if fingerprints[index] is not None and not analysis_result.get('error'):
+                    await asyncio.to_thread(verdict_cache.put, fingerprints[index], coords[index], analysis_result)
+                yield await finish(index, analysis_result)
+        finally:
+            # Don't start calls nobody will read if the client goes away
+            await verdicts.aclose()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.post("/report-obstacle/async", status_code=202)
+async def report_obstacle_async(
+    image: UploadFile = File(..., description="Image of the potential obstacle"),
+    gps_coordinates: str = Form(..., description="GPS coordinates as JSON string"),
+    description: str = Form(..., description="User description of the obstacle")
+):
+    """
+    Save an obstacle report right away and analyse it in the background.
+    Poll /report-obstacle/jobs/{job_id} or stream .../events for the verdict.
+    The image is stored with the report until the analysis finishes, so
+    reports still pending when the server stops are resumed on startup.
+    """
+    image_bytes, lat, lng = await _read_obstacle_upload(image, gps_coordinates)
+    
+    obstacle_data = {
+        "description": description,
+        "coords": {
+            "lat": lat,
+            "lng": lng
+        },
+        "photoUrl": None,
+        "timestamp": datetime.utcnow(),
+        "active": True,
+        "ai_verified": None,  # Not routed around until the verdict arrives
+        "ai_status": "pending",
+        "_id": str(uuid.uuid4()),
+        **obstacle_geo_fields(lat, lng)
+    }
+    
+    if obstacle_jobs.is_full():
+        print("⏳ Obstacle job queue full, rejecting report")
+        return _busy_response()
+    
+    try:
+        # Image first: a pending report is never stored without one to resume from
+        await obstacle_images_collection.insert_one(
+            {"_id": obstacle_data["_id"], "image": image_bytes, "createdAt": obstacle_data["timestamp"]}
+        )
+        await obstacles_collection.insert_one(obstacle_data)
+        print(f"💾 Pending obstacle report saved with ID: {obstacle_data['_id']}")
+    except Exception as db_error:
+        print(f"❌ Database save failed: {db_error}")
+        raise HTTPException(status_code=500, detail=f"Could not save obstacle report: {db_error}")
+    
+    try:
+        job = obstacle_jobs.submit(obstacle_data["_id"], {"obstacle": obstacle_data, "image_bytes": image_bytes})
+    except JobQueueFull:
+        # Filled up while we were saving; keep the record but mark it unanalysed
+        await _finish_obstacle_report(obstacle_data["_id"], {"ai_status": "failed", "ai_error": "Analysis queue full"})
+        return _busy_response()
+    
+    return {
+        "message": "Obstacle report accepted for analysis",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/report-obstacle/jobs/{job.id}",
+        "events_url": f"/report-obstacle/jobs/{job.id}/events",
+        "database_id": obstacle_data["_id"]
+    }
+
+@app.get("/report-obstacle/jobs/{job_id}")
+async def get_obstacle_job(job_id: str):
+    """Current status of a queued obstacle analysis"""
+    job = obstacle_jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    
+    # Not tracked in memory any more (old job or restarted server): fall back to the stored report
+    obstacle = await obstacles_collection.find_one({"_id": job_id})
+    if obstacle is None or "ai_status" not in obstacle:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return {
+        "job_id": job_id,
+        "status": obstacle["ai_status"],
+        "result": {
+            "is_obstacle": obstacle.get("ai_verified"),
+            "obstacle_type": obstacle.get("obstacle_type"),
+            "severity": obstacle.get("severity"),
+            "confidence": obstacle.get("ai_confidence"),
+            "error": obstacle.get("ai_error")
+        } if obstacle["ai_status"] in FINAL_STATES else None,
+        "error": obstacle.get("ai_error")
+    }
+
+@app.get("/report-obstacle/jobs/{job_id}/events")
+async def stream_obstacle_job(job_id: str):
+    """Server-sent events with the job's status until the analysis finishes"""
+    job = obstacle_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job '{job_id}'")
+    
+    async def events():
+        async for state in job.updates():
+            if state is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 # Add a simple test endpoint
 @app.post("/test-gemini")
 async def test_gemini_simple():
@@ -296,32 +830,53 @@ async def get_gemini_status():
     """
     return {
         "gemini_available": gemini_available,
+        "detection_pool": detection_pool.stats(),
+        "obstacle_jobs": obstacle_jobs.stats(),
+        "verdict_cache": verdict_cache.stats(),
         "service_status": "online" if gemini_available else "offline",
         "message": "Gemini obstacle detection is ready" if gemini_available else "Gemini service unavailable - check API key configuration"
     }
 
 # Graph Node Endpoints
 @app.get("/nodes", response_model=List[GraphNode])
-async def get_nodes():
-    """Get all graph nodes"""
+async def get_nodes(
+    request: Request,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    format: str = "json",
+    bbox: Optional[str] = None,
+):
+    """
+    Get active graph nodes (same paging/format/bbox parameters as GET /obstacles).
+    A plain ?format=geojson request is answered from the loaded routing graph,
+    with an ETag so unchanged data returns 304.
+    """
+    box = _list_params(format, bbox)
+    if format == "geojson" and box is None and after is None and limit is None and not fields:
+        response = await _graph_geojson_response(request, "nodes")
+        if response is not None:
+            return response
     try:
-        cursor = nodes_collection.find({"active": True})
-        nodes = []
-        async for node in cursor:
-            node.pop("_id", None)
-            nodes.append(GraphNode(**node))
-        return nodes
+        return await list_documents(
+            nodes_collection, {"active": True, **bbox_query(box, "coordinates")},
+            shape=lambda doc: GraphNode(**doc).dict(), fmt=format, after=after, limit=limit, fields=fields,
+            feature=lambda doc: point_feature(doc, "coordinates"),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/nodes")
-async def add_node(node: GraphNode):
-    """Add new graph node"""
+async def add_node(node: GraphNode, reload: bool = False):
+    """Add new graph node (?reload=true also adds it to the live routing graph)"""
     try:
         node_dict = node.dict()
         node_dict["_id"] = node_dict["nodeId"]  # Use nodeId as _id
+        node_dict["updatedAt"] = datetime.utcnow()
         
         result = await nodes_collection.insert_one(node_dict)
+        if reload:
+            await navigation_service.apply_graph_changes(node_docs=[node_dict])
         
         return {
             "message": "Node added successfully",
@@ -330,28 +885,93 @@ async def add_node(node: GraphNode):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/nodes/bulk")
+async def add_nodes_bulk(request: Request, reload: bool = False):
+    """
+    Upsert many graph nodes from a JSON array or NDJSON body.
+    Pass ?reload=true to merge the written nodes into the live routing graph.
+    """
+    report, written = await _bulk_upsert(request, GraphNode, "nodeId", nodes_collection)
+    if reload and written:
+        await navigation_service.apply_graph_changes(node_docs=written)
+        report["graph_reloaded"] = True
+    return report
+
+@app.delete("/nodes/{node_id}")
+async def deactivate_node(node_id: str, reload: bool = True):
+    """Deactivate a graph node and drop it (and its edges) from the routing graph"""
+    result = await nodes_collection.update_one(
+        {"_id": node_id}, {"$set": {"active": False, "updatedAt": datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail=f"Unknown node '{node_id}'")
+    if reload:
+        await navigation_service.apply_graph_changes(node_docs=[{"nodeId": node_id, "active": False}])
+    return {"message": "Node deactivated", "nodeId": node_id, "graph_reloaded": reload}
+
 # Graph Edge Endpoints
 @app.get("/edges", response_model=List[GraphEdge])
-async def get_edges():
-    """Get all graph edges"""
+async def get_edges(
+    request: Request,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    format: str = "json",
+    bbox: Optional[str] = None,
+):
+    """
+    Get active graph edges (same paging/format/bbox parameters as GET /obstacles).
+    Edges carry no coordinates of their own, so bbox and GeoJSON use the loaded
+    routing graph; an edge is inside the bbox if either endpoint is. A plain
+    ?format=geojson request is served from the graph itself, like GET /nodes,
+    with the same features as rendering the documents.
+    """
+    box = _list_params(format, bbox)
+    if format == "geojson" and box is None and after is None and limit is None and not fields:
+        response = await _graph_geojson_response(request, "edges")
+        if response is not None:
+            return response
+    graph = navigation_service.graph
+    if (box is not None or format == "geojson") and graph is None:
+        raise HTTPException(status_code=503, detail="Navigation graph not loaded")
+
+    def endpoints(doc):
+        ends = [graph.index_of(doc.get(key)) for key in ("from", "to")]
+        return [graph.coords(i) for i in ends if i is not None]
+
+    def keep(doc):
+        return any(in_bbox(box, lat, lng) for lat, lng in endpoints(doc))
+
+    def feature(doc):
+        coords = endpoints(doc)
+        if len(coords) < 2 or doc["from"] == doc["to"]:
+            return None  # Not part of the routing graph (unknown endpoint or self-loop)
+        return {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in coords]},
+            "properties": doc,
+        }
+
     try:
-        cursor = edges_collection.find({"active": True})
-        edges = []
-        async for edge in cursor:
-            edge.pop("_id", None)
-            edges.append(GraphEdge(**edge))
-        return edges
+        return await list_documents(
+            edges_collection, {"active": True},
+            shape=lambda doc: GraphEdge(**doc).dict(by_alias=True), fmt=format, after=after, limit=limit, fields=fields,
+            feature=feature, keep=keep if box is not None else None,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/edges")
-async def add_edge(edge: GraphEdge):
-    """Add new graph edge"""
+async def add_edge(edge: GraphEdge, reload: bool = False):
+    """Add new graph edge (?reload=true also adds it to the live routing graph)"""
     try:
-        edge_dict = edge.dict()
+        edge_dict = edge.dict(by_alias=True)  # Stored as "from", which the graph loader reads
         edge_dict["_id"] = edge_dict["edgeId"]  # Use edgeId as _id
+        edge_dict["updatedAt"] = datetime.utcnow()
         
         result = await edges_collection.insert_one(edge_dict)
+        if reload:
+            await navigation_service.apply_graph_changes(edge_docs=[edge_dict])
         
         return {
             "message": "Edge added successfully",
@@ -360,15 +980,78 @@ async def add_edge(edge: GraphEdge):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/edges/bulk")
+async def add_edges_bulk(request: Request, reload: bool = False):
+    """
+    Upsert many graph edges from a JSON array or NDJSON body.
+    Pass ?reload=true to merge the written edges into the live routing graph.
+    """
+    report, written = await _bulk_upsert(request, GraphEdge, "edgeId", edges_collection)
+    if reload and written:
+        await navigation_service.apply_graph_changes(edge_docs=written)
+        report["graph_reloaded"] = True
+    return report
+
+@app.delete("/edges/{edge_id}")
+async def deactivate_edge(edge_id: str, reload: bool = True):
+    """Deactivate a graph edge and drop it from the routing graph"""
+    edge = await edges_collection.find_one_and_update(
+        {"_id": edge_id}, {"$set": {"active": False, "updatedAt": datetime.utcnow()}}
+    )
+    if edge is None:
+        raise HTTPException(status_code=404, detail=f"Unknown edge '{edge_id}'")
+    if reload:
+        await navigation_service.apply_graph_changes(edge_docs=[{**edge, "active": False}])
+    return {"message": "Edge deactivated", "edgeId": edge_id, "graph_reloaded": reload}
+
 # Directions
+def _encode_json(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _directions_body(start: str, end: str, route: bytes) -> bytes:
+    """/directions response around a cached route fragment; only the echoed names are encoded per request"""
+    return b"".join((
+        b'{"start":', _encode_json(start), b',"end":', _encode_json(end), b",", route,
+        b',"message":', _encode_json(f"Route found from {start} to {end}"), b"}",
+    ))
+
+
+async def _compute_route(cache_key: tuple) -> Optional[bytes]:
+    """Route fragment for a /directions cache key, stored in route_cache; None if there is no path"""
+    start_key, end_key, algorithm, profile, _ = cache_key
+    # Find path using navigation service
+    path_result = await navigation_service.find_path(start_key, end_key, algorithm=algorithm, profile=profile)
+    if not path_result:
+        return None
+    # Everything but the echoed names, without the surrounding braces
+    route = _encode_json({
+        "path_found": True,
+        "route_coordinates": path_result["coordinates"],
+        "path_nodes": path_result["path_nodes"],
+        "blocked_nodes": path_result["blocked_nodes"],
+    })[1:-1]
+    route_cache.put(cache_key, route)
+    return route
+
+
 @app.get("/directions")
-async def get_directions(start: str, end: str):
-    """Get directions between two buildings"""
+async def get_directions(start: str, end: str, algorithm: Optional[str] = None, profile: str = "default"):
+    """Get directions between two buildings (repeat requests are served from route_cache)"""
     try:
-        # Find path using navigation service
-        path_result = await navigation_service.find_path(start.lower().strip(), end.lower().strip())
+        if algorithm is not None and algorithm not in ROUTING_ALGORITHMS:
+            raise HTTPException(status_code=400, detail=f"Unknown algorithm '{algorithm}'. Use one of {list(ROUTING_ALGORITHMS)}.")
+        if profile not in navigation_service.cost_model.profiles:
+            raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of {list(navigation_service.cost_model.profiles)}.")
+        
+        start_key, end_key = start.lower().strip(), end.lower().strip()
+        # Read the epoch before routing: a change mid-search leaves the entry under the old, unreachable key
+        cache_key = (start_key, end_key, algorithm, profile, navigation_service.route_epoch())
+        route = route_cache.get(cache_key)
+        if route is None:
+            route = await directions_flight.do(cache_key, lambda: _compute_route(cache_key))
         
-        if not path_result:
+        if route is None:
             # Try to suggest available buildings
             available_buildings = navigation_service.get_available_buildings()
             raise HTTPException(
@@ -376,28 +1059,128 @@ async def get_directions(start: str, end: str):
                 detail=f"No path found between '{start}' and '{end}'. Available buildings: {available_buildings}"
             )
         
-        return {
-            "start": start,
-            "end": end,
-            "path_found": True,
-            "route_coordinates": path_result["coordinates"],
-            "path_nodes": path_result["path_nodes"],
-            "blocked_nodes": path_result["blocked_nodes"],
-            "message": f"Route found from {start} to {end}"
-        }
+        return Response(content=_directions_body(start, end, route), media_type="application/json")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _check_profile(profile: str):
+    if profile not in navigation_service.cost_model.profiles:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}'. Use one of {list(navigation_service.cost_model.profiles)}.")
+
+
+@app.get("/directions/point")
+async def get_directions_from_point(
+    from_lat: float = Query(..., ge=-90, le=90),
+    from_lng: float = Query(..., ge=-180, le=180),
+    end: Optional[str] = None,
+    to_lat: Optional[float] = Query(None, ge=-90, le=90),
+    to_lng: Optional[float] = Query(None, ge=-180, le=180),
+    profile: str = "default",
+):
+    """
+    Directions from a GPS position to a building (?end=) or another position (?to_lat=&to_lng=).
+    Positions are snapped onto the nearest street segment; the snaps are returned with the route.
+    """
+    _check_profile(profile)
+    destination = (to_lat, to_lng) if to_lat is not None and to_lng is not None else None
+    if (end is None) == (destination is None):
+        raise HTTPException(status_code=400, detail="Give either end or both to_lat and to_lng")
+    if navigation_service.graph is None:
+        raise HTTPException(status_code=503, detail="Navigation graph not loaded")
+    try:
+        path_result = await navigation_service.find_path_from_point(
+            (from_lat, from_lng), destination=destination, end_building=end, profile=profile
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not path_result:
+        raise HTTPException(status_code=404, detail="No path found from the given position")
+    return {
+        "path_found": True,
+        "route_coordinates": path_result["coordinates"],
+        "path_nodes": path_result["path_nodes"],
+        "distance_m": path_result["distance_m"],
+        "origin_snap": path_result["origin_snap"],
+        "destination_snap": path_result["destination_snap"],
+    }
+
+@app.post("/directions/batch")
+async def get_directions_batch(request: BatchDirectionsRequest):
+    """Directions from many GPS positions to one building, answered by a single search from the building"""
+    _check_profile(request.profile)
+    if len(request.origins) > DIRECTIONS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {DIRECTIONS_BATCH_MAX} origins per request")
+    if navigation_service.graph is None:
+        raise HTTPException(status_code=503, detail="Navigation graph not loaded")
+    try:
+        routes = await navigation_service.find_paths_to_building(
+            [(origin.lat, origin.lng) for origin in request.origins], request.end, profile=request.profile
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if routes is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown building '{request.end}'. Available buildings: {navigation_service.get_available_buildings()}"
+        )
+    return {
+        "end": request.end,
+        "routes": [
+            None if route is None else {
+                "route_coordinates": route["coordinates"],
+                "path_nodes": route["path_nodes"],
+                "distance_m": route["distance_m"],
+                "origin_snap": route["origin_snap"],
+            }
+            for route in routes
+        ],
+    }
+
+@app.get("/navigation-status")
+async def navigation_status():
+    """Routing graph, obstacle sync and route cache state"""
+    graph = navigation_service.graph
+    return {
+        "graph_loaded": graph is not None,
+        "nodes": graph.num_nodes if graph is not None else 0,
+        "graph_version": navigation_service.graph_version,
+        "obstacle_epoch": navigation_service.obstacle_index.epoch,
+        "obstacle_sync": navigation_service.obstacle_index.mode,
+        "route_cache": route_cache.stats(),
+        "directions_single_flight": directions_flight.stats(),
+        "obstacle_load_single_flight": navigation_service.obstacle_index.load_flight.stats(),
+    }
+
 @app.post("/refresh-navigation")
-async def refresh_navigation():
-    """Refresh navigation data from database"""
+async def refresh_navigation(full: bool = True, replace_local: bool = False):
+    """
+    Refresh navigation data from database.
+    Re-reads every node and edge by default. ?full=false only applies documents whose
+    updatedAt moved past the last load, which misses writes that don't set updatedAt.
+    A graph booted from NAV_GRAPH_SNAPSHOT / NAV_GRAPH_FILE is only replaced by the
+    database graph with ?replace_local=true.
+    """
+    source = navigation_service.graph_source
+    if source in ("snapshot", "file") and not replace_local:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Navigation graph was loaded from a local {source}; pass replace_local=true to replace it with the database graph"
+        )
+    if source in ("snapshot", "file"):
+        print(f"⚠️ Replacing the graph loaded from a local {source} with the database graph")
     try:
-        await navigation_service.initialize()
+        if full:
+            # Always re-read MongoDB here; the boot snapshot may be stale by now
+            await navigation_service.initialize(use_local_graph=False)
+            changes = None
+        else:
+            changes = await navigation_service.refresh_changes()
         return {
             "message": "Navigation service refreshed successfully",
-            "buildings_count": len(navigation_service.get_available_buildings())
+            "buildings_count": len(navigation_service.get_available_buildings()),
+            "changes": changes
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 import google.generativeai as genai
@@ -5,6 +6,27 @@ import os
 from PIL import Image
 import io
 import re
+import threading
+import time
+
+
+class _RateLimiter:
+    """Spaces out call starts to stay under a requests-per-minute quota"""
+
+    def __init__(self, requests_per_minute: float = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(start - now)
+
 
 class GeminiObstacleDetector:
     def __init__(self):
@@ -22,101 +44,133 @@ class GeminiObstacleDetector:
                 self.model = genai.GenerativeModel("gemini-pro-vision")
             except Exception:
                 self.model = genai.GenerativeModel("gemini-pro")
+        # Shared by every call in the process, whichever endpoint or worker makes it
+        self.rate_limiter = _RateLimiter(float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "0")) or None)
 
     def verify_obstacle(self, image_bytes: bytes, coords: tuple):
         try:
-            # convert raw bytes → PIL image
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # resize image if too large (Gemini has size limits)
-            max_size = 1024
-            if image.width > max_size or image.height > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            image = self.prepare_image(image_bytes)
+            self.rate_limiter.wait()
+            return self.analyze_image(image)
+        except Exception as e:
+            print(f"General error in verify_obstacle: {str(e)}")
+            return self._create_error_response(str(e))
 
-            # simplified, more direct prompt
-            prompt = """
-            Analyze this image for accessibility obstacles. Look for stairs, curbs, barriers, debris, or anything blocking pedestrian paths.
+    async def verify_obstacles(self, items, run, max_concurrency: int = 4):
+        """
+        Verify many (image_bytes, coords) items through run, e.g. a DetectionPool's run_when_free.
+        Yields (index, verdict) in completion order; at most max_concurrency calls are in flight.
+        """
+        slots = asyncio.Semaphore(max(1, max_concurrency))
 
-            Respond with valid JSON only:
-            {
-                "is_obstacle": true,
-                "obstacle_type": "description here",
-                "confidence": 0.85,
-                "severity": "HIGH"
-            }
+        async def verify(index, image_bytes, coords):
+            async with slots:
+                return index, await run(self.verify_obstacle, image_bytes, coords)
 
-            Confidence: 0.0-1.0, Severity: NONE/LOW/MEDIUM/HIGH
-            """
+        tasks = [asyncio.create_task(verify(index, *item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Don't start calls nobody will read if the caller stops early
+            for task in tasks:
+                task.cancel()
+
+    def prepare_image(self, image_bytes: bytes):
+        """Decode an upload and shrink it to what Gemini accepts"""
+        # convert raw bytes → PIL image
+        image = Image.open(io.BytesIO(image_bytes))
+        
+        # resize image if too large (Gemini has size limits)
+        max_size = 1024
+        if image.width > max_size or image.height > max_size:
+            # Let JPEG decode at a reduced scale instead of full size
+            image.draft("RGB", (max_size, max_size))
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        return image
+
+    def analyze_image(self, image):
+        """Ask Gemini whether a prepared image shows an obstacle"""
+        # simplified, more direct prompt
+        prompt = """
+        Analyze this image for accessibility obstacles. Look for stairs, curbs, barriers, debris, or anything blocking pedestrian paths.
+
+        Respond with valid JSON only:
+        {
+            "is_obstacle": true,
+            "obstacle_type": "description here",
+            "confidence": 0.85,
+            "severity": "HIGH"
+        }
 
-            print(f"🔍 Sending image to Gemini API...")
+        Confidence: 0.0-1.0, Severity: NONE/LOW/MEDIUM/HIGH
+        """
+
+        print(f"🔍 Sending image to Gemini API...")
+        
+        # generate content with better error handling
+        try:
+            response = self.model.generate_content([prompt, image])
+            print(f"Received response from Gemini")
             
-            # generate content with better error handling
-            try:
-                response = self.model.generate_content([prompt, image])
-                print(f"Received response from Gemini")
-                
-                # check for safety blocks
-                if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-                    if hasattr(response.prompt_feedback, 'block_reason'):
-                        print(f"Content blocked: {response.prompt_feedback.block_reason}")
-                        return self._create_error_response(f"Content blocked: {response.prompt_feedback.block_reason}")
-
-                # check if response exists
-                if not response:
-                    print("No response from Gemini API")
-                    return self._create_error_response("No response from Gemini API")
-                
-                # check for text attribute
-                if not hasattr(response, 'text'):
-                    print("Response object has no text attribute")
-                    print(f"Response object: {dir(response)}")
-                    return self._create_error_response("Response object has no text attribute")
-                
-                # Check if text is empty
-                if not response.text:
-                    print("Empty text response from Gemini API")
-                    return self._create_error_response("Empty text response from Gemini API")
-
-                response_text = response.text.strip()
-                print(f"Raw Gemini response: '{response_text}'")
-
-            except Exception as api_error:
-                print(f"Gemini API error: {str(api_error)}")
-                return self._create_error_response(f"Gemini API error: {str(api_error)}")
-
-            # Clean response text
-            text_out = response_text.strip()
+            # check for safety blocks
+            if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+                if hasattr(response.prompt_feedback, 'block_reason'):
+                    print(f"Content blocked: {response.prompt_feedback.block_reason}")
+                    return self._create_error_response(f"Content blocked: {response.prompt_feedback.block_reason}")
+
+            # check if response exists
+            if not response:
+                print("No response from Gemini API")
+                return self._create_error_response("No response from Gemini API")
             
-            # Remove markdown code blocks if present
-            if text_out.startswith('```json'):
-                text_out = text_out.replace('```json', '').replace('```', '').strip()
-            elif text_out.startswith('```'):
-                text_out = text_out.replace('```', '').strip()
+            # check for text attribute
+            if not hasattr(response, 'text'):
+                print("Response object has no text attribute")
+                print(f"Response object: {dir(response)}")
+                return self._create_error_response("Response object has no text attribute")
             
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', text_out, re.DOTALL)
-            if json_match:
-                json_text = json_match.group(0)
-            else:
-                print(f"No JSON found in response: '{text_out}'")
-                return self._fallback_analysis(text_out, "No JSON structure found")
-
-            # Parse JSON
-            try:
-                analysis = json.loads(json_text)
-                print(f"Successfully parsed JSON: {analysis}")
-            except json.JSONDecodeError as json_error:
-                print(f"JSON parse error: {json_error}")
-                print(f"Attempted to parse: '{json_text}'")
-                return self._fallback_analysis(text_out, str(json_error))
+            # Check if text is empty
+            if not response.text:
+                print("Empty text response from Gemini API")
+                return self._create_error_response("Empty text response from Gemini API")
 
-            # Validate and clean up the response
-            analysis = self._validate_response(analysis)
-            return analysis
+            response_text = response.text.strip()
+            print(f"Raw Gemini response: '{response_text}'")
 
-        except Exception as e:
-            print(f"General error in verify_obstacle: {str(e)}")
-            return self._create_error_response(str(e))
+        except Exception as api_error:
+            print(f"Gemini API error: {str(api_error)}")
+            return self._create_error_response(f"Gemini API error: {str(api_error)}")
+
+        # Clean response text
+        text_out = response_text.strip()
+        
+        # Remove markdown code blocks if present
+        if text_out.startswith('```json'):
+            text_out = text_out.replace('```json', '').replace('```', '').strip()
+        elif text_out.startswith('```'):
+            text_out = text_out.replace('```', '').strip()
+        
+        # Extract JSON from response
+        json_match = re.search(r'\{.*\}', text_out, re.DOTALL)
+        if json_match:
+            json_text = json_match.group(0)
+        else:
+            print(f"No JSON found in response: '{text_out}'")
+            return self._fallback_analysis(text_out, "No JSON structure found")
+
+        # Parse JSON
+        try:
+            analysis = json.loads(json_text)
+            print(f"Successfully parsed JSON: {analysis}")
+        except json.JSONDecodeError as json_error:
+            print(f"JSON parse error: {json_error}")
+            print(f"Attempted to parse: '{json_text}'")
+            return self._fallback_analysis(text_out, str(json_error))
+
+        # Validate and clean up the response
+        analysis = self._validate_response(analysis)
+        return analysis
 
     def _validate_response(self, analysis):
         """Validate and fix the analysis response"""
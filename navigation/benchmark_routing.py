@@ -0,0 +1,54 @@
+"""
+Compare query latency of the routing engines on a text graph
+(graph_points.txt or result_graph.txt format).
+
+Usage (from the repository root):
+    python -m navigation.benchmark_routing [--graph navigation/graph_points.txt] [--queries 500]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from navigation.contraction_hierarchy import ContractionHierarchy
+from navigation.graph_import import load_graph_file
+from navigation.navigation_service import NavigationService
+
+
+def time_queries(route, pairs):
+    """Per-query latencies in microseconds"""
+    latencies = []
+    for start, goal in pairs:
+        t0 = time.perf_counter()
+        route(start, goal)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--graph", default="navigation/graph_points.txt")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(*load_graph_file(args.graph))
+    print(f"Graph: {service.graph.num_nodes} nodes, {service.graph.num_edges // 2} edges")
+
+    t0 = time.perf_counter()
+    service.contraction_hierarchy = ContractionHierarchy(service.graph)
+    print(f"CH preprocessing: {time.perf_counter() - t0:.3f}s, {service.contraction_hierarchy.num_shortcuts} shortcuts")
+
+    rng = random.Random(args.seed)
+    pairs = [tuple(rng.sample(range(service.graph.num_nodes), 2)) for _ in range(args.queries)]
+
+    print(f"{'engine':<10}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}")
+    for algorithm in ("dijkstra", "astar", "ch"):
+        latencies = time_queries(lambda s, g: service._route(s, g, algorithm), pairs)
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(f"{algorithm:<10}{statistics.mean(latencies):>12.1f}{statistics.median(latencies):>12.1f}{p99:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
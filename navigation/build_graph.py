@@ -1,10 +1,17 @@
 import sys
 import os
-from coordinate_calc import get_intermediate_points
+import csv
+import json
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from coordinate_calc import get_intermediate_points, get_intermediate_points_batch
 from pyproj import Geod
 
 RESULT_FILE = "graph_points.txt"  # You can change this path as needed
 DIST_THRESHOLD = 3  # meters
+METERS_PER_DEGREE = 111320  # of longitude at the equator, never less than the true value
+MIN_METERS_PER_DEGREE_LAT = 110574  # of latitude at the equator, the shortest anywhere
 
 def read_existing_points(filepath):
     """Reads all points from the result file. Returns dict: id -> (lat, lon, street_name)"""
@@ -22,34 +29,212 @@ def read_existing_points(filepath):
                 points[pid] = (lat, lon, street)
     return points
 
+def read_existing_edges(filepath):
+    """Reads all edges from the result file. Returns dict: (a, b) with a < b -> street_name"""
+    edges = {}
+    if not os.path.exists(filepath):
+        return edges
+    with open(filepath, "r") as f:
+        for line in f:
+            if line.startswith("EDGE"):
+                parts = line.strip().split()
+                a, b = int(parts[1]), int(parts[2])
+                if a != b:
+                    edges.setdefault((min(a, b), max(a, b)), parts[3] if len(parts) > 3 else "")
+    return edges
+
 def read_last_point_id(points_dict):
     """Returns the next available point ID (incremental)."""
     if not points_dict:
         return 1
     return max(points_dict.keys()) + 1
 
-def find_close_point(lat, lon, existing_points, geod, threshold=DIST_THRESHOLD):
-    """Returns the id of a point within threshold meters, or None."""
-    for pid, (plat, plon, _) in existing_points.items():
-        _, _, dist = geod.inv(lon, lat, plon, plat)
-        if dist < threshold:
-            return pid
-    return None
+class PointIndex:
+    """
+    Grid hash over graph points for snapping lookups.
+
+    Points are bucketed into cells at least `threshold` meters tall on an
+    equirectangular projection scaled at the first point's latitude. Cells
+    get narrower than the threshold further from the equator than that
+    point, so lookups there search as many extra columns as it takes to
+    cover the threshold; otherwise the 3x3 block around the query does.
+    Only those candidates get an exact geodesic distance check.
+    """
+
+    def __init__(self, threshold=DIST_THRESHOLD, geod=None):
+        self.threshold = threshold
+        self.geod = geod or Geod(ellps='WGS84')
+        self.cells = {}  # (row, col) -> [(pid, lat, lon), ...]
+        self.lon_scale = None  # meters per degree of longitude, fixed at the first point's latitude
 
-def append_points_and_connections(filepath, street_name, points, point_ids, existing_points):
+    def __len__(self):
+        return sum(len(cell) for cell in self.cells.values())
+
+    def _cell(self, lat, lon):
+        if self.lon_scale is None:
+            self.lon_scale = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        return (math.floor(lat * MIN_METERS_PER_DEGREE_LAT / self.threshold),
+                math.floor(lon * self.lon_scale / self.threshold))
+
+    def _column_reach(self, lat):
+        """Columns on each side of a query at lat that can hold a point within the threshold"""
+        farthest = min(abs(lat) + self.threshold / MIN_METERS_PER_DEGREE_LAT, 89.9)
+        width = self.lon_scale / (METERS_PER_DEGREE * math.cos(math.radians(farthest)))
+        return max(1, math.ceil(width))
+
+    def add(self, pid, lat, lon):
+        self.cells.setdefault(self._cell(lat, lon), []).append((pid, lat, lon))
+
+    def find(self, lat, lon):
+        """Returns the lowest id of a point within threshold meters, or None."""
+        row, col = self._cell(lat, lon)
+        reach = self._column_reach(lat)
+        best = None
+        for dr in (-1, 0, 1):
+            for dc in range(-reach, reach + 1):
+                for pid, plat, plon in self.cells.get((row + dr, col + dc), ()):
+                    _, _, dist = self.geod.inv(lon, lat, plon, plat)
+                    if dist < self.threshold and (best is None or pid < best):
+                        best = pid
+        return best
+
+def append_points_and_connections(filepath, street_name, points, point_ids, new_ids):
     """Appends new points and their connections to the result file."""
-    # Only write new points
+    # Only write new points, once each
     with open(filepath, "a") as f:
+        written = set()
         for pid, (lat, lon) in zip(point_ids, points):
-            if pid not in existing_points:
+            if pid in new_ids and pid not in written:
                 f.write(f"POINT {pid} {lat:.8f} {lon:.8f} {street_name}\n")
+                written.add(pid)
         # Write connections (edges)
         for i in range(len(point_ids) - 1):
-            f.write(f"EDGE {point_ids[i]} {point_ids[i+1]} {street_name}\n")
+            if point_ids[i] != point_ids[i + 1]:
+                f.write(f"EDGE {point_ids[i]} {point_ids[i+1]} {street_name}\n")
+
+def read_manifest(filepath):
+    """
+    Reads street segments from a manifest. Returns list of (street_name, (lat, lon), (lat, lon)).
+
+    CSV rows are `street_name,start_lat,start_lon,end_lat,end_lon` (an optional
+    header and #-comments are skipped). GeoJSON LineString / MultiLineString
+    features contribute one segment per pair of consecutive coordinates, named
+    after their "name" property.
+    """
+    segments = []
+    if filepath.endswith((".geojson", ".json")):
+        with open(filepath, "r") as f:
+            data = json.load(f)
+        features = data.get("features", [data]) if isinstance(data, dict) else data
+        for i, feature in enumerate(features):
+            geometry = feature.get("geometry") or {}
+            name = (feature.get("properties") or {}).get("name") or f"street_{i + 1}"
+            lines = geometry.get("coordinates", [])
+            if geometry.get("type") == "LineString":
+                lines = [lines]
+            elif geometry.get("type") != "MultiLineString":
+                continue
+            for line in lines:
+                for (lon1, lat1, *_), (lon2, lat2, *_) in zip(line, line[1:]):
+                    segments.append((name, (lat1, lon1), (lat2, lon2)))
+        return segments
+
+    with open(filepath, "r", newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].lstrip().startswith("#"):
+                continue
+            try:
+                name = row[0].strip()
+                start_lat, start_lon, end_lat, end_lon = (float(v) for v in row[1:5])
+            except ValueError:
+                continue  # Header row
+            segments.append((name, (start_lat, start_lon), (end_lat, end_lon)))
+    return segments
+
+def _densify_chunk(segments, interval_meters=5):
+    lats, lons, offsets = get_intermediate_points_batch(
+        [start for _, start, _ in segments], [end for _, _, end in segments], interval_meters
+    )
+    lats, lons, offsets = lats.tolist(), lons.tolist(), offsets.tolist()
+    return [
+        (name, list(zip(lats[offsets[i]:offsets[i + 1]], lons[offsets[i]:offsets[i + 1]])))
+        for i, (name, _, _) in enumerate(segments)
+    ]
+
+def densify_segments(segments, interval_meters=5, workers=1):
+    """Intermediate points for every segment, optionally spread over worker processes."""
+    if workers <= 1 or len(segments) < 2:
+        return _densify_chunk(segments, interval_meters)
+    size = -(-len(segments) // workers)
+    chunks = [segments[i:i + size] for i in range(0, len(segments), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_densify_chunk, chunks, [interval_meters] * len(chunks))
+        return [street for chunk in results for street in chunk]
+
+def build_bulk_graph(densified, points, edges):
+    """
+    Snaps densified streets into the graph in one pass.
+
+    points (id -> (lat, lon, street_name)) and edges ((a, b) -> street_name)
+    hold the starting graph and are extended in place; intersections snap
+    across all streets, and an edge added by several streets is kept once.
+    """
+    index = PointIndex()
+    for pid, (lat, lon, _) in points.items():
+        index.add(pid, lat, lon)
+    next_id = read_last_point_id(points)
+
+    for street_name, street_points in densified:
+        street_name = "_".join(street_name.split()) or "street"
+        previous = None
+        for lat, lon in street_points:
+            pid = index.find(lat, lon)
+            if pid is None:
+                pid = next_id
+                next_id += 1
+                index.add(pid, lat, lon)
+                points[pid] = (lat, lon, street_name)
+            if previous is not None and previous != pid:
+                edges.setdefault((min(previous, pid), max(previous, pid)), street_name)
+            previous = pid
+    return points, edges
+
+def write_graph(filepath, points, edges):
+    """Writes the whole graph in one go, replacing the file atomically."""
+    lines = [f"POINT {pid} {lat:.8f} {lon:.8f} {street}\n" for pid, (lat, lon, street) in sorted(points.items())]
+    lines += [f"EDGE {a} {b} {street}\n" for (a, b), street in edges.items()]
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, filepath)
+
+def bulk_main(argv):
+    parser = argparse.ArgumentParser(description="Build the graph from a manifest of street segments in one pass")
+    parser.add_argument("--manifest", required=True, help="CSV (street_name,start_lat,start_lon,end_lat,end_lon) or GeoJSON file")
+    parser.add_argument("--output", default=RESULT_FILE)
+    parser.add_argument("--interval", type=float, default=5, help="meters between intermediate points")
+    parser.add_argument("--workers", type=int, default=1, help="processes used for densification")
+    parser.add_argument("--fresh", action="store_true", help="ignore the existing output file instead of extending it")
+    args = parser.parse_args(argv)
+
+    segments = read_manifest(args.manifest)
+    densified = densify_segments(segments, args.interval, args.workers)
+
+    points = {} if args.fresh else read_existing_points(args.output)
+    edges = {} if args.fresh else read_existing_edges(args.output)
+    existing = len(points), len(edges)
+    build_bulk_graph(densified, points, edges)
+    write_graph(args.output, points, edges)
+
+    print(f"Processed {len(segments)} segments: {len(points) - existing[0]} new points, "
+          f"{len(edges) - existing[1]} new edges ({len(points)} points, {len(edges)} edges total).")
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1].startswith("--"):
+        return bulk_main(sys.argv[1:])
     if len(sys.argv) != 6:
         print("Usage: python build_graph.py <street_name> <start_lat> <start_lon> <end_lat> <end_lon>")
+        print("       python build_graph.py --manifest <streets.csv|streets.geojson> [--workers N] [--fresh]")
         sys.exit(1)
     street_name = sys.argv[1]
     start_lat = float(sys.argv[2])
@@ -66,23 +251,27 @@ def main():
     # Read existing points
     existing_points = read_existing_points(RESULT_FILE)
     next_id = read_last_point_id(existing_points)
-    geod = Geod(ellps='WGS84')
+    index = PointIndex()
+    for pid, (lat, lon, _) in existing_points.items():
+        index.add(pid, lat, lon)
 
     # Assign IDs, reusing if close enough
     point_ids = []
+    new_ids = set()
     for lat, lon in points:
-        existing_id = find_close_point(lat, lon, existing_points, geod)
+        existing_id = index.find(lat, lon)
         if existing_id is not None:
             point_ids.append(existing_id)
         else:
             point_ids.append(next_id)
-            existing_points[next_id] = (lat, lon, street_name)
+            index.add(next_id, lat, lon)
+            new_ids.add(next_id)
             next_id += 1
 
     # Append new points and edges
-    append_points_and_connections(RESULT_FILE, street_name, points, point_ids, read_existing_points(RESULT_FILE))
+    append_points_and_connections(RESULT_FILE, street_name, points, point_ids, new_ids)
 
     print(f"Processed {len(points)} points for '{street_name}'. Connections updated.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,345 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import sys
+import numpy as np
+
+EARTH_RADIUS_M = 6371000  # Same radius NavigationService.haversine_distance uses
+
+
+def haversine_array(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized haversine distance in meters (inputs in degrees, broadcastable)"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _csr(n: int, src: np.ndarray, dst: np.ndarray, lat: np.ndarray, lng: np.ndarray,
+         lengths: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(offsets, targets, weights) for undirected edges src[i] - dst[i] over n nodes.
+
+    lengths, if given, are the edges' weights in meters (NaN where they
+    still need computing); otherwise every weight is computed from lat/lng.
+    """
+    if lengths is None:
+        lengths = np.full(len(src), np.nan)
+    missing = np.isnan(lengths)
+    if missing.any():
+        lengths = lengths.copy()
+        lengths[missing] = haversine_array(lat[src[missing]], lng[src[missing]], lat[dst[missing]], lng[dst[missing]])
+    # Add bidirectional connections
+    all_src = np.concatenate([src, dst])
+    all_dst = np.concatenate([dst, src])
+    order = np.argsort(all_src, kind="stable")
+    all_src = all_src[order]
+    targets = all_dst[order]
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_src, minlength=n), out=offsets[1:])
+    weights = np.concatenate([lengths, lengths])[order].astype(np.float32)
+    return offsets, targets, weights
+
+
+def _in_sorted(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Mask of keys that occur in the sorted array sorted_keys"""
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), max(len(sorted_keys) - 1, 0))
+    return sorted_keys[positions] == keys if len(sorted_keys) else np.zeros(len(keys), dtype=bool)
+
+
+def _as_list(column: Sequence[str]) -> List[str]:
+    """A mutable copy of a string column (snapshot string tables decode in bulk)"""
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+
+def _forward_slots(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """CSR slot of src[i] -> dst[i] for each edge, in the layout _csr produces"""
+    order = np.argsort(np.concatenate([src, dst]), kind="stable")
+    slots = np.empty(len(order), dtype=np.int64)
+    slots[order] = np.arange(len(order))
+    return slots[:len(src)]
+
+
+class CompiledGraph:
+    """Read-only, array-backed form of the walking graph used for routing.
+
+    Node ids are mapped to dense integer indices. Coordinates live in two
+    float64 arrays and the (undirected) adjacency is stored in CSR form:
+    the neighbours of node ``i`` are ``targets[offsets[i]:offsets[i + 1]]``
+    and the matching edge lengths in meters are the same slice of
+    ``weights``. Edge lengths are computed once here instead of on every
+    relaxation.
+
+    The edge records the adjacency was built from are kept alongside it:
+    ``edge_ids`` and ``edge_names`` with their ``edge_src`` / ``edge_dst``
+    node indices in the direction they were stored, so the graph can be
+    rendered and patched in terms of the graph_edges documents.
+    """
+
+    def __init__(
+        self,
+        node_ids: Sequence[str],
+        names: Sequence[str],
+        types: Sequence[str],
+        lat: np.ndarray,
+        lng: np.ndarray,
+        offsets: np.ndarray,
+        targets: np.ndarray,
+        weights: np.ndarray,
+        edge_ids: Sequence[str],
+        edge_names: Sequence[str],
+        edge_src: np.ndarray,
+        edge_dst: np.ndarray,
+        index=None,
+        edge_index=None,
+    ):
+        self.node_ids = node_ids
+        self.names = names
+        self.types = types
+        self.lat = lat
+        self.lng = lng
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self.edge_names = edge_names
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        # Anything with .get(node_id); snapshots pass a lookup that avoids decoding every id
+        self._index = index if index is not None else {node_id: i for i, node_id in enumerate(node_ids)}
+        self._edge_index = edge_index if edge_index is not None else {edge_id: i for i, edge_id in enumerate(edge_ids)}
+
+    @classmethod
+    def build(
+        cls,
+        node_ids: List[str],
+        names: List[str],
+        types: List[str],
+        lats: Iterable[float],
+        lngs: Iterable[float],
+        edges: Iterable[Tuple[str, str]],
+        edge_ids: Optional[Iterable[str]] = None,
+        edge_names: Optional[Iterable[str]] = None,
+    ) -> "CompiledGraph":
+        """Compile node columns plus (from, to) id pairs into CSR arrays.
+
+        edge_ids and edge_names run parallel to edges; without them ids are
+        "{from}-{to}" (as graph_import assigns) and names are empty. Edges
+        are treated as bidirectional. Self-loops and edges that point at
+        unknown (e.g. inactive) nodes are dropped. If a node or edge id
+        appears more than once the last record wins.
+        """
+        lats, lngs = list(lats), list(lngs)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        if len(index) != len(node_ids):
+            keep = sorted(index.values())
+            node_ids = [node_ids[i] for i in keep]
+            names = [names[i] for i in keep]
+            types = [types[i] for i in keep]
+            lats = [lats[i] for i in keep]
+            lngs = [lngs[i] for i in keep]
+            index = {node_id: i for i, node_id in enumerate(node_ids)}
+        n = len(node_ids)
+        lat = np.asarray(lats, dtype=np.float64)
+        lng = np.asarray(lngs, dtype=np.float64)
+
+        edges = list(edges)
+        if edge_ids is None:
+            edge_ids = [f"{from_node}-{to_node}" for from_node, to_node in edges]
+        if edge_names is None:
+            edge_names = [""] * len(edges)
+        records: Dict[str, Optional[Tuple[int, int, str]]] = {}
+        for edge_id, (from_node, to_node), edge_name in zip(edge_ids, edges, edge_names):
+            u = index.get(from_node)
+            v = index.get(to_node)
+            records[edge_id] = None if u is None or v is None or u == v else (u, v, edge_name)
+        records = {edge_id: record for edge_id, record in records.items() if record is not None}
+        src = np.asarray([u for u, _, _ in records.values()], dtype=np.int32)
+        dst = np.asarray([v for _, v, _ in records.values()], dtype=np.int32)
+
+        offsets, targets, weights = _csr(n, src, dst, lat, lng)
+
+        # Interning shares the string objects between nodes on the same street
+        names = [sys.intern(name or "") for name in names]
+        types = [sys.intern(node_type or "") for node_type in types]
+        edge_names = [sys.intern(edge_name or "") for _, _, edge_name in records.values()]
+        return cls(node_ids, names, types, lat, lng, offsets, targets, weights,
+                   list(records), edge_names, src, dst, index=index)
+
+    def edge_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Each undirected edge once, as (u, v) index arrays with u < v"""
+        src = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.offsets))
+        keep = src < self.targets
+        return src[keep], np.asarray(self.targets)[keep]
+
+    def patched(
+        self,
+        nodes: Iterable[Tuple[str, str, str, float, float]] = (),
+        removed_nodes: Iterable[str] = (),
+        edges: Iterable[Tuple[str, str, str, str]] = (),
+        removed_edges: Iterable[str] = (),
+    ) -> Tuple["CompiledGraph", Dict[str, np.ndarray]]:
+        """New graph with changes applied, plus what changed; this one is left untouched.
+
+        nodes are (id, name, type, lat, lng) records that are added or
+        replace the node with the same id; edges are (id, from, to, name)
+        records that do the same for edges, and removed_edges are edge
+        ids. Removed nodes take their edges with them, and removals win
+        over records for the same id. Surviving nodes and edges keep their
+        order and new ones are appended, and the existing arrays are
+        patched with vectorized operations, so the cost is a few array
+        passes rather than a rebuild from node id pairs.
+
+        The returned delta holds:
+            remap        old node index -> new index, -1 for removed nodes
+            moved        new indices of added nodes and nodes whose position changed
+            added_edges  (u, v) new-index arrays of node pairs that were not connected before
+            cut          new indices of surviving nodes that lost their connection to a neighbour
+        """
+        n = self.num_nodes
+        node_ids, names, types = (_as_list(column) for column in (self.node_ids, self.names, self.types))
+        lat, lng = np.array(self.lat, dtype=np.float64), np.array(self.lng, dtype=np.float64)
+        appended: Dict[str, int] = {}
+        new_coords: List[Tuple[float, float]] = []
+        moved = set()
+        for node_id, name, node_type, node_lat, node_lng in nodes:
+            i = self._index.get(node_id)
+            if i is None:
+                if node_id not in appended:
+                    appended[node_id] = n + len(appended)
+                    node_ids.append(node_id)
+                    names.append("")
+                    types.append("")
+                    new_coords.append((node_lat, node_lng))
+                i = appended[node_id]
+                new_coords[i - n] = (node_lat, node_lng)
+            elif (lat[i], lng[i]) != (node_lat, node_lng):
+                lat[i], lng[i] = node_lat, node_lng
+                moved.add(i)
+            names[i] = sys.intern(name or "")
+            types[i] = sys.intern(node_type or "")
+        if new_coords:
+            lat = np.concatenate([lat, np.asarray(new_coords)[:, 0]])
+            lng = np.concatenate([lng, np.asarray(new_coords)[:, 1]])
+        total = len(node_ids)
+        lookup = lambda node_id: self._index.get(node_id, appended.get(node_id))
+
+        # Existing edge records, each with its length; changed ones are rewritten in place
+        m = len(self.edge_src)
+        edge_ids, edge_names = _as_list(self.edge_ids), _as_list(self.edge_names)
+        src, dst = np.array(self.edge_src, dtype=np.int64), np.array(self.edge_dst, dtype=np.int64)
+        lengths = np.asarray(self.weights, dtype=np.float64)[_forward_slots(src, dst)]
+        old_keys = np.sort(np.minimum(src, dst) * total + np.maximum(src, dst))
+        updates: Dict[str, Optional[Tuple[int, int, str]]] = {}
+        for edge_id, from_node, to_node, edge_name in edges:
+            u, v = lookup(from_node), lookup(to_node)
+            updates[edge_id] = None if u is None or v is None or u == v else (u, v, sys.intern(edge_name or ""))
+        for edge_id in removed_edges:
+            updates[edge_id] = None
+        keep_edge = np.ones(m, dtype=bool)
+        appended_edges: Dict[str, int] = {}
+        new_ends: List[Tuple[int, int]] = []
+        for edge_id, record in updates.items():
+            row = self._edge_index.get(edge_id)
+            if row is not None:
+                if record is None:
+                    keep_edge[row] = False
+                else:
+                    src[row], dst[row], edge_names[row] = record
+                    lengths[row] = np.nan
+            elif record is not None:
+                appended_edges[edge_id] = m + len(appended_edges)
+                edge_ids.append(edge_id)
+                edge_names.append(record[2])
+                new_ends.append(record[:2])
+        if new_ends:
+            ends = np.asarray(new_ends, dtype=np.int64)
+            src, dst = np.concatenate([src, ends[:, 0]]), np.concatenate([dst, ends[:, 1]])
+            lengths = np.concatenate([lengths, np.full(len(ends), np.nan)])
+            keep_edge = np.concatenate([keep_edge, np.ones(len(ends), dtype=bool)])
+
+        keep = np.ones(total, dtype=bool)
+        removed = [i for i in map(lookup, set(removed_nodes)) if i is not None]
+        keep[removed] = False
+        remap = np.cumsum(keep) - 1
+        remap[~keep] = -1
+        keep_edge &= keep[src] & keep[dst]
+        # Edges of moved nodes get new lengths, the rest keep theirs
+        relocated = np.zeros(total, dtype=bool)
+        relocated[list(moved)] = True
+        lengths = np.where(relocated[src] | relocated[dst], np.nan, lengths)[keep_edge]
+        new_keys = np.sort((np.minimum(src, dst) * total + np.maximum(src, dst))[keep_edge])
+        added_keys = np.unique(new_keys[~_in_sorted(old_keys, new_keys)])
+        removed_keys = np.unique(old_keys[~_in_sorted(new_keys, old_keys)])
+        src, dst = remap[src[keep_edge]], remap[dst[keep_edge]]
+
+        if removed:
+            node_ids = [node_id for node_id, k in zip(node_ids, keep.tolist()) if k]
+            names = [name for name, k in zip(names, keep.tolist()) if k]
+            types = [node_type for node_type, k in zip(types, keep.tolist()) if k]
+            lat, lng = lat[keep], lng[keep]
+            index = {node_id: i for i, node_id in enumerate(node_ids)}
+        elif isinstance(self._index, dict):
+            index = {**self._index, **appended}
+        else:
+            index = None
+        if not keep_edge.all():
+            edge_ids = [edge_id for edge_id, k in zip(edge_ids, keep_edge.tolist()) if k]
+            edge_names = [edge_name for edge_name, k in zip(edge_names, keep_edge.tolist()) if k]
+            edge_index = None
+        elif isinstance(self._edge_index, dict):
+            edge_index = {**self._edge_index, **appended_edges}
+        else:
+            edge_index = None
+
+        src, dst = src.astype(np.int32), dst.astype(np.int32)
+        offsets, targets, weights = _csr(len(node_ids), src, dst, lat, lng, lengths)
+        graph = CompiledGraph(node_ids, names, types, lat, lng, offsets, targets, weights,
+                              edge_ids, edge_names, src, dst, index=index, edge_index=edge_index)
+
+        added_u, added_v = added_keys // total, added_keys % total
+        cut = np.concatenate([removed_keys // total, removed_keys % total])
+        moved = np.asarray(sorted(moved) + list(range(n, total)), dtype=np.int64)
+        delta = {
+            "remap": remap[:n],
+            "moved": remap[moved[keep[moved]]],
+            "added_edges": (remap[added_u], remap[added_v]),
+            "cut": np.unique(remap[cut[keep[cut]]]),
+        }
+        return graph, delta
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self) -> int:
+        """Number of directed adjacency entries (two per undirected edge)"""
+        return len(self.targets)
+
+    def index_of(self, node_id: str) -> Optional[int]:
+        """Integer index for a node id, or None if the node is not loaded"""
+        return self._index.get(node_id)
+
+    def coords(self, i: int) -> Tuple[float, float]:
+        """(lat, lng) of the node at index i"""
+        return float(self.lat[i]), float(self.lng[i])
+
+    def neighbors(self, i: int) -> Tuple[List[int], List[float]]:
+        """Neighbour indices and edge weights of the node at index i"""
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.targets[lo:hi].tolist(), self.weights[lo:hi].tolist()
+
+    def distances_to(self, i: int) -> np.ndarray:
+        """Straight-line distance in meters from every node to node i"""
+        return haversine_array(self.lat, self.lng, self.lat[i], self.lng[i])
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the numeric arrays (ids and names not included)"""
+        return {
+            "coords": self.lat.nbytes + self.lng.nbytes,
+            "offsets": self.offsets.nbytes,
+            "targets": self.targets.nbytes,
+            "weights": self.weights.nbytes,
+            "edge_ends": self.edge_src.nbytes + self.edge_dst.nbytes,
+        }
+
@@ -0,0 +1,177 @@
+from typing import Dict, List, Optional, Tuple
+import heapq
+import numpy as np
+from navigation.compiled_graph import CompiledGraph
+
+WITNESS_SETTLE_LIMIT = 60  # Cap on nodes settled per witness search
+
+
+class ContractionHierarchy:
+    """Contraction Hierarchies index over a CompiledGraph.
+
+    Preprocessing contracts nodes one at a time (cheapest edge difference
+    first) and adds a shortcut u-w whenever the only shortest u-w path ran
+    through the contracted node. Queries then run a bidirectional Dijkstra
+    that only follows edges towards higher-ranked nodes, which settles a
+    few dozen nodes instead of a large part of the graph.
+
+    The hierarchy is built for the unobstructed graph. It does not know
+    about blocked nodes; callers check the unpacked path and fall back to a
+    regular search when it crosses one.
+    """
+
+    def __init__(self, graph: CompiledGraph):
+        self.graph = graph
+        self.rank = np.zeros(graph.num_nodes, dtype=np.int32)
+        self.num_shortcuts = 0
+        self._shortcut_mid: Dict[Tuple[int, int], int] = {}
+        self._build()
+
+    def _build(self):
+        """Order nodes, add shortcuts and pack the upward graph into CSR arrays"""
+        n = self.graph.num_nodes
+        # Working adjacency: node -> {neighbour: weight}, keeping the lightest parallel edge
+        adj: List[Dict[int, float]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for v, w in zip(*self.graph.neighbors(u)):
+                if w < adj[u].get(v, float('inf')):
+                    adj[u][v] = w
+
+        contracted = [False] * n
+        deleted_neighbors = [0] * n
+        pq = [(self._priority(v, adj, contracted, deleted_neighbors), v) for v in range(n)]
+        heapq.heapify(pq)
+        upward: List[Dict[int, float]] = [dict() for _ in range(n)]
+        order = 0
+
+        while pq:
+            _, v = heapq.heappop(pq)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and requeue if v is no longer the cheapest
+            priority = self._priority(v, adj, contracted, deleted_neighbors)
+            if pq and priority > pq[0][0]:
+                heapq.heappush(pq, (priority, v))
+                continue
+
+            for u, w_uv, w, w_vw in self._needed_shortcuts(v, adj, contracted):
+                weight = w_uv + w_vw
+                if weight < adj[u].get(w, float('inf')):
+                    adj[u][w] = weight
+                    adj[w][u] = weight
+                    self._shortcut_mid[(min(u, w), max(u, w))] = v
+                    self.num_shortcuts += 1
+
+            contracted[v] = True
+            self.rank[v] = order
+            order += 1
+            # Every remaining neighbour outranks v, so these are v's upward edges
+            for u, w_uv in adj[v].items():
+                if not contracted[u]:
+                    upward[v][u] = w_uv
+                    deleted_neighbors[u] += 1
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in upward], out=offsets[1:])
+        self.up_offsets = offsets
+        self.up_targets = np.fromiter((u for edges in upward for u in edges), dtype=np.int32, count=int(offsets[-1]))
+        self.up_weights = np.fromiter((w for edges in upward for w in edges.values()), dtype=np.float64, count=int(offsets[-1]))
+
+    def _needed_shortcuts(self, v: int, adj, contracted):
+        """(u, w(u,v), w, w(v,w)) for each neighbour pair that needs a shortcut via v"""
+        neighbors = [(u, w) for u, w in adj[v].items() if not contracted[u]]
+        for i, (u, w_uv) in enumerate(neighbors):
+            others = neighbors[i + 1:]
+            if not others:
+                continue
+            max_cost = w_uv + max(w_vw for _, w_vw in others)
+            witness = self._witness_search(u, v, max_cost, adj, contracted)
+            for w, w_vw in others:
+                if witness.get(w, float('inf')) > w_uv + w_vw:
+                    yield u, w_uv, w, w_vw
+
+    def _witness_search(self, source: int, skip: int, max_cost: float, adj, contracted) -> Dict[int, float]:
+        """Bounded Dijkstra from source that avoids skip and contracted nodes"""
+        distances = {source: 0.0}
+        pq = [(0.0, source)]
+        settled = 0
+        while pq and settled < WITNESS_SETTLE_LIMIT:
+            dist, u = heapq.heappop(pq)
+            if dist > distances.get(u, float('inf')):
+                continue
+            if dist > max_cost:
+                break
+            settled += 1
+            for x, w in adj[u].items():
+                if x == skip or contracted[x]:
+                    continue
+                new_distance = dist + w
+                if new_distance < distances.get(x, float('inf')):
+                    distances[x] = new_distance
+                    heapq.heappush(pq, (new_distance, x))
+        return distances
+
+    def _priority(self, v: int, adj, contracted, deleted_neighbors) -> int:
+        """Edge difference (shortcuts added minus edges removed) plus deleted neighbours"""
+        shortcuts = sum(1 for _ in self._needed_shortcuts(v, adj, contracted))
+        degree = sum(1 for u in adj[v] if not contracted[u])
+        return shortcuts - degree + deleted_neighbors[v]
+
+    def query(self, start: int, goal: int) -> Optional[Tuple[float, List[int]]]:
+        """(cost, node index path) of the shortest start-goal route, or None if unreachable"""
+        if start == goal:
+            return 0.0, [start]
+        offsets, targets, weights = self.up_offsets, self.up_targets, self.up_weights
+        distances = ({start: 0.0}, {goal: 0.0})
+        previous = ({}, {})
+        queues = ([(0.0, start)], [(0.0, goal)])
+        best, meeting = float('inf'), None
+
+        while queues[0] or queues[1]:
+            # Expand whichever side has the smaller frontier key
+            if not queues[1] or (queues[0] and queues[0][0][0] <= queues[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            dist, u = heapq.heappop(queues[side])
+            if dist >= best:
+                # Nothing left on this side can improve the route
+                queues[side].clear()
+                continue
+            if dist > distances[side].get(u, float('inf')):
+                continue
+            other = distances[1 - side].get(u)
+            if other is not None and dist + other < best:
+                best, meeting = dist + other, u
+            lo, hi = offsets[u], offsets[u + 1]
+            for x, w in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+                new_distance = dist + w
+                if new_distance < distances[side].get(x, float('inf')):
+                    distances[side][x] = new_distance
+                    previous[side][x] = u
+                    heapq.heappush(queues[side], (new_distance, x))
+
+        if meeting is None:
+            return None
+        forward = [meeting]
+        while forward[-1] in previous[0]:
+            forward.append(previous[0][forward[-1]])
+        forward.reverse()
+        backward = [meeting]
+        while backward[-1] in previous[1]:
+            backward.append(previous[1][backward[-1]])
+        return best, self._unpack(forward + backward[1:])
+
+    def _unpack(self, path: List[int]) -> List[int]:
+        """Expand shortcuts in a hierarchy path into original graph edges"""
+        result = [path[0]]
+        stack = [(path[i], path[i + 1]) for i in range(len(path) - 2, -1, -1)]
+        while stack:
+            u, w = stack.pop()
+            mid = self._shortcut_mid.get((min(u, w), max(u, w)))
+            if mid is None:
+                result.append(w)
+            else:
+                stack.append((mid, w))
+                stack.append((u, mid))
+        return result
@@ -1,5 +1,78 @@
+import math
+
+import numpy as np
 from pyproj import Geod
 
+# Use the WGS-84 ellipsoid model, which is the standard for GPS
+GEOD = Geod(ellps='WGS84')
+
+def get_intermediate_points_array(start_point, end_point, interval_meters=10):
+    """
+    Same points as get_intermediate_points, as (latitudes, longitudes) NumPy arrays.
+
+    All intermediate points come from a single array-valued Geod.fwd call.
+    """
+    # pyproj's functions expect longitude first, then latitude
+    start_lat, start_lon = start_point
+    end_lat, end_lon = end_point
+    fwd_azimuth, _, total_distance = GEOD.inv(start_lon, start_lat, end_lon, end_lat)
+
+    # Steps k * interval with k >= 1 that fall strictly before the end point
+    steps = max(math.ceil(total_distance / interval_meters) - 1, 0)
+    distances = np.arange(1, steps + 1) * float(interval_meters)
+    lons, lats, _ = GEOD.fwd(
+        np.full(steps, start_lon, dtype=np.float64), np.full(steps, start_lat, dtype=np.float64),
+        np.full(steps, fwd_azimuth), distances
+    )
+    return np.concatenate(([start_lat], lats, [end_lat])), np.concatenate(([start_lon], lons, [end_lon]))
+
+def get_intermediate_points_batch(start_points, end_points, interval_meters=10):
+    """
+    Densifies many segments at once.
+
+    Args:
+        start_points: sequence or (n, 2) array of (latitude, longitude) segment starts.
+        end_points: sequence or (n, 2) array of (latitude, longitude) segment ends.
+        interval_meters: The distance between intermediate points in meters.
+
+    Returns:
+        tuple: (latitudes, longitudes, offsets) where the points of segment i,
+        start and end included, are latitudes[offsets[i]:offsets[i + 1]] and
+        the same slice of longitudes.
+    """
+    starts = np.asarray(start_points, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(end_points, dtype=np.float64).reshape(-1, 2)
+
+    # One inverse solve for every segment's azimuth and length (pyproj is lon-first)
+    fwd_azimuth, _, total_distance = GEOD.inv(starts[:, 1], starts[:, 0], ends[:, 1], ends[:, 0])
+    fwd_azimuth = np.atleast_1d(fwd_azimuth)
+    total_distance = np.atleast_1d(total_distance)
+
+    # Steps k * interval with k >= 1 that fall strictly before the end point
+    steps = np.maximum(np.ceil(total_distance / interval_meters) - 1, 0).astype(np.int64)
+    counts = steps + 2
+    offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    lats = np.empty(offsets[-1])
+    lons = np.empty(offsets[-1])
+    lats[offsets[:-1]], lons[offsets[:-1]] = starts[:, 0], starts[:, 1]
+    lats[offsets[1:] - 1], lons[offsets[1:] - 1] = ends[:, 0], ends[:, 1]
+
+    total_steps = int(steps.sum())
+    if total_steps:
+        segment = np.repeat(np.arange(len(starts)), steps)
+        # Position of each step within its segment: 1, 2, ..., steps[i]
+        k = np.arange(total_steps) - np.repeat(np.cumsum(steps) - steps, steps) + 1
+        step_lons, step_lats, _ = GEOD.fwd(
+            starts[segment, 1], starts[segment, 0], fwd_azimuth[segment], k * float(interval_meters)
+        )
+        slots = offsets[segment] + k
+        lats[slots] = step_lats
+        lons[slots] = step_lons
+
+    return lats, lons, offsets
+
 def get_intermediate_points(start_point, end_point, interval_meters=10):
 
     """
@@ -16,47 +89,26 @@ def get_intermediate_points(start_point, end_point, interval_meters=10):
     Returns:
         list: A list of (latitude, longitude) tuples, including the start and end points.
     """
-    # Use the WGS-84 ellipsoid model, which is the standard for GPS
-    geod = Geod(ellps='WGS84')
-
-    # pyproj's functions expect longitude first, then latitude. Let's unpack them correctly.
-    start_lon, start_lat = start_point[1], start_point[0]
-    end_lon, end_lat = end_point[1], end_point[0]
-
-    # Calculate the total distance and the initial forward direction (azimuth)
-    # from the start point to the end point.
-    fwd_azimuth, back_azimuth, total_distance = geod.inv(start_lon, start_lat, end_lon, end_lat)
-
-    # Start our list of coordinates with the starting point
-    all_points = [start_point]
-
-    # Calculate the number of intermediate points to generate
-    # We step along the total distance in increments of our interval
-    current_distance = interval_meters
-    while current_distance < total_distance:
-        # Calculate the next point's coordinates
-        # geod.fwd() takes a start lon/lat, azimuth, and distance to find a destination point
-        lon, lat, _ = geod.fwd(start_lon, start_lat, fwd_azimuth, current_distance)
-        all_points.append((lat, lon))
-        current_distance += interval_meters
-
-    # Finally, ensure the exact end point is included in our list
-    all_points.append(end_point)
-
+    lats, lons = get_intermediate_points_array(start_point, end_point, interval_meters)
+    all_points = list(zip(lats.tolist(), lons.tolist()))
+    # Keep the caller's exact start and end tuples, as before
+    all_points[0] = start_point
+    all_points[-1] = end_point
     return all_points
 
-# --- Example Usage ---
+if __name__ == "__main__":
+    # --- Example Usage ---
 
-# Two points in Pittsburgh, PA (approx. 160 meters apart)
-# Point A: Near the Cathedral of Learning
-# Point B: Near the Hillman Library
-point_a = (40.442520, -79.957635)
-point_b = (40.443481, -79.959320)
+    # Two points in Pittsburgh, PA (approx. 160 meters apart)
+    # Point A: Near the Cathedral of Learning
+    # Point B: Near the Hillman Library
+    point_a = (40.442520, -79.957635)
+    point_b = (40.443481, -79.959320)
 
-# Calculate the points every 3 meters between Point A and Point B
-intermediate_coordinates = get_intermediate_points(point_a, point_b, interval_meters=10)
+    # Calculate the points every 3 meters between Point A and Point B
+    intermediate_coordinates = get_intermediate_points(point_a, point_b, interval_meters=10)
 
-# Print the results
-print(f"Generated {len(intermediate_coordinates)} points between Point A and Point B.\n")
-for i, point in enumerate(intermediate_coordinates):
-    print(f"Point {i:>2}: {point[0]:.6f}, {point[1]:.6f}")
\ No newline at end of file
+    # Print the results
+    print(f"Generated {len(intermediate_coordinates)} points between Point A and Point B.\n")
+    for i, point in enumerate(intermediate_coordinates):
+        print(f"Point {i:>2}: {point[0]:.6f}, {point[1]:.6f}")
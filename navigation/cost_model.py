@@ -0,0 +1,170 @@
+from collections import deque
+from typing import Dict, Iterable, Optional, Set, Tuple
+import math
+import numpy as np
+from navigation.compiled_graph import CompiledGraph
+
+# Edge weight multiplier per Gemini severity. HIGH makes the edge impassable.
+SEVERITY_MULTIPLIERS = {"NONE": 1.0, "LOW": 1.5, "MEDIUM": 3.0, "HIGH": math.inf}
+DEFAULT_SEVERITY = "HIGH"  # Verified reports stored before severity was recorded block, as they always did
+
+# Per-profile overrides keyed on words in obstacle_type. A matching rule
+# replaces the severity multiplier; the first match wins.
+PROFILES = {
+    "default": {
+        "type_rules": [
+            (("stair", "step"), 2.0),
+        ],
+    },
+    "wheelchair": {
+        "type_rules": [
+            (("stair", "step", "curb", "kerb"), math.inf),
+        ],
+    },
+}
+
+JOURNAL_SIZE = 1024  # Obstacle changes remembered for incremental consumers
+
+
+class CostModel:
+    """Turns an obstacle's severity, type and AI confidence into an edge weight multiplier"""
+
+    def __init__(self, profiles: Optional[Dict] = None):
+        self.profiles = profiles or PROFILES
+
+    def multiplier(self, obstacle: Dict, profile: str) -> float:
+        """Multiplier (>= 1, inf for impassable) applied to edges around the obstacle"""
+        obstacle_type = str(obstacle.get("obstacle_type") or "").lower()
+        base = None
+        for keywords, value in self.profiles[profile]["type_rules"]:
+            if any(keyword in obstacle_type for keyword in keywords):
+                base = value
+                break
+        if base is None:
+            severity = str(obstacle.get("severity") or DEFAULT_SEVERITY).upper()
+            base = SEVERITY_MULTIPLIERS.get(severity, SEVERITY_MULTIPLIERS[DEFAULT_SEVERITY])
+        if math.isinf(base):
+            return base
+
+        confidence = obstacle.get("ai_confidence")
+        confidence = 1.0 if confidence is None else min(max(float(confidence), 0.0), 1.0)
+        # Less certain verdicts push the penalty towards "no effect"
+        return max(1.0, 1.0 + (base - 1.0) * confidence)
+
+
+class EdgePenalties:
+    """Obstacle-adjusted edge weights of one routing profile.
+
+    weights mirrors CompiledGraph.weights with each edge multiplied by the
+    largest multiplier of the obstacles touching either endpoint. Nodes
+    touched by an impassable obstacle are reported by blocked_nodes().
+    Changing one obstacle only rewrites the CSR slots incident to its
+    nodes, so updates cost O(affected edges).
+    """
+
+    def __init__(self, graph: CompiledGraph):
+        self.graph = graph
+        self.weights = graph.weights.copy()
+        self._contributions: Dict[int, Dict[str, float]] = {}  # CSR slot -> obstacle id -> multiplier
+        self._obstacles: Dict[str, Tuple[Set[int], float]] = {}  # obstacle id -> (node indices, multiplier)
+        self._blocked_refcount: Dict[int, int] = {}
+        self._affected_refcount: Dict[int, int] = {}
+        self.epoch = 0
+        # (epoch, touched node indices, relaxed) for each change, see changes_since()
+        self._journal = deque(maxlen=JOURNAL_SIZE)
+
+    def blocked_nodes(self) -> Set[int]:
+        """Node indices an impassable obstacle sits on"""
+        return set(self._blocked_refcount)
+
+    def affected_nodes(self) -> Set[int]:
+        """Node indices with any obstacle penalty (including impassable ones)"""
+        return set(self._affected_refcount)
+
+    def set_obstacle(self, obstacle_id: str, nodes: Iterable[int], multiplier: float):
+        """Add or update one obstacle's contribution"""
+        nodes = set(nodes)
+        if multiplier <= 1.0 or not nodes:
+            self.clear_obstacle(obstacle_id)
+            return
+        old = self._obstacles.get(obstacle_id)
+        if old == (nodes, multiplier):
+            return
+        touched = set(nodes)
+        if old is not None:
+            touched |= old[0]
+            self._remove(obstacle_id)
+        self._obstacles[obstacle_id] = (nodes, multiplier)
+        for node in nodes:
+            self._affected_refcount[node] = self._affected_refcount.get(node, 0) + 1
+            if math.isinf(multiplier):
+                self._blocked_refcount[node] = self._blocked_refcount.get(node, 0) + 1
+        slots = self._incident_slots(nodes)
+        for slot in slots:
+            self._contributions.setdefault(slot, {})[obstacle_id] = multiplier
+        self._refresh(slots if old is None else slots | self._incident_slots(old[0]))
+        self._record(touched, relaxed=old is not None)
+
+    def clear_obstacle(self, obstacle_id: str):
+        """Drop one obstacle's contribution (no-op if unknown)"""
+        old = self._obstacles.get(obstacle_id)
+        if old is None:
+            return
+        self._remove(obstacle_id)
+        self._refresh(self._incident_slots(old[0]))
+        self._record(old[0], relaxed=True)
+
+    def changes_since(self, epoch: int) -> Optional[Tuple[Set[int], bool]]:
+        """(touched nodes, whether any penalty was lowered) since epoch.
+
+        Returns None when the journal no longer reaches back that far.
+        """
+        if epoch == self.epoch:
+            return set(), False
+        if not self._journal or self._journal[0][0] > epoch + 1:
+            return None
+        touched, relaxed = set(), False
+        for change_epoch, nodes, change_relaxed in self._journal:
+            if change_epoch > epoch:
+                touched |= nodes
+                relaxed = relaxed or change_relaxed
+        return touched, relaxed
+
+    def _remove(self, obstacle_id: str):
+        nodes, multiplier = self._obstacles.pop(obstacle_id)
+        for refcount, applies in ((self._affected_refcount, True), (self._blocked_refcount, math.isinf(multiplier))):
+            if not applies:
+                continue
+            for node in nodes:
+                refcount[node] -= 1
+                if not refcount[node]:
+                    del refcount[node]
+        for slot in self._incident_slots(nodes):
+            contributions = self._contributions.get(slot)
+            if contributions is not None:
+                contributions.pop(obstacle_id, None)
+                if not contributions:
+                    del self._contributions[slot]
+
+    def _refresh(self, slots: Set[int]):
+        for slot in slots:
+            contributions = self._contributions.get(slot)
+            factor = max(contributions.values()) if contributions else 1.0
+            self.weights[slot] = self.graph.weights[slot] * factor
+
+    def _incident_slots(self, nodes: Set[int]) -> Set[int]:
+        """CSR slots of every edge with an endpoint in nodes, in both directions"""
+        offsets, targets = self.graph.offsets, self.graph.targets
+        slots = set()
+        for node in nodes:
+            lo, hi = int(offsets[node]), int(offsets[node + 1])
+            slots.update(range(lo, hi))
+            for neighbor in targets[lo:hi].tolist():
+                n_lo = int(offsets[neighbor])
+                row = targets[n_lo:int(offsets[neighbor + 1])]
+                slots.update((n_lo + np.flatnonzero(row == node)).tolist())
+        return slots
+
+    def _record(self, nodes: Set[int], relaxed: bool):
+        self.epoch += 1
+        self._journal.append((self.epoch, frozenset(nodes), relaxed))
@@ -0,0 +1,85 @@
+"""
+GeoJSON renderings of the compiled routing graph, for the map read endpoints.
+
+Bodies are serialized once per graph version and reused until the graph is
+replaced; each carries an ETag derived from its bytes so unchanged data can
+be answered with 304 Not Modified.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, Optional, Tuple
+
+from navigation.compiled_graph import CompiledGraph, _as_list
+
+GEOJSON_KINDS = ("nodes", "edges")
+
+
+def nodes_geojson(graph: CompiledGraph) -> bytes:
+    """FeatureCollection with a Point per node"""
+    lats, lngs = graph.lat.tolist(), graph.lng.tolist()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lngs[i], lats[i]]},
+            "properties": {"nodeId": node_id, "name": graph.names[i], "type": graph.types[i], "active": True},
+        }
+        for i, node_id in enumerate(graph.node_ids)
+    ]
+    return _feature_collection(features)
+
+
+def edges_geojson(graph: CompiledGraph) -> bytes:
+    """FeatureCollection with a LineString per edge record.
+
+    Features match what GET /edges renders from graph_edges documents:
+    the same properties (real edge id and name, from/to as stored) and
+    the same order (by edge id, like the listing's _id order).
+    """
+    lats, lngs = graph.lat.tolist(), graph.lng.tolist()
+    node_ids, edge_ids, edge_names = (_as_list(column) for column in (graph.node_ids, graph.edge_ids, graph.edge_names))
+    src, dst = graph.edge_src.tolist(), graph.edge_dst.tolist()
+    features = []
+    for k in sorted(range(len(edge_ids)), key=edge_ids.__getitem__):
+        u, v = src[k], dst[k]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lngs[u], lats[u]], [lngs[v], lats[v]]]},
+            "properties": {"edgeId": edge_ids[k], "from": node_ids[u], "to": node_ids[v], "active": True, "name": edge_names[k]},
+        })
+    return _feature_collection(features)
+
+
+def _feature_collection(features) -> bytes:
+    return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+class GraphGeoJSONCache:
+    """Serialized GeoJSON per kind for the current graph version"""
+
+    _RENDERERS = {"nodes": nodes_geojson, "edges": edges_geojson}
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[int, str, bytes]] = {}  # kind -> (version, etag, body)
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, graph: CompiledGraph, version: int) -> Tuple[str, bytes]:
+        """(etag, body) for graph at version, rendering it on first use"""
+        with self._lock:
+            entry = self._entries.get(kind)
+            if entry is None or entry[0] != version:
+                body = self._RENDERERS[kind](graph)
+                entry = (version, f'"{hashlib.sha1(body).hexdigest()}"', body)
+                self._entries[kind] = entry
+            return entry[1], entry[2]
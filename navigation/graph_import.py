@@ -0,0 +1,169 @@
+"""
+Import the text graph formats into the routing engine or MongoDB.
+
+Two formats are understood, detected from the first data line:
+    graph_points.txt   POINT <id> <lat> <lng> <street> / EDGE <a> <b> <street>
+    result_graph.txt   <id>: <lat>, <lng> <name> / <a> <--> <b>
+Lines are parsed one at a time, so files of any size stream through.
+
+Usage (from the repository root):
+    python -m navigation.graph_import navigation/graph_points.txt             # parse and compile only
+    python -m navigation.graph_import navigation/result_graph.txt --to-mongo  # bulk upsert into MongoDB
+"""
+import argparse
+import asyncio
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from navigation.compiled_graph import CompiledGraph
+
+# (kind, document) with kind "node" or "edge"; documents use the graph_nodes / graph_edges schema
+GraphRecord = Tuple[str, Dict]
+
+_RESULT_NODE = re.compile(r"^\s*(\S+):\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*(.*)$")
+_RESULT_EDGE = re.compile(r"^\s*(\S+)\s*<-->\s*(\S+)\s*$")
+
+
+def building_name(name: Optional[str], node_type: str) -> Optional[str]:
+    """Key under which a node is listed as a building entrance, or None"""
+    name = name or ""
+    if node_type == "building" or "entrance" in name.lower():
+        return name.lower().strip()
+    return None
+
+
+def _node(node_id: str, lat: float, lng: float, name: str, node_type: str = "waypoint") -> GraphRecord:
+    return "node", {
+        "nodeId": node_id,
+        "name": name,
+        "coordinates": {"lat": lat, "lng": lng},
+        "type": node_type,
+        "active": True,
+    }
+
+
+def _edge(from_node: str, to_node: str, name: str) -> GraphRecord:
+    return "edge", {
+        "edgeId": f"{from_node}-{to_node}",
+        "from": from_node,
+        "to": to_node,
+        "name": name,
+        "active": True,
+    }
+
+
+def iter_graph_points(lines) -> Iterator[GraphRecord]:
+    """Records from POINT/EDGE lines"""
+    for line in lines:
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == "POINT":
+            yield _node(parts[1], float(parts[2]), float(parts[3]), parts[4] if len(parts) > 4 else "")
+        elif parts[0] == "EDGE":
+            yield _edge(parts[1], parts[2], parts[3] if len(parts) > 3 else "")
+
+
+def iter_result_graph(lines) -> Iterator[GraphRecord]:
+    """Records from `id: lat, lng name` and `a <--> b` lines (# comments skipped)"""
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        edge = _RESULT_EDGE.match(line)
+        if edge:
+            yield _edge(edge.group(1), edge.group(2), "")
+            continue
+        node = _RESULT_NODE.match(line)
+        if node:
+            node_id, lat, lng, name = node.groups()
+            yield _node(node_id, float(lat), float(lng), name.strip())
+
+
+def iter_graph_file(filepath: str) -> Iterator[GraphRecord]:
+    """Stream records from either text format"""
+    with open(filepath, "r") as f:
+        first = ""
+        for first in f:
+            if first.strip() and not first.lstrip().startswith("#"):
+                break
+        parser = iter_graph_points if first.split()[:1] in (["POINT"], ["EDGE"]) else iter_result_graph
+        yield from parser([first])
+        yield from parser(f)
+
+
+def load_graph_file(filepath: str) -> Tuple[CompiledGraph, Dict[str, str]]:
+    """Compile a text graph for routing; returns (graph, building_nodes)"""
+    node_ids, names, types, lats, lngs = [], [], [], [], []
+    edges, edge_ids, edge_names = [], [], []
+    building_nodes = {}
+    for kind, doc in iter_graph_file(filepath):
+        if kind == "edge":
+            edges.append((doc["from"], doc["to"]))
+            edge_ids.append(doc["edgeId"])
+            edge_names.append(doc["name"])
+            continue
+        node_ids.append(doc["nodeId"])
+        names.append(doc["name"])
+        types.append(doc["type"])
+        lats.append(doc["coordinates"]["lat"])
+        lngs.append(doc["coordinates"]["lng"])
+        building = building_name(doc["name"], doc["type"])
+        if building is not None:
+            building_nodes[building] = doc["nodeId"]
+    return CompiledGraph.build(node_ids, names, types, lats, lngs, edges, edge_ids, edge_names), building_nodes
+
+
+async def upsert_graph_file(filepath: str, nodes_collection, edges_collection, batch_size: int = 1000) -> Dict[str, int]:
+    """Bulk-upsert a text graph into the node and edge collections.
+
+    Documents are keyed by nodeId / edgeId (as POST /nodes and /edges do)
+    and written with unordered bulk_write batches, so re-importing a file
+    updates records in place. Every document is stamped with updatedAt so
+    incremental refreshes (/refresh-navigation?full=false) see the import.
+    """
+    from pymongo import ReplaceOne
+
+    updated_at = datetime.utcnow()
+    batches = {"node": [], "edge": []}
+    collections = {"node": nodes_collection, "edge": edges_collection}
+    counts = {"nodes": 0, "edges": 0}
+
+    async def flush(kind):
+        if batches[kind]:
+            await collections[kind].bulk_write(batches[kind], ordered=False)
+            counts[kind + "s"] += len(batches[kind])
+            batches[kind] = []
+
+    for kind, doc in iter_graph_file(filepath):
+        doc_id = doc["nodeId"] if kind == "node" else doc["edgeId"]
+        batches[kind].append(ReplaceOne({"_id": doc_id}, {"_id": doc_id, **doc, "updatedAt": updated_at}, upsert=True))
+        if len(batches[kind]) >= batch_size:
+            await flush(kind)
+    await flush("node")
+    await flush("edge")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a graph_points.txt / result_graph.txt file")
+    parser.add_argument("graph")
+    parser.add_argument("--to-mongo", action="store_true", help="bulk upsert into graph_nodes / graph_edges")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    graph, building_nodes = load_graph_file(args.graph)
+    print(f"✅ Compiled {args.graph}: {graph.num_nodes} nodes, {graph.num_edges // 2} edges, "
+          f"{len(building_nodes)} buildings in {time.perf_counter() - t0:.2f}s")
+
+    if args.to_mongo:
+        from backend.models.database import nodes_collection, edges_collection
+        t0 = time.perf_counter()
+        counts = asyncio.run(upsert_graph_file(args.graph, nodes_collection, edges_collection, args.batch_size))
+        print(f"💾 Upserted {counts['nodes']} nodes and {counts['edges']} edges in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Versioned binary snapshots of the compiled routing graph.
+
+Layout: an 8-byte magic, a little-endian uint32 format version and a
+uint32 header length, then a UTF-8 JSON header, then the raw arrays, each
+starting on a 64-byte boundary. The header records every array's dtype,
+length and byte offset plus the building index. Strings (node ids, names,
+types, edge ids and names) are stored as one UTF-8 blob with int64 offsets
+and decoded only when accessed, so opening a snapshot just memory-maps the
+file. Version 2 added the edge records (ids, names, endpoints); older
+files have to be exported again.
+
+Usage (from the repository root):
+    python -m navigation.graph_snapshot export --from-text navigation/graph_points.txt graph.snap
+    python -m navigation.graph_snapshot export --from-mongo graph.snap
+    python -m navigation.graph_snapshot info graph.snap
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from navigation.compiled_graph import CompiledGraph
+
+MAGIC = b"AURAGRPH"
+SNAPSHOT_VERSION = 2
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")  # magic, version, header length
+STRING_COLUMNS = ("node_ids", "names", "types", "edge_ids", "edge_names")
+
+
+class StringTable(Sequence):
+    """Read-only list of strings backed by a UTF-8 blob and offsets, decoded on access"""
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def encode(cls, strings) -> Tuple[np.ndarray, np.ndarray]:
+        """(blob as uint8 array, int64 offsets) for a list of strings"""
+        encoded = [(s or "").encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def tolist(self):
+        """Every string, decoded in one pass (much faster than iterating)"""
+        data = bytes(self._blob)
+        bounds = self._offsets.tolist()
+        if data.isascii():
+            text = data.decode("ascii")  # Byte offsets are character offsets
+            return [text[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return [data[lo:hi].decode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+
+class SortedStringIndex:
+    """id -> position lookup by binary search over a precomputed sort order of a StringTable"""
+
+    def __init__(self, table: StringTable, order: np.ndarray):
+        self._table = table
+        self._order = order
+
+    def get(self, key, default=None):
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._table[int(self._order[mid])] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._order) and self._table[int(self._order[lo])] == key:
+            return int(self._order[lo])
+        return default
+
+
+def _arrays_for(graph: CompiledGraph) -> Dict[str, np.ndarray]:
+    arrays = {
+        "lat": np.asarray(graph.lat, dtype=np.float64),
+        "lng": np.asarray(graph.lng, dtype=np.float64),
+        "offsets": np.asarray(graph.offsets, dtype=np.int64),
+        "targets": np.asarray(graph.targets, dtype=np.int32),
+        "weights": np.asarray(graph.weights, dtype=np.float32),
+        "edge_src": np.asarray(graph.edge_src, dtype=np.int32),
+        "edge_dst": np.asarray(graph.edge_dst, dtype=np.int32),
+    }
+    for column in STRING_COLUMNS:
+        arrays[f"{column}_blob"], arrays[f"{column}_offsets"] = StringTable.encode(getattr(graph, column))
+    # Python's str ordering, so SortedStringIndex can bisect with plain comparisons
+    for column in ("node_ids", "edge_ids"):
+        ids = list(getattr(graph, column))
+        arrays[f"{column}_order"] = np.asarray(sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int64)
+    return arrays
+
+
+def _aligned(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def save_snapshot(path: str, graph: CompiledGraph, building_nodes: Dict[str, str], source: str = ""):
+    """Write graph and building index to path (atomically replacing any existing file)"""
+    arrays = _arrays_for(graph)
+    header = {
+        "created_at": time.time(),
+        "source": source,
+        "num_nodes": graph.num_nodes,
+        "building_nodes": building_nodes,
+        "arrays": {},
+    }
+    # Offsets are relative to the start of the data section, which follows the header
+    position = 0
+    for name, array in arrays.items():
+        position = _aligned(position)
+        header["arrays"][name] = {"dtype": array.dtype.str, "length": len(array), "offset": position}
+        position += array.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header_bytes))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + _aligned(position))  # Pad so trailing empty arrays still map
+    os.replace(tmp_path, path)
+
+
+def read_header(buffer) -> Tuple[Dict, int]:
+    """(header dict, start of the data section); raises ValueError for foreign or unsupported files"""
+    if len(buffer) < _PREAMBLE.size:
+        raise ValueError("Not a graph snapshot (file too short)")
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a graph snapshot (bad magic)")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported graph snapshot version {version} (expected {SNAPSHOT_VERSION}; export it again)")
+    header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]).decode("utf-8"))
+    return header, _aligned(_PREAMBLE.size + header_length)
+
+
+def load_snapshot(path: str) -> Tuple[CompiledGraph, Dict[str, str]]:
+    """Memory-map a snapshot and return (graph, building_nodes).
+
+    Arrays are read-only views into the mapping, so pages are only read
+    from disk when routing touches them and the cost of opening does not
+    grow with the graph.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = read_header(buffer)
+
+    def array(name):
+        spec = header["arrays"][name]
+        return np.frombuffer(buffer, dtype=np.dtype(spec["dtype"]), count=spec["length"], offset=data_start + spec["offset"])
+
+    node_ids, names, types, edge_ids, edge_names = (
+        StringTable(memoryview(array(f"{column}_blob")), array(f"{column}_offsets"))
+        for column in STRING_COLUMNS
+    )
+    graph = CompiledGraph(
+        node_ids, names, types,
+        array("lat"), array("lng"), array("offsets"), array("targets"), array("weights"),
+        edge_ids, edge_names, array("edge_src"), array("edge_dst"),
+        index=SortedStringIndex(node_ids, array("node_ids_order")),
+        edge_index=SortedStringIndex(edge_ids, array("edge_ids_order")),
+    )
+    return graph, header["building_nodes"]
+
+
+async def _export_from_mongo(path: str):
+    from navigation.navigation_service import NavigationService
+    service = NavigationService()
+    node_columns, building_nodes = await service._load_nodes()
+    edge_columns = await service._load_edges()
+    save_snapshot(path, CompiledGraph.build(*node_columns, *edge_columns), building_nodes, source="mongo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or inspect routing graph snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a snapshot")
+    source = export.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-text", metavar="GRAPH_TXT", help="graph_points.txt or result_graph.txt")
+    source.add_argument("--from-mongo", action="store_true")
+    export.add_argument("output")
+    info = commands.add_parser("info", help="print a snapshot's header")
+    info.add_argument("snapshot")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        graph, building_nodes = load_snapshot(args.snapshot)
+        print(f"{args.snapshot}: {graph.num_nodes} nodes, {graph.num_edges // 2} edges, {len(building_nodes)} buildings")
+        return
+
+    t0 = time.perf_counter()
+    if args.from_mongo:
+        asyncio.run(_export_from_mongo(args.output))
+    else:
+        from navigation.graph_import import load_graph_file
+        save_snapshot(args.output, *load_graph_file(args.from_text), source=args.from_text)
+    graph, building_nodes = load_snapshot(args.output)
+    print(f"✅ Wrote {args.output}: {graph.num_nodes} nodes, {graph.num_edges // 2} edges, "
+          f"{len(building_nodes)} buildings in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
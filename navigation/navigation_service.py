@@ -1,83 +1,368 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import numpy as np
-from scipy.spatial import KDTree
 import heapq
 import math
-from backend.models.database import nodes_collection, edges_collection, obstacles_collection
+import os
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from backend.models.database import nodes_collection, edges_collection, obstacles_collection, geo_within_bbox, obstacle_locations_migrated
+from navigation.compiled_graph import CompiledGraph, haversine_array
+from navigation.graph_snapshot import load_snapshot
+from navigation.graph_import import building_name, load_graph_file
+from navigation.graph_geojson import GraphGeoJSONCache
+from navigation.contraction_hierarchy import ContractionHierarchy
+from navigation.route_matrix import RouteMatrix
+from navigation.obstacle_index import ObstacleIndex
+from navigation.spatial_index import SpatialIndex
+from navigation.snapping import snap_to_edges
+from navigation.cost_model import CostModel, EdgePenalties
+
+ROUTING_ALGORITHMS = ("astar", "dijkstra", "ch")
+OBSTACLE_RADIUS_M = 10  # Obstacles affect every node within this distance
+ROUTE_MATRIX_MAX_BUILDINGS = int(os.getenv("NAV_ROUTE_MATRIX_MAX_BUILDINGS", "200"))
+GRAPH_SNAPSHOT_PATH = os.getenv("NAV_GRAPH_SNAPSHOT")  # Binary snapshot to boot from instead of MongoDB
+GRAPH_FILE_PATH = os.getenv("NAV_GRAPH_FILE")  # Or a graph_points.txt / result_graph.txt file, for offline use
+SHORTCUT_TEST_MAX_PAIRS = 500_000  # Route table entries x new edges checked after a graph patch before giving up
+WATERMARK_SKEW = timedelta(seconds=5)  # Re-read slightly older changes in case writes committed late
+
+async def _in_daemon_thread(fn, *args):
+    """Like asyncio.to_thread, but on a daemon thread, so long builds never hold up shutdown"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def settle(result=None, error=None):
+        if not future.done():
+            future.set_exception(error) if error is not None else future.set_result(result)
+    
+    def run():
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # Event loop already closed
+    
+    threading.Thread(target=run, daemon=True, name=getattr(fn, "__name__", "background")).start()
+    return await future
 
 class NavigationService:
-    def __init__(self):
-        self.nodes = {}
-        self.edges = {}
+    def __init__(self, use_contraction_hierarchy: Optional[bool] = None):
+        self.graph: Optional[CompiledGraph] = None  # Array-backed routing graph
+        self.graph_version = 0  # Bumped on every graph swap
+        self._geojson_cache = GraphGeoJSONCache()
         self.building_nodes = {}  # Map building names to node IDs
-        self.kd_tree = None
-        self.node_coords = []
-        self.node_ids = []
+        self.spatial_index: Optional[SpatialIndex] = None
+        # Optional Contraction Hierarchies index, built in the background after each graph load
+        if use_contraction_hierarchy is None:
+            use_contraction_hierarchy = os.getenv("NAV_CONTRACTION_HIERARCHY", "").lower() in ("1", "true", "yes")
+        self.use_contraction_hierarchy = use_contraction_hierarchy
+        self.contraction_hierarchy: Optional[ContractionHierarchy] = None
+        self._hierarchy_task: Optional[asyncio.Task] = None
+        self.route_matrices: Dict[str, RouteMatrix] = {}  # Profile -> building-to-building routes, filled on demand
+        # Obstacle costs: profile -> obstacle-adjusted edge weights
+        self.cost_model = CostModel()
+        self.penalties: Dict[str, EdgePenalties] = {}
+        self.obstacle_index = ObstacleIndex(
+            obstacles_collection, self._nodes_near_obstacles, on_change=self._apply_obstacle, region=self._obstacle_region
+        )
+        # Graph bounds the last obstacle scan was limited to (None: it read every obstacle)
+        self._obstacle_bounds: Optional[Tuple[float, float, float, float]] = None
+        # Where the graph was loaded from: "mongo", "snapshot" or "file" (None before the first load)
+        self.graph_source: Optional[str] = None
+        # updatedAt up to which MongoDB node / edge changes are in the graph (None: not loaded from MongoDB)
+        self.graph_watermark: Optional[datetime] = None
+        self._graph_lock_instance: Optional[asyncio.Lock] = None
+        
+    async def initialize(self, use_local_graph: bool = True):
+        """Load graph data and compile it for routing.
+
+        With use_local_graph set, memory-maps the NAV_GRAPH_SNAPSHOT file or
+        parses the NAV_GRAPH_FILE text graph when configured; otherwise
+        streams nodes and edges from MongoDB. The new graph is built off the
+        event loop and swapped in whole, so concurrent routes see either the
+        old graph or the new one. Only the spatial index and the per-profile
+        weights are built before the swap: building-to-building routes are
+        computed on first use and the contraction hierarchy (if enabled) is
+        contracted in the background, with A* serving routes until then.
+        """
+        async with self._graph_lock():
+            if use_local_graph and GRAPH_SNAPSHOT_PATH and os.path.exists(GRAPH_SNAPSHOT_PATH):
+                await self._swap_graph(lambda: load_snapshot(GRAPH_SNAPSHOT_PATH))
+                self.graph_source, self.graph_watermark = "snapshot", None
+            elif use_local_graph and GRAPH_FILE_PATH:
+                await self._swap_graph(lambda: load_graph_file(GRAPH_FILE_PATH))
+                self.graph_source, self.graph_watermark = "file", None
+            else:
+                watermark = datetime.utcnow() - WATERMARK_SKEW
+                node_columns, building_nodes = await self._load_nodes()
+                edge_columns = await self._load_edges()
+                await self._swap_graph(lambda: (CompiledGraph.build(*node_columns, *edge_columns), building_nodes))
+                self.graph_source, self.graph_watermark = "mongo", watermark
+        await self.obstacle_index.load()
+        
+    async def refresh_changes(self) -> Optional[Dict[str, int]]:
+        """Apply node / edge documents changed in MongoDB since the last load.
+
+        Reads only documents whose updatedAt is past graph_watermark
+        (deactivated ones included) and patches them into the graph, and
+        returns how many were applied. Documents written without updatedAt
+        (older data, edits made outside the API) are not seen; a full
+        reload picks those up. Falls back to a full reload (and returns
+        None) when the graph did not come from MongoDB.
+        """
+        if self.graph_watermark is None:
+            await self.initialize(use_local_graph=False)
+            return None
+        async with self._graph_lock():
+            watermark = datetime.utcnow() - WATERMARK_SKEW
+            changed = {"updatedAt": {"$gt": self.graph_watermark}}
+            node_docs = [doc async for doc in nodes_collection.find(changed)]
+            edge_docs = [doc async for doc in edges_collection.find(changed)]
+            if node_docs or edge_docs:
+                await self._patch_graph(node_docs, edge_docs)
+            self.graph_watermark = watermark
+        await self._reload_obstacles_if_outgrown()
+        return {"nodes": len(node_docs), "edges": len(edge_docs)}
+        
+    def load_graph(self, graph: CompiledGraph, building_nodes: Dict[str, str]):
+        """Install a compiled graph and rebuild everything derived from it"""
+        self._install_graph(self._prepare_graph(graph, building_nodes))
+        
+    async def apply_graph_changes(self, node_docs=(), edge_docs=()):
+        """Merge upserted graph_nodes / graph_edges documents into the loaded graph.
+
+        Active documents add or replace nodes and edges; inactive ones
+        remove them. Only the given documents are read, instead of reloading
+        everything from MongoDB, and the graph is patched rather than
+        rebuilt: the spatial index moves just the changed points, building
+        routes the change cannot affect are kept, and the contraction
+        hierarchy is marked stale (A* serves routes until it has been
+        rebuilt in the background). A node that joins the graph also gets
+        back its stored active edges, which were dropped with it or skipped
+        while it was missing (except on snapshot / file graphs, whose edges
+        don't live in MongoDB). If the graph now reaches past the area
+        obstacles were last read for, they are read again.
+        """
+        async with self._graph_lock():
+            await self._patch_graph(node_docs, edge_docs)
+        await self._reload_obstacles_if_outgrown()
+            
+    async def _patch_graph(self, node_docs, edge_docs):
+        nodes, removed_nodes, edges, removed_edges = [], [], [], []
+        building_nodes = dict(self.building_nodes)
+        for doc in node_docs:
+            node_id = doc["nodeId"]
+            # A node's building entry follows its latest document
+            building_nodes = {name: nid for name, nid in building_nodes.items() if nid != node_id}
+            if not doc.get("active", True):
+                removed_nodes.append(node_id)
+                continue
+            name = doc.get("name") or ""
+            node_type = doc.get("type", "waypoint")
+            nodes.append((node_id, name, node_type, doc["coordinates"]["lat"], doc["coordinates"]["lng"]))
+            building = building_name(name, node_type)
+            if building is not None:
+                building_nodes[building] = node_id
+        arriving = [node_id for node_id, *_ in nodes if self.graph is None or self.graph.index_of(node_id) is None]
+        if arriving and self.graph_source not in ("snapshot", "file"):
+            # Edges are dropped with their nodes (or skipped while an end was
+            # missing), so re-read the stored ones of nodes that (re)appear;
+            # the given documents still take precedence
+            ends = {"$in": arriving}
+            stored = edges_collection.find({"active": True, "$or": [{"from": ends}, {"to": ends}]})
+            edge_docs = [doc async for doc in stored] + list(edge_docs)
+        for doc in edge_docs:
+            if doc.get("active", True):
+                edges.append((doc["edgeId"], doc["from"], doc["to"], doc.get("name") or ""))
+            else:
+                removed_edges.append(doc["edgeId"])
+
+        base = self.graph if self.graph is not None else CompiledGraph.build([], [], [], [], [], [])
+        spatial_index = self.spatial_index
+        
+        def build():
+            graph, delta = base.patched(nodes, removed_nodes, edges, removed_edges)
+            if spatial_index is not None and graph.num_nodes:
+                # Move the changed points instead of rebuilding the tree
+                moved_index = spatial_index.moved(graph.lat, graph.lng, delta["remap"], delta["moved"])
+            else:
+                moved_index = None
+            return self._prepare_graph(graph, building_nodes, moved_index), delta
+        
+        prepared, delta = await asyncio.to_thread(build)
+        # Keep the building routes the change can't affect (tables are only touched on the event loop)
+        graph = prepared["graph"]
+        touched = np.union1d(delta["moved"], delta["cut"]).tolist()
+        shortened = self._shortcut_test(graph, delta)
+        for profile, matrix in self.route_matrices.items():
+            fresh = prepared["route_matrices"].get(profile)
+            if fresh is None or profile not in self.penalties:
+                continue
+            matrix.sync(self.penalties[profile])
+            prepared["route_matrices"][profile] = matrix.rebased(fresh.buildings, delta["remap"], touched, shortened, epoch=fresh.epoch)
+        self._install_graph(prepared)
+        
+    @staticmethod
+    def _shortcut_test(graph: CompiledGraph, delta: Dict) -> Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]:
+        """shortened(starts, goals, costs) for RouteMatrix.rebased.
+
+        The edges that can make a route shorter are the added ones and every
+        edge of a moved node. A route s -> t using edge a - b costs at least
+        |s a| + w(a, b) + |b t| in straight-line meters (obstacles only add
+        cost), so a pair is flagged when that bound is below its cost.
+        """
+        a, b = (np.asarray(side, dtype=np.int64) for side in delta["added_edges"])
+        moved = np.asarray(delta["moved"], dtype=np.int64)
+        degrees = graph.offsets[moved + 1] - graph.offsets[moved]
+        slots = np.concatenate([np.arange(lo, hi) for lo, hi in zip(graph.offsets[moved], graph.offsets[moved + 1])] or [np.zeros(0, dtype=np.int64)])
+        a = np.concatenate([a, np.repeat(moved, degrees)])
+        b = np.concatenate([b, np.asarray(graph.targets)[slots]])
+        if not len(a):
+            return lambda starts, goals, costs: np.zeros(len(costs), dtype=bool)
+        w = haversine_array(graph.lat[a], graph.lng[a], graph.lat[b], graph.lng[b])
+        
+        def shortened(starts, goals, costs):
+            if len(a) * len(starts) > SHORTCUT_TEST_MAX_PAIRS:
+                return np.ones(len(costs), dtype=bool)  # Too many to check; recompute everything
+            lat, lng = graph.lat, graph.lng
+            to_a = haversine_array(lat[starts][:, None], lng[starts][:, None], lat[a][None, :], lng[a][None, :])
+            to_b = haversine_array(lat[starts][:, None], lng[starts][:, None], lat[b][None, :], lng[b][None, :])
+            from_a = haversine_array(lat[a][None, :], lng[a][None, :], lat[goals][:, None], lng[goals][:, None])
+            from_b = haversine_array(lat[b][None, :], lng[b][None, :], lat[goals][:, None], lng[goals][:, None])
+            bound = np.minimum(to_a + w + from_b, to_b + w + from_a).min(axis=1)
+            # Edge weights are float32, so leave a little slack before trusting a bound
+            return bound < costs * (1 + 1e-5) + 1e-3
+        return shortened
+        
+    def _graph_lock(self) -> asyncio.Lock:
+        """Serializes graph replacements so a patch never builds on a graph that is being replaced"""
+        if self._graph_lock_instance is None:
+            self._graph_lock_instance = asyncio.Lock()
+        return self._graph_lock_instance
+        
+    async def _swap_graph(self, build):
+        """Run build() -> (graph, building_nodes) and the index builds off the event loop, then install"""
+        prepared = await asyncio.to_thread(lambda: self._prepare_graph(*build()))
+        self._install_graph(prepared)
+        
+    def _prepare_graph(self, graph: CompiledGraph, building_nodes: Dict[str, str], spatial_index: Optional[SpatialIndex] = None) -> Dict:
+        """Everything derived from a graph, built without touching the live state (spatial_index is reused if given)"""
+        penalties = {profile: EdgePenalties(graph) for profile in self.cost_model.profiles}
+        if spatial_index is None and graph.num_nodes:
+            spatial_index = SpatialIndex(graph.lat, graph.lng)
+        return {
+            "graph": graph,
+            "building_nodes": building_nodes,
+            "spatial_index": spatial_index,
+            "penalties": penalties,
+            "route_matrices": self._build_route_matrices(graph, building_nodes, penalties),
+        }
+        
+    def _install_graph(self, prepared: Dict):
+        """Switch routing to a prepared graph in one step (no awaits in between)"""
+        self.graph = prepared["graph"]
+        self.building_nodes = prepared["building_nodes"]
+        self.spatial_index = prepared["spatial_index"]
+        # Routes use A* until the hierarchy for this graph has been contracted
+        self.contraction_hierarchy = None
+        self._start_hierarchy_build()
+        self.penalties = prepared["penalties"]
+        self.route_matrices = prepared["route_matrices"]
+        self.graph_version += 1
+        # Known obstacles are located against the new graph; the route
+        # matrices pick the resulting penalty changes up on their next sync
+        self.obstacle_index.reindex()
+        
+    def _start_hierarchy_build(self):
+        """Contract the live graph in the background (inline when there is no event loop, e.g. in scripts)"""
+        if not self.use_contraction_hierarchy:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.contraction_hierarchy = ContractionHierarchy(self.graph)
+            return
+        task = self._hierarchy_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._hierarchy_task = asyncio.ensure_future(self._build_hierarchy())
+        
+    async def _build_hierarchy(self):
+        """Contract the live graph off the event loop, again if it was replaced meanwhile"""
+        while self.graph is not None and self.contraction_hierarchy is None:
+            graph = self.graph
+            try:
+                hierarchy = await _in_daemon_thread(ContractionHierarchy, graph)
+            except Exception as e:
+                print(f"⚠️ Contraction hierarchy build failed, routing with A*: {e}")
+                return
+            if self.graph is graph:
+                self.contraction_hierarchy = hierarchy
+                print(f"✅ Contraction hierarchy ready: {hierarchy.num_shortcuts} shortcuts")
         
-    async def initialize(self):
-        """Load graph data from MongoDB"""
-        await self._load_nodes()
-        await self._load_edges()
-        self._build_kdtree()
+    def route_epoch(self) -> Tuple[int, int]:
+        """Changes whenever a route could change: (graph version, obstacle epoch)"""
+        return self.graph_version, self.obstacle_index.epoch
+        
+    async def graph_geojson(self, kind: str) -> Optional[Tuple[str, bytes]]:
+        """(etag, GeoJSON body) for the loaded graph's "nodes" or "edges", or None if no graph is loaded"""
+        graph, version = self.graph, self.graph_version
+        if graph is None:
+            return None
+        return await asyncio.to_thread(self._geojson_cache.get, kind, graph, version)
+        
+    def _build_route_matrices(self, graph: CompiledGraph, building_nodes: Dict[str, str], penalties: Dict[str, EdgePenalties]) -> Dict[str, RouteMatrix]:
+        """Tables of routes between building pairs, filled on first use (skipped for very large building sets)"""
+        building_indices = {graph.index_of(node_id) for node_id in building_nodes.values()}
+        building_indices.discard(None)
+        if len(building_indices) > ROUTE_MATRIX_MAX_BUILDINGS:
+            return {}
+        return {profile: RouteMatrix(building_indices, epoch=p.epoch) for profile, p in penalties.items()}
         
     async def _load_nodes(self):
-        """Load all active nodes from MongoDB"""
+        """Load all active nodes from MongoDB as column lists"""
         cursor = nodes_collection.find({"active": True})
-        self.nodes = {}
-        self.building_nodes = {}
-        self.node_coords = []
-        self.node_ids = []
+        building_nodes = {}
+        node_ids, names, types, lats, lngs = [], [], [], [], []
         
         async for node_doc in cursor:
             node_id = node_doc["nodeId"]
             coords = node_doc["coordinates"]
-            lat, lng = coords["lat"], coords["lng"]
             name = node_doc["name"]
             node_type = node_doc.get("type", "waypoint")
             
-            self.nodes[node_id] = {
-                "id": node_id,
-                "coords": (lat, lng),
-                "name": name,
-                "type": node_type,
-                "neighbors": []
-            }
-            
-            self.node_coords.append([lat, lng])
-            self.node_ids.append(node_id)
+            node_ids.append(node_id)
+            names.append(name)
+            types.append(node_type)
+            lats.append(coords["lat"])
+            lngs.append(coords["lng"])
             
             # If this is a building entrance, add it to building_nodes
-            if node_type == "building" or "entrance" in name.lower():
-                # Use the building name as the key (clean it up)
-                building_name = name.lower().strip()
-                self.building_nodes[building_name] = node_id
+            building = building_name(name, node_type)
+            if building is not None:
+                building_nodes[building] = node_id
+                
+        return (node_ids, names, types, lats, lngs), building_nodes
                 
     async def _load_edges(self):
-        """Load all active edges from MongoDB and build adjacency lists"""
+        """Load all active edges from MongoDB as columns: (from, to) node ID pairs, edge IDs, names"""
         cursor = edges_collection.find({"active": True})
-        
+        edges, edge_ids, edge_names = [], [], []
         async for edge_doc in cursor:
-            from_node = edge_doc["from"]
-            to_node = edge_doc["to"]
-            
-            # Add bidirectional connections
-            if from_node in self.nodes:
-                self.nodes[from_node]["neighbors"].append(to_node)
-            if to_node in self.nodes:
-                self.nodes[to_node]["neighbors"].append(from_node)
+            edges.append((edge_doc["from"], edge_doc["to"]))
+            edge_ids.append(edge_doc["edgeId"])
+            edge_names.append(edge_doc.get("name") or "")
+        return edges, edge_ids, edge_names
                 
-    def _build_kdtree(self):
-        """Build KDTree for spatial queries"""
-        if self.node_coords:
-            self.kd_tree = KDTree(np.array(self.node_coords))
-            
     def find_nearest_node(self, lat: float, lng: float) -> Optional[str]:
         """Find the nearest node to given coordinates"""
-        if not self.kd_tree:
+        if not self.spatial_index:
             return None
             
-        dist, idx = self.kd_tree.query([lat, lng])
-        return self.node_ids[idx]
+        dist, idx = self.spatial_index.query(lat, lng)
+        return self.graph.node_ids[idx[0, 0]]
         
     def get_building_node(self, building_name: str) -> Optional[str]:
         """Get node ID for a building by name"""
@@ -105,28 +390,81 @@ class NavigationService:
         
         return c * r
         
-    async def get_blocked_nodes(self) -> set:
-        """Get set of node IDs that are blocked by obstacles"""
-        blocked_nodes = set()
-        cursor = obstacles_collection.find({"active": True, "ai_verified": True})
+    def _nodes_near_obstacles(self, coords: List[Tuple[float, float]]) -> List[set]:
+        """Node IDs affected by each obstacle: every node within OBSTACLE_RADIUS_M meters"""
+        if self.spatial_index is None or not coords:
+            return [set() for _ in coords]
+        lats, lngs = zip(*coords)
+        matches = self.spatial_index.query_radius(lats, lngs, OBSTACLE_RADIUS_M)
+        node_ids = self.graph.node_ids
+        return [{node_ids[i] for i in m.tolist()} for m in matches]
+        
+    def _graph_bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """(min_lng, min_lat, max_lng, max_lat) of the loaded graph, or None without nodes"""
+        if self.graph is None or not self.graph.num_nodes:
+            return None
+        lat, lng = self.graph.lat, self.graph.lng
+        return float(lng.min()), float(lat.min()), float(lng.max()), float(lat.max())
+        
+    def _obstacle_region(self) -> Optional[Dict]:
+        """Server-side filter for obstacles close enough to the graph to affect any node.
+
+        None (read every obstacle) until the location migration has run,
+        as older obstacles without location would never match $geoWithin.
+        """
+        bounds = self._graph_bounds() if obstacle_locations_migrated() else None
+        self._obstacle_bounds = bounds
+        if bounds is None:
+            return None
+        return geo_within_bbox(*bounds, margin_m=OBSTACLE_RADIUS_M)
+        
+    async def _reload_obstacles_if_outgrown(self):
+        """Read obstacles again if the graph has grown past the bounds the last read was limited to"""
+        old, new = self._obstacle_bounds, self._graph_bounds()
+        if old is None or new is None:
+            return
+        if new[0] < old[0] or new[1] < old[1] or new[2] > old[2] or new[3] > old[3]:
+            await self.obstacle_index.load()
         
-        async for obstacle in cursor:
-            coords = obstacle["coords"]
-            lat, lng = coords["lat"], coords["lng"]
+    def _apply_obstacle(self, obstacle_id: str, entry: Optional[Dict]):
+        """Update every profile's edge penalties for one changed obstacle"""
+        if self.graph is None:
+            return
+        for profile, penalties in self.penalties.items():
+            if entry is None:
+                penalties.clear_obstacle(obstacle_id)
+                continue
+            nodes = {self.graph.index_of(node_id) for node_id in entry["nodes"]}
+            nodes.discard(None)
+            penalties.set_obstacle(obstacle_id, nodes, self.cost_model.multiplier(entry["fields"], profile))
             
-            # Find nearest node to obstacle
-            nearest_node = self.find_nearest_node(lat, lng)
-            if nearest_node:
-                # Check if obstacle is close enough to block the node (within 10 meters)
-                node_coords = self.nodes[nearest_node]["coords"]
-                distance = self.haversine_distance((lat, lng), node_coords)
-                if distance <= 10:  # 10 meter threshold
-                    blocked_nodes.add(nearest_node)
-                    
-        return blocked_nodes
+    async def get_blocked_nodes(self, profile: str = "default") -> set:
+        """Get set of node IDs that obstacles make impassable for a profile (served from memory)"""
+        penalties = self.penalties.get(profile)
+        if penalties is None:
+            return set()
+        return {self.graph.node_ids[i] for i in penalties.blocked_nodes()}
+        
+    def on_obstacle_reported(self, obstacle_doc: Dict):
+        """Hook for handlers that write obstacles, so routing sees them immediately"""
+        self.obstacle_index.upsert(obstacle_doc)
+        
+    def start_obstacle_sync(self):
+        """Keep the obstacle index current in the background"""
+        self.obstacle_index.start()
         
-    async def find_path(self, start_building: str, end_building: str) -> Optional[Dict]:
-        """Find path between two buildings using Dijkstra's algorithm"""
+    async def stop_obstacle_sync(self):
+        await self.obstacle_index.stop()
+        
+    async def find_path(self, start_building: str, end_building: str, algorithm: Optional[str] = None, profile: str = "default") -> Optional[Dict]:
+        """Find path between two buildings.
+
+        algorithm is "ch", "astar" or "dijkstra". By default the Contraction
+        Hierarchies engine is used when it has been built, otherwise A*.
+        profile selects the obstacle cost rules (see cost_model.PROFILES).
+        """
+        if profile not in self.cost_model.profiles:
+            raise ValueError(f"Unknown routing profile: {profile}")
         # Get node IDs for buildings
         start_node_id = self.get_building_node(start_building)
         end_node_id = self.get_building_node(end_building)
@@ -135,68 +473,355 @@ class NavigationService:
             return None
             
         # Get blocked nodes from obstacles
-        blocked_nodes = await self.get_blocked_nodes()
+        blocked_nodes = await self.get_blocked_nodes(profile)
+        
+        graph = self.graph
+        start, goal = graph.index_of(start_node_id), graph.index_of(end_node_id)
+        route_matrix = self.route_matrices.get(profile)
+        
+        if algorithm is None and route_matrix is not None and (start, goal) in route_matrix:
+            # Serve from the building table, recomputing entries the obstacles touched
+            penalties = self.penalties[profile]
+            def compute():
+                path = self._route(start, goal, None, profile)
+                return None if path is None else (self._path_cost(path, penalties.weights), path)
+            entry = route_matrix.route(start, goal, penalties, compute)
+            path = entry[1] if entry else None
+        else:
+            path = self._route(start, goal, algorithm, profile)
+        if path is None:
+            return None  # No path found
+            
+        return {
+            "path_nodes": [graph.node_ids[i] for i in path],
+            # GeoJSON format [lng, lat]
+            "coordinates": np.column_stack([graph.lng[path], graph.lat[path]]).tolist(),
+            "start_building": start_building,
+            "end_building": end_building,
+            "blocked_nodes": list(blocked_nodes)
+        }
+        
+    def snap_points(self, coords: List[Tuple[float, float]]) -> List[Dict]:
+        """Project (lat, lng) points onto their nearest graph edge (see snapping.snap_to_edges)"""
+        if self.spatial_index is None or not coords:
+            return []
+        lats, lngs = zip(*coords)
+        snaps = snap_to_edges(self.graph, self.spatial_index, lats, lngs)
+        keys = ("u", "v", "slot", "t", "lat", "lng", "distance_m")
+        return [dict(zip(keys, values)) for values in zip(*(snaps[key].tolist() for key in keys))]
         
-        # Dijkstra's algorithm
-        distances = {node_id: float('inf') for node_id in self.nodes}
-        distances[start_node_id] = 0
+    def _snap_costs(self, snap: Dict, blocked: set) -> Dict[int, float]:
+        """Cost from a snapped position to each end of its edge that is not blocked.
+
+        The partial leg is costed with the plain edge length. Penalties
+        belong to the edge's end nodes, and a penalised weight can be
+        infinite, which would make even a position right on a free node
+        unusable. A blocked end is never offered as a place to start or
+        finish.
+        """
+        if snap["slot"] < 0:
+            costs = {snap["u"]: 0.0}
+        else:
+            length = float(self.graph.weights[snap["slot"]])
+            costs = {snap["u"]: snap["t"] * length, snap["v"]: (1 - snap["t"]) * length}
+        return {node: cost for node, cost in costs.items() if node not in blocked}
+        
+    def _snap_info(self, snap: Dict) -> Dict:
+        node_ids = self.graph.node_ids
+        return {
+            "lat": snap["lat"],
+            "lng": snap["lng"],
+            "distance_m": snap["distance_m"],
+            "edge": [node_ids[snap["u"]], node_ids[snap["v"]]],
+        }
+        
+    def _point_route(self, path: List[int], origin: Dict, destination: Optional[Dict] = None) -> Dict:
+        """Route result for a node path that starts (and optionally ends) at snapped positions"""
+        graph = self.graph
+        coordinates = np.column_stack([graph.lng[path], graph.lat[path]]).tolist()
+        coordinates.insert(0, [origin["lng"], origin["lat"]])
+        if destination is not None:
+            coordinates.append([destination["lng"], destination["lat"]])
+        lngs, lats = np.asarray(coordinates).T
+        return {
+            "path_nodes": [graph.node_ids[i] for i in path],
+            # GeoJSON format [lng, lat], from the snapped origin
+            "coordinates": coordinates,
+            "distance_m": float(haversine_array(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum()),
+            "origin_snap": self._snap_info(origin),
+            "destination_snap": self._snap_info(destination) if destination is not None else None,
+        }
+        
+    async def find_path_from_point(self, origin: Tuple[float, float], destination: Optional[Tuple[float, float]] = None,
+                                   end_building: Optional[str] = None, profile: str = "default") -> Optional[Dict]:
+        """Route from a GPS position to a building or to another GPS position.
+
+        Both positions are snapped onto their nearest edge, so the route
+        starts part-way along a street rather than at the closest node.
+        Searches with A* over the profile's obstacle-adjusted weights.
+        """
+        if profile not in self.cost_model.profiles:
+            raise ValueError(f"Unknown routing profile: {profile}")
+        if (destination is None) == (end_building is None):
+            raise ValueError("Give exactly one of destination and end_building")
+        if self.graph is None or self.spatial_index is None:
+            return None
+        penalties = self.penalties[profile]
+        blocked = penalties.blocked_nodes()
+        
+        if end_building is not None:
+            goal_id = self.get_building_node(end_building)
+            goal = self.graph.index_of(goal_id) if goal_id else None
+            if goal is None:
+                return None
+            origin_snap, = self.snap_points([origin])
+            goals, destination_snap = {goal: 0.0}, None
+            heuristic = self.graph.distances_to(goal)
+        else:
+            origin_snap, destination_snap = self.snap_points([origin, destination])
+            goals = self._snap_costs(destination_snap, blocked)
+            heuristic = haversine_array(self.graph.lat, self.graph.lng, destination_snap["lat"], destination_snap["lng"])
+            
+        sources = self._snap_costs(origin_snap, blocked)
+        found = self._search_between(sources, goals, blocked, penalties.weights, heuristic)
+        if destination_snap is not None and {origin_snap["u"], origin_snap["v"]} == {destination_snap["u"], destination_snap["v"]}:
+            # Both on one edge: walking along it may beat leaving via either end
+            same_direction = origin_snap["u"] == destination_snap["u"]
+            t_destination = destination_snap["t"] if same_direction else 1 - destination_snap["t"]
+            direct = abs(origin_snap["t"] - t_destination) * float(self.graph.weights[origin_snap["slot"]]) if origin_snap["slot"] >= 0 else 0.0
+            if not ({origin_snap["u"], origin_snap["v"]} & blocked) and (found is None or direct <= found[1]):
+                return self._point_route([], origin_snap, destination_snap)
+        if found is None:
+            return None
+        return self._point_route(found[0], origin_snap, destination_snap)
+        
+    async def find_paths_to_building(self, origins: List[Tuple[float, float]], end_building: str, profile: str = "default") -> Optional[List[Optional[Dict]]]:
+        """Routes from many GPS positions to one building with a single search.
+
+        Runs one Dijkstra outward from the building (edge weights are
+        symmetric, so its tree read backwards gives every origin's route)
+        and stops once the ends of every snapped edge are settled. Returns
+        None for an unknown building, and None entries for unreachable origins.
+        """
+        if profile not in self.cost_model.profiles:
+            raise ValueError(f"Unknown routing profile: {profile}")
+        goal_id = self.get_building_node(end_building)
+        if self.graph is None or self.spatial_index is None or not goal_id:
+            return None
+        goal = self.graph.index_of(goal_id)
+        if goal is None:
+            return None
+        blocked = self.penalties[profile].blocked_nodes()
+        snaps = self.snap_points(origins)
+        costs = [self._snap_costs(snap, blocked) for snap in snaps]
+        targets = {node for cost in costs for node in cost}
+        distances, previous = self._shortest_path_tree(goal, targets, profile=profile)
+        
+        routes = []
+        for snap, cost in zip(snaps, costs):
+            reachable = [(distances[node] + extra, node) for node, extra in cost.items() if node in distances]
+            if not reachable:
+                routes.append(None)
+                continue
+            _, node = min(reachable)
+            path = [node]
+            while path[-1] != goal:
+                path.append(previous[path[-1]])
+            routes.append(self._point_route(path, snap))
+        return routes
+        
+    def _search_between(self, sources: Dict[int, float], goals: Dict[int, float], blocked: set,
+                        weights: np.ndarray, heuristic: np.ndarray) -> Optional[Tuple[List[int], float]]:
+        """A* from several seeded start nodes to several goal nodes, each with an extra cost.
+
+        heuristic holds a lower bound on the remaining cost for every node.
+        Returns (node path, total cost) of the cheapest seed-to-goal route,
+        or None if no goal is reachable.
+        """
+        graph = self.graph
+        offsets, targets = graph.offsets, graph.targets
+        heuristic = (np.asarray(heuristic) * (1 - 1e-6)).tolist()
+        distances, previous, visited = {}, {}, set()
+        pq = []
+        for node, cost in sources.items():
+            if node not in blocked and math.isfinite(cost):
+                distances[node] = cost
+                heapq.heappush(pq, (cost + heuristic[node], node))
+        best, best_node = math.inf, None
+        
+        while pq:
+            priority, current = heapq.heappop(pq)
+            if priority >= best:
+                break  # No remaining route can beat the best one found
+            if current in visited:
+                continue
+            visited.add(current)
+            current_dist = distances[current]
+            if current in goals and current_dist + goals[current] < best:
+                best, best_node = current_dist + goals[current], current
+                
+            lo, hi = offsets[current], offsets[current + 1]
+            for neighbor, edge_weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+                if neighbor in visited or neighbor in blocked:
+                    continue
+                new_distance = current_dist + edge_weight
+                if new_distance < distances.get(neighbor, math.inf):
+                    distances[neighbor] = new_distance
+                    previous[neighbor] = current
+                    heapq.heappush(pq, (new_distance + heuristic[neighbor], neighbor))
+                    
+        if best_node is None:
+            return None
+        path = [best_node]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path, best
+        
+    def _route(self, start: int, goal: int, algorithm: Optional[str] = None, profile: str = "default") -> Optional[List[int]]:
+        """Dispatch a node index query to the requested routing engine"""
+        if algorithm is None:
+            algorithm = "ch" if self.contraction_hierarchy else "astar"
+        if algorithm not in ROUTING_ALGORITHMS:
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+        penalties = self.penalties[profile]
+        blocked = penalties.blocked_nodes()
+            
+        if algorithm == "ch" and self.contraction_hierarchy:
+            if start in blocked or goal in blocked:
+                return None
+            result = self.contraction_hierarchy.query(start, goal)
+            if result is None:
+                return None  # Unreachable even without obstacles
+            path = result[1]
+            # The hierarchy ignores obstacles. Penalties only ever raise edge
+            # weights, so its route is still optimal if no obstacle touches it
+            # (shortcuts are unpacked, so hidden intermediate nodes are checked
+            # too); otherwise search with the adjusted weights.
+            if penalties.affected_nodes().isdisjoint(path):
+                return path
+            algorithm = "astar"
+        elif algorithm == "ch":
+            algorithm = "astar"  # Hierarchy not built
+            
+        return self._search(start, goal, blocked, algorithm, penalties.weights)
+        
+    def _path_cost(self, path: List[int], weights: np.ndarray) -> float:
+        """Cost of a node index path of self.graph over CSR weights (lightest parallel edge per hop)"""
+        graph = self.graph
+        total = 0.0
+        for u, v in zip(path, path[1:]):
+            lo, hi = graph.offsets[u], graph.offsets[u + 1]
+            total += float(weights[lo:hi][graph.targets[lo:hi] == v].min())
+        return total
+        
+    def _shortest_path_tree(self, source: int, targets=None, profile: str = "default",
+                            graph: Optional[CompiledGraph] = None, penalties: Optional[EdgePenalties] = None) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """Dijkstra from source over a profile's obstacle-adjusted graph, returning (distances, previous).
+
+        Stops early once every node in targets has been settled. graph and
+        penalties default to the live graph and the profile's penalties.
+        """
+        graph = graph if graph is not None else self.graph
+        penalties = penalties if penalties is not None else self.penalties[profile]
+        blocked = penalties.blocked_nodes()
+        if source in blocked:
+            return {}, {}
+        offsets, targets_arr, weights = graph.offsets, graph.targets, penalties.weights
+        remaining = set(targets) if targets is not None else None
+        distances = {source: 0.0}
+        previous = {}
+        visited = set()
+        pq = [(0.0, source)]
+        
+        while pq:
+            current_dist, current = heapq.heappop(pq)
+            if current in visited:
+                continue
+            visited.add(current)
+            if remaining is not None:
+                remaining.discard(current)
+                if not remaining:
+                    break
+                    
+            lo, hi = offsets[current], offsets[current + 1]
+            for neighbor, edge_weight in zip(targets_arr[lo:hi].tolist(), weights[lo:hi].tolist()):
+                if neighbor in visited or neighbor in blocked:
+                    continue
+                new_distance = current_dist + edge_weight
+                if new_distance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = new_distance
+                    previous[neighbor] = current
+                    heapq.heappush(pq, (new_distance, neighbor))
+                    
+        # Only settled nodes have final distances
+        return {node: distances[node] for node in visited}, previous
+        
+    def _search(self, start: int, goal: int, blocked: set, algorithm: str = "astar", weights: Optional[np.ndarray] = None) -> Optional[List[int]]:
+        """Shortest path between two node indices of self.graph, or None if unreachable.
+
+        "astar" uses the straight-line haversine distance to the goal as its
+        heuristic. It never overestimates the remaining walking distance
+        (obstacle penalties only make edges longer), so the first time the
+        goal is popped its cost is optimal. "dijkstra" is the same search
+        with a zero heuristic. weights defaults to the plain edge lengths.
+        """
+        if algorithm not in ("astar", "dijkstra"):
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+        graph = self.graph
+        offsets, targets = graph.offsets, graph.targets
+        if weights is None:
+            weights = graph.weights
+        
+        if algorithm == "astar":
+            # Edge weights are float32, so shave the heuristic slightly to keep
+            # it a strict lower bound on the rounded path cost
+            heuristic = (graph.distances_to(goal) * (1 - 1e-6)).tolist()
+        else:
+            heuristic = None
+            
+        # Only nodes we actually reach get a distance entry
+        distances = {start: 0.0}
         previous = {}
         visited = set()
         
-        # Priority queue: (distance, node_id)
-        pq = [(0, start_node_id)]
+        # Priority queue: (distance + heuristic, node index)
+        pq = [(heuristic[start] if heuristic else 0.0, start)]
         
         while pq:
-            current_dist, current_node = heapq.heappop(pq)
+            _, current = heapq.heappop(pq)
             
-            if current_node in visited or current_node in blocked_nodes:
+            if current in visited or current in blocked:
                 continue
                 
-            visited.add(current_node)
+            visited.add(current)
             
-            if current_node == end_node_id:
+            if current == goal:
                 # Reconstruct path
-                path = []
-                while current_node is not None:
-                    path.append(current_node)
-                    current_node = previous.get(current_node)
+                path = [current]
+                while current in previous:
+                    current = previous[current]
+                    path.append(current)
                 path.reverse()
+                return path
                 
-                # Convert to coordinates for frontend
-                coordinates = []
-                for node_id in path:
-                    lat, lng = self.nodes[node_id]["coords"]
-                    coordinates.append([lng, lat])  # GeoJSON format [lng, lat]
-                    
-                return {
-                    "path_nodes": path,
-                    "coordinates": coordinates,
-                    "start_building": start_building,
-                    "end_building": end_building,
-                    "blocked_nodes": list(blocked_nodes)
-                }
-                
+            current_dist = distances[current]
+            lo, hi = offsets[current], offsets[current + 1]
+            
             # Check neighbors
-            for neighbor_id in self.nodes[current_node]["neighbors"]:
-                if neighbor_id in visited or neighbor_id in blocked_nodes:
+            for neighbor, edge_weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+                if neighbor in visited or neighbor in blocked:
                     continue
                     
-                if neighbor_id not in self.nodes:
-                    continue
-                    
-                # Calculate distance to neighbor
-                current_coords = self.nodes[current_node]["coords"]
-                neighbor_coords = self.nodes[neighbor_id]["coords"]
-                edge_weight = self.haversine_distance(current_coords, neighbor_coords)
-                
-                new_distance = distances[current_node] + edge_weight
+                new_distance = current_dist + edge_weight
                 
-                if new_distance < distances[neighbor_id]:
-                    distances[neighbor_id] = new_distance
-                    previous[neighbor_id] = current_node
-                    heapq.heappush(pq, (new_distance, neighbor_id))
+                if new_distance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = new_distance
+                    previous[neighbor] = current
+                    priority = new_distance + heuristic[neighbor] if heuristic else new_distance
+                    heapq.heappush(pq, (priority, neighbor))
                     
-        return None  # No path found
+        return None
 
 # Global navigation service instance
 navigation_service = NavigationService()
@@ -0,0 +1,173 @@
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+import asyncio
+import os
+
+from navigation.single_flight import SingleFlight
+
+OBSTACLE_FILTER = {"active": True, "ai_verified": True}
+COST_FIELDS = ("severity", "obstacle_type", "ai_confidence")  # Fields the routing cost model reads
+POLL_INTERVAL_SECONDS = float(os.getenv("NAV_OBSTACLE_POLL_SECONDS", "10"))
+
+
+class ObstacleIndex:
+    """In-memory view of active, AI-verified obstacles and the nodes they touch.
+
+    The index is loaded once from the obstacles collection and then kept
+    current incrementally: from a MongoDB change stream when the deployment
+    supports one, otherwise by polling, plus explicit upsert()/remove()
+    calls from the API handlers that write obstacles. Routing reads it
+    without touching the database.
+
+    locate_many maps a list of obstacle (lat, lng) pairs to the node ids
+    each one touches, so a batch of obstacles is resolved in one call.
+    on_change(obstacle_id, entry) is called after every add, move or
+    update with the new entry, and with None after a removal. region(),
+    if given, returns an extra filter for the scans (e.g. a $geoWithin
+    around the graph) so the server skips obstacles routing can't touch.
+    """
+
+    def __init__(
+        self,
+        collection,
+        locate_many: Callable[[Sequence[Tuple[float, float]]], List[Set[str]]],
+        on_change: Optional[Callable[[str, Optional[Dict]], None]] = None,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+        region: Optional[Callable[[], Optional[Dict]]] = None,
+    ):
+        self.collection = collection
+        self.locate_many = locate_many
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.region = region
+        # obstacle id -> {"coords": (lat, lng), "fields": {...COST_FIELDS}, "nodes": set}
+        self.obstacles: Dict[str, Dict] = {}
+        self.epoch = 0  # Bumped on every change
+        self.mode = "idle"  # "change_stream", "polling" or "idle"
+        self._task: Optional[asyncio.Task] = None
+        self.load_flight = SingleFlight()
+
+    async def load(self):
+        """Replace the index with a full scan of the collection.
+
+        Overlapping calls (startup, polling, refreshes) share the scan that
+        is already running instead of each starting their own.
+        """
+        await self.load_flight.do("load", self._load)
+
+    async def _load(self):
+        docs = {}
+        query = dict(OBSTACLE_FILTER)
+        if self.region is not None:
+            query.update(self.region() or {})
+        async for doc in self.collection.find(query):
+            docs[str(doc["_id"])] = doc
+        for obstacle_id in list(self.obstacles):
+            if obstacle_id not in docs:
+                self.remove(obstacle_id)
+        self.upsert_many(docs.values())
+
+    def reindex(self):
+        """Re-resolve every obstacle against the current graph (after a graph reload)"""
+        entries = list(self.obstacles.items())
+        located = self.locate_many([entry["coords"] for _, entry in entries])
+        for (obstacle_id, entry), nodes in zip(entries, located):
+            self._replace(obstacle_id, entry["coords"], entry["fields"], nodes)
+
+    def upsert(self, doc: Dict):
+        """Add, move or drop one obstacle document depending on its current state"""
+        self.upsert_many([doc])
+
+    def upsert_many(self, docs):
+        """upsert() for a batch of documents, locating new or moved obstacles together"""
+        pending = []
+        for doc in docs:
+            obstacle_id = str(doc["_id"])
+            if not all(doc.get(key) == value for key, value in OBSTACLE_FILTER.items()):
+                self.remove(obstacle_id)
+                continue
+            coords = doc["coords"]
+            coords = (coords["lat"], coords["lng"])
+            fields = {key: doc.get(key) for key in COST_FIELDS}
+            entry = self.obstacles.get(obstacle_id)
+            if entry is None or entry["coords"] != coords:
+                pending.append((obstacle_id, coords, fields))
+            elif entry["fields"] != fields:
+                self._replace(obstacle_id, coords, fields, entry["nodes"])
+        if not pending:
+            return
+        located = self.locate_many([coords for _, coords, _ in pending])
+        for (obstacle_id, coords, fields), nodes in zip(pending, located):
+            self._replace(obstacle_id, coords, fields, nodes)
+
+    def remove(self, obstacle_id: str):
+        """Forget an obstacle (no-op if unknown)"""
+        obstacle_id = str(obstacle_id)
+        if self.obstacles.pop(obstacle_id, None) is not None:
+            self._changed(obstacle_id, None)
+
+    def apply_change(self, change: Dict):
+        """Apply one change stream event"""
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                # Document deleted again before the lookup ran
+                self.remove(change["documentKey"]["_id"])
+            else:
+                self.upsert(doc)
+        elif operation == "delete":
+            self.remove(change["documentKey"]["_id"])
+        elif operation in ("drop", "invalidate"):
+            for obstacle_id in list(self.obstacles):
+                self.remove(obstacle_id)
+
+    def start(self):
+        """Start background sync (change stream, falling back to polling)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sync())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.mode = "idle"
+
+    async def _sync(self):
+        try:
+            await self._watch_changes()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Obstacle change stream unavailable ({e}), polling every {self.poll_interval}s")
+        await self._poll()
+
+    async def _watch_changes(self):
+        async with self.collection.watch(full_document="updateLookup") as stream:
+            self.mode = "change_stream"
+            # Catch anything written between the initial load and opening the stream
+            await self.load()
+            async for change in stream:
+                self.apply_change(change)
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"⚠️ Obstacle poll failed: {e}")
+
+    def _replace(self, obstacle_id: str, coords, fields: Dict, nodes: Set[str]):
+        entry = {"coords": coords, "fields": fields, "nodes": set(nodes)}
+        self.obstacles[obstacle_id] = entry
+        self._changed(obstacle_id, entry)
+
+    def _changed(self, obstacle_id: str, entry: Optional[Dict]):
+        self.epoch += 1
+        if self.on_change is not None:
+            self.on_change(obstacle_id, entry)
@@ -0,0 +1,58 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class RouteCache:
+    """
+    LRU of serialized route responses.
+
+    Keys include the routing epoch (graph version and obstacle epoch), so a
+    graph swap or obstacle change makes every older entry unreachable
+    without scanning; those entries simply age out of the LRU. Values are
+    the already-encoded JSON bytes, so a hit does no serialization at all.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Configure from ROUTE_CACHE_SIZE (0 disables caching)"""
+        return cls(max_entries=int(os.getenv("ROUTE_CACHE_SIZE", "1024")))
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,129 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+RouteEntry = Optional[Tuple[float, List[int]]]  # (cost, node index path) or None if unreachable
+
+
+class RouteMatrix:
+    """Routes between ordered pairs of building nodes for one profile, remembered once computed.
+
+    Nothing is searched up front, so large graphs start up without routing
+    from every building; each pair is computed by the caller the first
+    time it is asked for and kept. The table keeps track of which entries
+    pass through which node, so when obstacles change (see
+    EdgePenalties.changes_since) only the affected entries are dropped, to
+    be recomputed on their next use:
+
+    * a node whose penalty went up invalidates the entries whose path uses it;
+    * a lowered or removed penalty can only make detoured routes shorter, so
+      it invalidates the entries whose cost differs from the unobstructed
+      baseline (including unreachable ones, and ones computed while
+      obstacles were present, whose baseline is unknown).
+    """
+
+    def __init__(self, building_indices: Iterable[int], epoch: int = 0):
+        self.buildings = sorted(set(building_indices))
+        self._building_set = set(self.buildings)
+        self.entries: Dict[Tuple[int, int], RouteEntry] = {}
+        self.baseline: Dict[Tuple[int, int], float] = {}
+        self.epoch = epoch  # Penalty epoch the entries reflect
+        self._through: Dict[int, Set[Tuple[int, int]]] = {}  # node index -> pairs routed through it
+        self.invalidated = 0  # Entries dropped by the last sync
+
+    def __contains__(self, pair: Tuple[int, int]) -> bool:
+        """Whether the table covers a pair (whether or not it has been computed yet)"""
+        start, goal = pair
+        return start in self._building_set and goal in self._building_set
+
+    def route(self, start: int, goal: int, penalties, compute: Callable[[], RouteEntry]) -> RouteEntry:
+        """Route for a building pair under the profile's current EdgePenalties, calling compute() on a miss"""
+        self.sync(penalties)
+        pair = (start, goal)
+        if pair not in self.entries:
+            entry = compute()
+            if entry is not None and not penalties.affected_nodes():
+                self.baseline[pair] = entry[0]
+            self._set(start, goal, entry)
+        return self.entries[pair]
+
+    def rebased(self, building_indices: Iterable[int], remap: np.ndarray, touched: Iterable[int],
+                shortened: Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray], epoch: int = 0) -> "RouteMatrix":
+        """This table carried over to a patched graph (see CompiledGraph.patched); this one is left untouched.
+
+        remap renumbers nodes (-1 for removed ones). Removing nodes or edges
+        only makes routes longer, so an entry is still shortest unless its
+        path used a removed node or a node in touched (new numbering: nodes
+        that moved or lost an edge). shortened(starts, goals, costs) flags
+        pairs that an added or shortened edge could now beat; those entries
+        and baselines are dropped as well. epoch is the penalty epoch the
+        carried entries are valid for.
+        """
+        matrix = RouteMatrix(building_indices, epoch=epoch)
+        touched = set(touched)
+        carried = []
+        for (start, goal), entry in self.entries.items():
+            start, goal = int(remap[start]), int(remap[goal])
+            if (start, goal) not in matrix:
+                continue
+            if entry is not None:
+                path = remap[entry[1]].tolist()
+                if -1 in path or not touched.isdisjoint(path):
+                    continue
+                entry = (entry[0], path)
+            carried.append((start, goal, entry, self.baseline.get((start, goal))))
+        if not carried:
+            return matrix
+
+        starts = np.asarray([c[0] for c in carried], dtype=np.int64)
+        goals = np.asarray([c[1] for c in carried], dtype=np.int64)
+        costs = np.asarray([c[2][0] if c[2] is not None else np.inf for c in carried])
+        baselines = np.asarray([c[3] if c[3] is not None else np.inf for c in carried])
+        entry_stale = shortened(starts, goals, costs)
+        baseline_stale = shortened(starts, goals, baselines)
+        for (start, goal, entry, baseline), drop_entry, drop_baseline in zip(carried, entry_stale.tolist(), baseline_stale.tolist()):
+            if not drop_entry:
+                matrix._set(start, goal, entry)
+            if baseline is not None and not drop_baseline:
+                matrix.baseline[(start, goal)] = baseline
+        return matrix
+
+    def sync(self, penalties):
+        """Drop the entries the profile's EdgePenalties changed since the table was last synced"""
+        self.invalidated = 0
+        if penalties.epoch == self.epoch:
+            return
+        changes = penalties.changes_since(self.epoch)
+        self.epoch = penalties.epoch
+        if changes is None:
+            # Too many changes to replay, start over
+            self.invalidated = len(self.entries)
+            self.entries.clear()
+            self._through.clear()
+            return
+        touched, relaxed = changes
+
+        stale = set()
+        for node in touched:
+            stale |= self._through.get(node, set())
+        if relaxed:
+            stale |= {
+                pair for pair, entry in self.entries.items()
+                if entry is None or entry[0] != self.baseline.get(pair)
+            }
+        for pair in stale:
+            self._drop(pair)
+        self.invalidated = len(stale)
+
+    def _drop(self, pair: Tuple[int, int]):
+        old = self.entries.pop(pair, None)
+        if old is not None:
+            for node in old[1]:
+                self._through[node].discard(pair)
+
+    def _set(self, source: int, target: int, entry: RouteEntry):
+        pair = (source, target)
+        self._drop(pair)
+        self.entries[pair] = entry
+        if entry is not None:
+            for node in entry[1]:
+                self._through.setdefault(node, set()).add(pair)
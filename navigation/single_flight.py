@@ -0,0 +1,44 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one in-flight computation.
+
+    The first caller for a key starts fn() as a task; everyone who asks for
+    that key before it finishes awaits the same task and gets the same
+    result (or exception). Once it finishes the key is free again, so later
+    calls compute afresh. A caller being cancelled does not cancel the
+    shared work for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0   # Computations started
+        self.shared = 0  # Callers that joined one already in flight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved, in case every caller was cancelled
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self):
+        return {"in_flight": self.in_flight(), "calls": self.calls, "shared": self.shared}
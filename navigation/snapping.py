@@ -0,0 +1,94 @@
+from typing import Dict
+import numpy as np
+from navigation.compiled_graph import CompiledGraph, EARTH_RADIUS_M
+from navigation.spatial_index import SpatialIndex
+
+SNAP_CANDIDATES = 8  # Nearest nodes whose incident edges are tried first for each point
+_METERS_PER_DEGREE = np.radians(1.0) * EARTH_RADIUS_M
+
+
+def _nearest_slots(graph: CompiledGraph, lats: np.ndarray, lngs: np.ndarray, owners: np.ndarray, candidates: np.ndarray):
+    """Closest CSR slot among the edges out of each owner's candidate nodes.
+
+    owners[i] is the point candidates[i] belongs to (sorted). Returns
+    (points, u, v, slot, t, distance_m) for the points that had any edge.
+    """
+    offsets = np.asarray(graph.offsets)
+    degrees = offsets[candidates + 1] - offsets[candidates]
+    total = int(degrees.sum())
+    if not total:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, np.zeros(0), np.zeros(0)
+    slot_owner = np.repeat(owners, degrees)
+    slot_u = np.repeat(candidates, degrees)
+    group_start = np.cumsum(degrees) - degrees
+    slots = np.repeat(offsets[candidates] - group_start, degrees) + np.arange(total)
+    slot_v = np.asarray(graph.targets)[slots]
+
+    # Local frame in meters centred on each point
+    cos_lat = np.cos(np.radians(lats))[slot_owner]
+    plat, plng = lats[slot_owner], lngs[slot_owner]
+    ax = (graph.lng[slot_u] - plng) * cos_lat * _METERS_PER_DEGREE
+    ay = (graph.lat[slot_u] - plat) * _METERS_PER_DEGREE
+    dx = (graph.lng[slot_v] - graph.lng[slot_u]) * cos_lat * _METERS_PER_DEGREE
+    dy = (graph.lat[slot_v] - graph.lat[slot_u]) * _METERS_PER_DEGREE
+    length_sq = dx * dx + dy * dy
+    t = np.clip(-(ax * dx + ay * dy) / np.where(length_sq > 0, length_sq, 1.0), 0.0, 1.0)
+    distance = np.hypot(ax + t * dx, ay + t * dy)
+
+    order = np.lexsort((distance, slot_owner))
+    points, first = np.unique(slot_owner[order], return_index=True)
+    best = order[first]
+    return points, slot_u[best], slot_v[best], slots[best], t[best], distance[best]
+
+
+def snap_to_edges(graph: CompiledGraph, spatial_index: SpatialIndex, lats, lngs, k: int = SNAP_CANDIDATES) -> Dict[str, np.ndarray]:
+    """Project each point onto its closest edge.
+
+    Returns arrays, one entry per point:
+        u, v        edge endpoints (node indices); v == u for an isolated node
+        slot        CSR slot of u -> v, or -1 for an isolated node
+        t           position along the edge, 0 at u and 1 at v
+        lat, lng    the snapped position
+        distance_m  from the point to the snapped position
+
+    Edges out of the k nearest nodes are tried first. The closest point of
+    any edge lies within half the edge's length of one of its ends, so the
+    answer is final unless an edge end within (best distance + half the
+    longest edge) was not among those nodes; only such points are re-run
+    against every node in that radius. On densified graphs that is rare.
+    Projection uses a local equirectangular frame around each point, which
+    is accurate at the scale of street segments.
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+    n = len(lats)
+    k = min(k, graph.num_nodes)
+    nearest_distance, nearest = spatial_index.query(lats, lngs, k=k)
+
+    # Nearest node is the fallback for points whose candidates have no edges
+    u = nearest[:, 0].astype(np.int64)
+    v = u.copy()
+    slot = np.full(n, -1, dtype=np.int64)
+    t = np.zeros(n)
+    distance = nearest_distance[:, 0].copy()
+
+    def apply(found):
+        points, *values = found
+        for array, value in zip((u, v, slot, t, distance), values):
+            array[points] = value
+
+    apply(_nearest_slots(graph, lats, lngs, np.repeat(np.arange(n), k), nearest.ravel()))
+
+    if k < graph.num_nodes and graph.num_edges:
+        # Slack for the flat-frame projection versus great-circle node distances
+        reach = distance + float(np.max(graph.weights)) / 2 * 1.01 + 0.01
+        recheck = np.flatnonzero(nearest_distance[:, -1] < reach)
+        if len(recheck):
+            matches = spatial_index.query_radius(lats[recheck], lngs[recheck], reach[recheck])
+            owners = np.repeat(recheck, [len(m) for m in matches])
+            apply(_nearest_slots(graph, lats, lngs, owners, np.concatenate(matches)))
+
+    lat = graph.lat[u] + t * (graph.lat[v] - graph.lat[u])
+    lng = graph.lng[u] + t * (graph.lng[v] - graph.lng[u])
+    return {"u": u, "v": v, "slot": slot, "t": t, "lat": lat, "lng": lng, "distance_m": distance}
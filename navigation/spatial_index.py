@@ -0,0 +1,137 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from scipy.spatial import cKDTree
+from navigation.compiled_graph import EARTH_RADIUS_M
+
+
+def to_cartesian(lat, lng) -> np.ndarray:
+    """Map degrees onto points of a sphere with Earth's radius (meters), shape (n, 3)"""
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=np.float64)))
+    lng = np.radians(np.atleast_1d(np.asarray(lng, dtype=np.float64)))
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS_M * np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+
+def chord_to_arc(chord):
+    """Straight-line distance through the sphere -> great-circle distance (meters)"""
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / (2 * EARTH_RADIUS_M), 1.0))
+
+
+def arc_to_chord(arc):
+    """Great-circle distance (meters) -> straight-line distance through the sphere"""
+    return 2 * EARTH_RADIUS_M * np.sin(np.minimum(np.asarray(arc, dtype=np.float64), np.pi * EARTH_RADIUS_M) / (2 * EARTH_RADIUS_M))
+
+
+class SpatialIndex:
+    """Metric nearest-neighbour and radius queries over lat/lng points.
+
+    Points are stored as 3D positions on a sphere of Earth's radius, so
+    Euclidean distances in the tree are chords in meters. Chords are
+    monotonic in great-circle distance, which makes nearest-neighbour
+    order exact. Radii are converted to chords before the query and
+    distances back to great-circle meters (the same haversine meters
+    the router uses) afterwards.
+
+    moved() derives the index for a patched graph without rebuilding the
+    tree: points that moved or were added go into a small overlay tree,
+    the tree's old copies of moved or removed points are masked out, and
+    surviving points are renumbered through a lookup array. Once the
+    overlay grows past OVERLAY_REBUILD_FRACTION of the points, the next
+    moved() builds a fresh tree instead.
+    """
+
+    OVERLAY_REBUILD_FRACTION = 0.02
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray):
+        self.size = len(lat)
+        self._tree = cKDTree(to_cartesian(lat, lng))
+        self._tree_index: Optional[np.ndarray] = None  # Tree point -> current index, -1 if masked (None: identity)
+        self._masked = 0
+        self._overlay_index = np.zeros(0, dtype=np.int64)  # Current indices of the overlay tree's points
+        self._overlay: Optional[cKDTree] = None
+
+    def moved(self, lat: np.ndarray, lng: np.ndarray, remap: np.ndarray, moved: np.ndarray) -> "SpatialIndex":
+        """Index over a patched graph's points (lat, lng); this one is left untouched.
+
+        remap maps this index's point numbers to the new ones (-1 for
+        removed points) and moved lists the new numbers of points that
+        were added or changed position.
+        """
+        moved = np.unique(np.asarray(moved, dtype=np.int64))
+        tree_index = np.arange(self._tree.n) if self._tree_index is None else self._tree_index
+        tree_index = np.where(tree_index >= 0, remap[np.maximum(tree_index, 0)], -1)
+        tree_index[np.isin(tree_index, moved)] = -1
+        overlay_index = remap[self._overlay_index]
+        overlay_index = np.union1d(overlay_index[overlay_index >= 0], moved)
+        masked = int(np.count_nonzero(tree_index < 0))
+        if masked + len(overlay_index) > max(self.OVERLAY_REBUILD_FRACTION * len(lat), 64):
+            return SpatialIndex(lat, lng)
+
+        index = SpatialIndex.__new__(SpatialIndex)
+        index.size = len(lat)
+        index._tree = self._tree
+        index._tree_index = tree_index
+        index._masked = masked
+        index._overlay_index = overlay_index
+        index._overlay = cKDTree(to_cartesian(lat[overlay_index], lng[overlay_index])) if len(overlay_index) else None
+        return index
+
+    def query(self, lat, lng, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest points for each query coordinate.
+
+        Returns (distances in meters, point indices), both shaped (n, k).
+        Missing neighbours (k larger than the index) get distance inf and
+        index == self.size, like scipy.
+        """
+        points = to_cartesian(lat, lng)
+        if self._tree_index is None and self._overlay is None:
+            chords, indices = self._tree.query(points, k=k)
+            return chord_to_arc(np.asarray(chords).reshape(-1, k)), np.asarray(indices).reshape(-1, k)
+
+        # Ask the tree for enough extra neighbours to make up for masked points
+        candidates = [self._candidates(self._tree, self._tree_index, points, min(k + self._masked, self._tree.n))]
+        if self._overlay is not None:
+            candidates.append(self._candidates(self._overlay, self._overlay_index, points, min(k, self._overlay.n)))
+        chords = np.concatenate([c for c, _ in candidates], axis=1)
+        indices = np.concatenate([i for _, i in candidates], axis=1)
+        if chords.shape[1] < k:
+            pad = k - chords.shape[1]
+            chords = np.pad(chords, ((0, 0), (0, pad)), constant_values=np.inf)
+            indices = np.pad(indices, ((0, 0), (0, pad)), constant_values=-1)
+        order = np.argsort(chords, axis=1, kind="stable")[:, :k]
+        chords = np.take_along_axis(chords, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        indices[indices < 0] = self.size
+        return chord_to_arc(chords), indices
+
+    @staticmethod
+    def _candidates(tree: cKDTree, index: Optional[np.ndarray], points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(chords, current indices) of a tree's k nearest points, masked ones as (inf, -1)"""
+        if k <= 0:
+            return np.zeros((len(points), 0)), np.zeros((len(points), 0), dtype=np.int64)
+        chords, found = tree.query(points, k=k)
+        chords = np.asarray(chords, dtype=np.float64).reshape(len(points), k)
+        found = np.asarray(found).reshape(len(points), k)
+        indices = np.asarray(index)[np.minimum(found, tree.n - 1)] if index is not None else found.astype(np.int64)
+        indices = np.where(found < tree.n, indices, -1)
+        return np.where(indices >= 0, chords, np.inf), indices
+
+    def query_radius(self, lat, lng, radius_m) -> List[np.ndarray]:
+        """Indices of points within radius_m meters of each query coordinate.
+
+        radius_m may be a scalar or one radius per query point. All points
+        are answered by a single query_ball_point call per tree.
+        """
+        points = to_cartesian(lat, lng)
+        if not len(points):
+            return []
+        radius = np.broadcast_to(arc_to_chord(radius_m), (len(points),))
+        matches = self._tree.query_ball_point(points, radius, return_sorted=True)
+        matches = [np.asarray(m, dtype=np.int64) for m in matches]
+        if self._tree_index is not None:
+            matches = [self._tree_index[m] for m in matches]
+            matches = [m[m >= 0] for m in matches]
+        if self._overlay is not None:
+            extra = self._overlay.query_ball_point(points, radius)
+            matches = [np.sort(np.concatenate([m, self._overlay_index[np.asarray(e, dtype=np.int64)]])) for m, e in zip(matches, extra)]
+        return matches
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINAL_STATES = (DONE, FAILED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the analysis backlog is at its limit"""
+
+
+class ObstacleJob:
+    """One queued obstacle analysis and its current state"""
+
+    def __init__(self, job_id: str, payload: Dict[str, Any]):
+        self.id = job_id
+        self.payload = payload  # Handed to the processor, dropped once the job finishes
+        self.status = PENDING
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._changed = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _set(self, status: str, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.updated_at = time.time()
+        if status in FINAL_STATES:
+            self.payload = None
+        # Wake everyone waiting on this state and arm a fresh event for the next one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def updates(self, keepalive: float = 15.0):
+        """Yield the job's state now and after every change until it finishes.
+
+        Yields None every keepalive seconds without a change, so streaming
+        responses can keep the connection open.
+        """
+        while True:
+            changed = self._changed  # Grab before yielding so no change is missed
+            yield self.to_dict()
+            if self.status in FINAL_STATES:
+                return
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                    break
+                except asyncio.TimeoutError:
+                    yield None
+
+
+class ObstacleJobQueue:
+    """
+    Background worker pool for obstacle analyses.
+
+    submit() registers a job and returns immediately; worker tasks feed
+    each job's payload to process(job) and record the returned result (or
+    the exception message) on the job. Finished jobs stay queryable until
+    max_history newer jobs have been registered.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[ObstacleJob], Awaitable[Dict[str, Any]]],
+        workers: int = 4,
+        max_pending: int = 100,
+        max_history: int = 1000,
+    ):
+        self.process = process
+        self.workers = workers
+        self.max_history = max_history
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._jobs: "OrderedDict[str, ObstacleJob]" = OrderedDict()
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls, process):
+        """Build a queue sized by OBSTACLE_JOB_WORKERS / OBSTACLE_JOB_MAX_PENDING"""
+        return cls(
+            process,
+            workers=int(os.getenv("OBSTACLE_JOB_WORKERS", "4")),
+            max_pending=int(os.getenv("OBSTACLE_JOB_MAX_PENDING", "100")),
+        )
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, job_id: str, payload: Dict[str, Any]) -> ObstacleJob:
+        """Register and enqueue a job; raises JobQueueFull when the backlog is full"""
+        job = ObstacleJob(job_id, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self._queue.qsize()} obstacle analyses already queued")
+        self._jobs[job_id] = job
+        while len(self._jobs) > self.max_history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status not in FINAL_STATES:
+                break
+            del self._jobs[oldest_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[ObstacleJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "workers": len(self._tasks), "tracked_jobs": len(self._jobs)}
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                job._set(RUNNING)
+                result = await self.process(job)
+                job._set(DONE, result=result)
+            except asyncio.CancelledError:
+                job._set(FAILED, error="Server shutting down")
+                raise
+            except Exception as e:
+                print(f"❌ Obstacle job {job.id} failed: {e}")
+                job._set(FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Run against the in-process database so tests never reach out to Atlas
+os.environ.setdefault("DB_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,24 @@
+import os
+import sys
+
+from pyproj import Geod
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation"))
+
+from navigation.build_graph import DIST_THRESHOLD, PointIndex  # noqa: E402
+
+GEOD = Geod(ellps='WGS84')
+
+
+def test_points_far_from_the_first_latitude_still_snap():
+    # At 60 degrees a cell is only half the threshold wide; try points all across a cell
+    for step in range(40):
+        index = PointIndex()
+        index.add(1, 0.0, 0.0)  # Fixes the cell width at the equator
+        lat, lon = 60.0 + step * 1e-5, 10.0 + step * 7e-6
+        index.add(100 + step, lat, lon)
+        for azimuth in (0, 45, 90, 180, 270):
+            near_lon, near_lat, _ = GEOD.fwd(lon, lat, azimuth, DIST_THRESHOLD * 0.95)
+            assert index.find(near_lat, near_lon) == 100 + step
+        far_lon, far_lat, _ = GEOD.fwd(lon, lat, 90, DIST_THRESHOLD * 1.05)
+        assert index.find(far_lat, far_lon) is None
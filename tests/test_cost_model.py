@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+from navigation.compiled_graph import CompiledGraph
+from navigation.cost_model import CostModel
+from navigation.navigation_service import NavigationService
+
+
+@pytest.fixture
+def service():
+    # Two rows of three nodes (~43 m across, ~55 m apart) plus a dead end hanging off the middle
+    ids = [f"r{row}c{col}" for row in range(2) for col in range(3)] + ["tip"]
+    lats = [40.0 + 0.0005 * row for row in range(2) for col in range(3)] + [39.9996]
+    lngs = [-80.0 + 0.0005 * col for row in range(2) for col in range(3)] + [-79.9995]
+    edges = [(f"r{r}c{c}", f"r{r}c{c + 1}") for r in range(2) for c in range(2)] + \
+            [(f"r0c{c}", f"r1c{c}") for c in range(3)] + [("r0c1", "tip")]
+    service = NavigationService(use_contraction_hierarchy=True)
+    service.load_graph(CompiledGraph.build(ids, [""] * 7, ["waypoint"] * 7, lats, lngs, edges), {})
+    return service
+
+
+def report(service, node_id, **fields):
+    lat, lng = service.graph.coords(service.graph.index_of(node_id))
+    service.obstacle_index.upsert({"_id": node_id, "active": True, "ai_verified": True, "coords": {"lat": lat, "lng": lng},
+                                   "severity": "HIGH", "obstacle_type": "debris", "ai_confidence": 1.0, **fields})
+
+
+def route(service, start, goal, algorithm, profile="default"):
+    path = service._route(service.graph.index_of(start), service.graph.index_of(goal), algorithm, profile)
+    return None if path is None else [service.graph.node_ids[i] for i in path]
+
+
+def test_multipliers_follow_severity_type_and_confidence():
+    model = CostModel()
+    assert model.multiplier({"severity": "MEDIUM", "ai_confidence": 1.0}, "default") == 3.0
+    assert model.multiplier({"severity": "MEDIUM", "ai_confidence": 0.5}, "default") == 2.0
+    assert model.multiplier({"obstacle_type": "Steep stairs", "severity": "HIGH"}, "default") == 2.0
+    assert math.isinf(model.multiplier({"obstacle_type": "Steep stairs", "severity": "LOW"}, "wheelchair"))
+    assert math.isinf(model.multiplier({}, "default"))  # Severity missing: blocks, as before severities existed
+
+
+@pytest.mark.parametrize("algorithm", ["dijkstra", "astar", "ch"])
+def test_impassable_nodes_are_never_routed(service, algorithm):
+    assert service.contraction_hierarchy is not None
+    assert route(service, "r0c0", "r0c2", algorithm) == ["r0c0", "r0c1", "r0c2"]
+    report(service, "r0c1")
+    assert service.penalties["default"].blocked_nodes() == {service.graph.index_of("r0c1")}
+    assert route(service, "r0c0", "r0c2", algorithm) == ["r0c0", "r1c0", "r1c1", "r1c2", "r0c2"]
+    assert route(service, "r0c0", "tip", algorithm) is None  # Its only way in is blocked
+    assert route(service, "r0c0", "r0c1", algorithm) is None
+
+
+@pytest.mark.parametrize("algorithm", ["dijkstra", "astar", "ch"])
+def test_multipliers_decide_which_route_wins(service, algorithm):
+    direct, detour = ["r0c0", "r0c1", "r0c2"], ["r0c0", "r1c0", "r1c1", "r1c2", "r0c2"]
+    report(service, "r0c1", severity="LOW")  # x1.5 still beats the detour
+    assert route(service, "r0c0", "r0c2", algorithm) == direct
+    report(service, "r0c1", severity="MEDIUM")  # x3 does not
+    assert route(service, "r0c0", "r0c2", algorithm) == detour
+
+    # Stairs cost x2 for walkers but block wheelchairs
+    report(service, "r0c1", obstacle_type="stairs")
+    assert route(service, "r0c0", "r0c2", algorithm) == direct
+    assert route(service, "r0c0", "r0c2", algorithm, "wheelchair") == detour
@@ -0,0 +1,225 @@
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+import types
+from datetime import datetime
+
+import httpx
+import pytest
+from PIL import Image
+
+from navigation.graph_import import load_graph_file
+
+MODEL_SECONDS = 0.5
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+
+
+class SlowModel:
+    """Stands in for genai.GenerativeModel: blocks like a network call, then returns a verdict"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, parts):
+        time.sleep(MODEL_SECONDS)
+        return types.SimpleNamespace(
+            text='{"is_obstacle": true, "obstacle_type": "stairs", "confidence": 0.9, "severity": "HIGH"}',
+            prompt_feedback=None,
+        )
+
+
+@pytest.fixture(scope="module")
+def api():
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = SlowModel
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    saved = {name: sys.modules.get(name) for name in ("google", "google.generativeai")}
+    sys.modules.update({"google": google, "google.generativeai": genai})
+    os.environ.setdefault("GEMINI_API_KEY", "test")
+    try:
+        import fastAPI
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+    graph, _ = load_graph_file(GRAPH_POINTS)
+    fastAPI.navigation_service.load_graph(graph, {"start hall": graph.node_ids[0], "end hall": graph.node_ids[200]})
+    return fastAPI
+
+
+@pytest.fixture
+def small_pool(api, monkeypatch):
+    from detection_pool import DetectionPool
+    from navigation.route_cache import RouteCache
+    pool = DetectionPool(max_workers=2, max_queue=2)
+    monkeypatch.setattr(api, "detection_pool", pool)
+    monkeypatch.setattr(api, "_fingerprint", lambda image_bytes: None)  # Every upload reaches the model
+    monkeypatch.setattr(api, "route_cache", RouteCache(max_entries=0))  # Every /directions call routes
+    yield pool
+    pool.shutdown()
+
+
+def jpeg(shade: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), (shade, 40, 40)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+async def directions_latencies(client, count: int):
+    latencies = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        response = await client.get("/directions", params={"start": "start hall", "end": "end hall", "algorithm": "dijkstra"})
+        latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200
+    return latencies
+
+
+def test_directions_stay_fast_while_detections_saturate_pool(api, small_pool):
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            idle = await directions_latencies(client, 20)
+
+            capacity = small_pool.max_workers + small_pool.max_queue
+            uploads = [
+                asyncio.create_task(client.post("/detect", files={"file": (f"{i}.jpg", jpeg(i * 20), "image/jpeg")}))
+                for i in range(capacity)
+            ]
+            while small_pool.pending < capacity:
+                await asyncio.sleep(0.01)
+
+            busy = await directions_latencies(client, 20)
+
+            # Pool is full: the next upload is turned away right away
+            t0 = time.perf_counter()
+            overflow = await client.post("/detect", files={"file": ("x.jpg", jpeg(250), "image/jpeg")})
+            overflow_seconds = time.perf_counter() - t0
+            assert small_pool.pending == capacity  # Still saturated while we measured
+
+            results = await asyncio.gather(*uploads)
+            return idle, busy, overflow, overflow_seconds, results
+
+    idle, busy, overflow, overflow_seconds, results = asyncio.run(scenario())
+
+    assert overflow.status_code == 429
+    assert overflow.headers.get("retry-after") == "1"
+    assert overflow_seconds < MODEL_SECONDS / 2
+    assert all(response.status_code == 200 for response in results)
+    # Routing never waits on a model call: no request comes close to one model round trip
+    assert max(busy) < MODEL_SECONDS / 2
+    assert statistics.median(busy) < statistics.median(idle) * 5 + 0.02
+
+
+def test_batch_shares_pool_and_is_refused_when_full(api, small_pool):
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batch = asyncio.create_task(client.post(
+                "/report-obstacle/batch",
+                files=[("images", (f"{i}.jpg", jpeg(i * 20), "image/jpeg")) for i in range(6)],
+                data={"gps_coordinates": '{"lat": 0, "lng": 0}'},
+            ))
+            peak = 0
+            while not batch.done():
+                peak = max(peak, small_pool.pending)
+                await asyncio.sleep(0.01)
+
+            capacity = small_pool.max_workers + small_pool.max_queue
+            uploads = [
+                asyncio.create_task(client.post("/detect", files={"file": (f"{i}.jpg", jpeg(i * 20), "image/jpeg")}))
+                for i in range(capacity)
+            ]
+            while small_pool.pending < capacity:
+                await asyncio.sleep(0.01)
+            refused = await client.post(
+                "/report-obstacle/batch",
+                files=[("images", ("x.jpg", jpeg(250), "image/jpeg"))],
+                data={"gps_coordinates": '{"lat": 0, "lng": 0}'},
+            )
+            await asyncio.gather(*uploads)
+            return await batch, peak, refused
+
+    batch, peak, refused = asyncio.run(scenario())
+
+    assert batch.status_code == 200
+    assert len(batch.text.splitlines()) == 6
+    assert 0 < peak <= small_pool.max_workers + small_pool.max_queue  # Batch images went through the shared pool
+    assert refused.status_code == 429
+
+
+def test_pending_reports_resume_after_restart(api, small_pool, monkeypatch):
+    from backend.models.database import obstacle_images_collection, obstacles_collection, obstacle_geo_fields
+    from obstacle_jobs import ObstacleJobQueue
+    queue = ObstacleJobQueue(api._process_obstacle_job, workers=2)
+    monkeypatch.setattr(api, "obstacle_jobs", queue)
+
+    def report(report_id):
+        return {"_id": report_id, "description": "", "coords": {"lat": 0.0, "lng": 0.0}, "photoUrl": None,
+                "timestamp": datetime.utcnow(), "active": True, "ai_verified": None, "ai_status": "pending",
+                **obstacle_geo_fields(0.0, 0.0)}
+
+    async def scenario():
+        # Left behind by a server that stopped before analysing them
+        await obstacles_collection.insert_many([report("kept"), report("orphan")])
+        await obstacle_images_collection.insert_one({"_id": "kept", "image": jpeg(90), "createdAt": datetime.utcnow()})
+        queue.start()
+        try:
+            await api._resume_obstacle_jobs()
+            async for state in queue.get("kept").updates():
+                pass
+            return state, await obstacles_collection.find_one({"_id": "kept"}), await obstacles_collection.find_one({"_id": "orphan"}), \
+                await obstacle_images_collection.count_documents({})
+        finally:
+            await queue.stop()
+            await obstacles_collection.delete_many({})
+            await obstacle_images_collection.delete_many({})
+
+    state, kept, orphan, images_left = asyncio.run(scenario())
+
+    assert state["status"] == "done"
+    assert kept["ai_status"] == "done" and kept["ai_verified"] is True
+    assert orphan["ai_status"] == "failed" and orphan["ai_error"] == "Image lost before analysis"
+    assert images_left == 0
+
+
+def test_waiting_jobs_take_slots_as_they_free_up():
+    from detection_pool import DetectionPool, DetectionPoolFull
+    pool = DetectionPool(max_workers=1, max_queue=1)
+
+    async def scenario():
+        started = []
+
+        def job(name):
+            started.append(name)
+            time.sleep(0.1)
+            return name
+
+        busy = [asyncio.create_task(pool.run(job, name)) for name in ("a", "b")]
+        await asyncio.sleep(0.01)
+        with pytest.raises(DetectionPoolFull):
+            await pool.run(job, "rejected")
+        gone = asyncio.create_task(pool.run_when_free(job, "gone"))
+        waiting = [asyncio.create_task(pool.run_when_free(job, name)) for name in ("c", "d")]
+        await asyncio.sleep(0.01)
+        gone.cancel()  # Its place in line goes to the next waiter
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*busy, *waiting)
+        return results, started, time.perf_counter() - t0
+
+    try:
+        results, started, seconds = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert results == ["a", "b", "c", "d"]
+    assert started == ["a", "b", "c", "d"]  # Oldest waiter first
+    assert seconds < 0.4 + 0.1  # Four back-to-back jobs, no polling gaps
@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+from document_listing import STREAM_PREFETCH, list_documents, point_feature
+
+
+class FailingCursor:
+    """Stands in for a Motor cursor that dies after yielding fail_at documents"""
+
+    def __init__(self, count, fail_at, after=None):
+        self.count, self.fail_at, self.after, self.max_docs = count, fail_at, after, None
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        self.max_docs = n
+        return self
+
+    async def _documents(self):
+        returned = 0
+        for i in range(self.count):
+            if i == self.fail_at:
+                raise RuntimeError("cursor died")
+            doc = {"_id": f"{i:05d}", "value": i}
+            if self.after is not None and doc["_id"] <= self.after:
+                continue
+            if returned == self.max_docs:
+                return
+            returned += 1
+            if i % 2 == 0:
+                doc["coords"] = {"lat": 0.0, "lng": float(i)}
+            yield doc
+
+    def __aiter__(self):
+        return self._documents()
+
+
+class FakeCollection:
+    def __init__(self, count, fail_at=None):
+        self.count, self.fail_at = count, fail_at
+
+    def find(self, query, projection=None):
+        return FailingCursor(self.count, self.fail_at, query.get("_id", {}).get("$gt"))
+
+
+def listing(collection, fmt):
+    async def run():
+        response = await list_documents(collection, {}, shape=dict, fmt=fmt)
+        chunks = [chunk async for chunk in response.body_iterator]
+        return "".join(c if isinstance(c, str) else c.decode() for c in chunks)
+    return asyncio.run(run())
+
+
+def test_early_cursor_error_raises_before_streaming():
+    with pytest.raises(RuntimeError):
+        listing(FakeCollection(STREAM_PREFETCH * 3, fail_at=3), "ndjson")
+
+
+def test_mid_stream_error_ends_ndjson_with_error_line():
+    lines = listing(FakeCollection(STREAM_PREFETCH * 3, fail_at=STREAM_PREFETCH + 10), "ndjson").splitlines()
+    assert len(lines) == STREAM_PREFETCH + 11
+    assert "error" in json.loads(lines[-1])
+
+
+def test_mid_stream_error_leaves_json_unterminated():
+    body = listing(FakeCollection(STREAM_PREFETCH * 3, fail_at=STREAM_PREFETCH + 10), "json")
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(body)
+
+
+def test_complete_listing_is_unchanged():
+    assert len(json.loads(listing(FakeCollection(STREAM_PREFETCH * 3), "json"))) == STREAM_PREFETCH * 3
+    assert len(listing(FakeCollection(5), "ndjson").splitlines()) == 5
+
+
+def test_pages_continue_past_documents_without_features():
+    async def walk():
+        features, cursors, after = [], [], None
+        while True:
+            response = await list_documents(FakeCollection(10), {}, shape=dict, fmt="geojson", after=after, limit=4,
+                                             feature=lambda doc: point_feature(doc, "coords"))
+            body = "".join([c if isinstance(c, str) else c.decode() async for c in response.body_iterator])
+            features += json.loads(body)["features"]
+            after = response.headers.get("x-next-cursor")
+            if after is None:
+                return features, cursors
+            cursors.append(after)
+
+    features, cursors = asyncio.run(walk())
+    # Odd documents have no coordinates, so every page holds only two features
+    assert cursors == ["00003", "00007"]
+    assert [f["properties"]["value"] for f in features] == [0, 2, 4, 6, 8]
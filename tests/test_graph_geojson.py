@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+import types
+
+import httpx
+import pytest
+
+from backend.models.database import edges_collection, nodes_collection
+from navigation.graph_import import upsert_graph_file
+from navigation.navigation_service import NavigationService
+
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+
+
+@pytest.fixture(scope="module")
+def api():
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = lambda *args, **kwargs: None
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    saved = {name: sys.modules.get(name) for name in ("google", "google.generativeai")}
+    sys.modules.update({"google": google, "google.generativeai": genai})
+    os.environ.setdefault("GEMINI_API_KEY", "test")
+    try:
+        import fastAPI
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+    return fastAPI
+
+
+def test_in_memory_edges_match_the_database_listing(api, monkeypatch):
+    monkeypatch.setattr(api, "navigation_service", NavigationService(use_contraction_hierarchy=False))
+
+    async def listings(client):
+        from_graph = await client.get("/edges", params={"format": "geojson"})
+        assert from_graph.headers.get("etag")  # Served from the compiled graph
+        from_db = await client.get("/edges", params={"format": "geojson", "after": ""})
+        return from_graph.json()["features"], from_db.json()["features"]
+
+    async def scenario():
+        await upsert_graph_file(GRAPH_POINTS, nodes_collection, edges_collection)
+        try:
+            await api.navigation_service.initialize(use_local_graph=False)
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                from_graph, from_db = await listings(client)
+                assert len(from_db) > 100 and from_graph == from_db
+
+                # Patched graphs keep the documents' ids, names and direction too
+                graph = api.navigation_service.graph
+                a, b = graph.node_ids[5], graph.node_ids[90]
+                added = await client.post("/edges", params={"reload": "true"},
+                                          json={"edgeId": "zz-shortcut", "from": b, "to": a, "name": "Shortcut Lane"})
+                assert added.status_code == 200
+                removed = await client.delete(f"/edges/{from_db[0]['properties']['edgeId']}")
+                assert removed.status_code == 200
+                from_graph, from_db = await listings(client)
+                assert from_graph == from_db
+                assert from_graph[-1]["properties"] == {"edgeId": "zz-shortcut", "from": b, "to": a, "active": True, "name": "Shortcut Lane"}
+        finally:
+            await nodes_collection.delete_many({})
+            await edges_collection.delete_many({})
+
+    asyncio.run(scenario())
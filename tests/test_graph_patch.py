@@ -0,0 +1,159 @@
+import asyncio
+import os
+import random
+
+import numpy as np
+
+from navigation.compiled_graph import CompiledGraph
+from navigation.graph_import import load_graph_file
+from navigation.navigation_service import NavigationService
+from navigation.spatial_index import SpatialIndex
+
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+
+
+def random_changes(graph, rng, step):
+    """One batch of graph_nodes / graph_edges documents touching a few random nodes and edges"""
+    ids = list(graph.node_ids)
+    node_docs, edge_docs = [], []
+    for _ in range(rng.randrange(3)):
+        node_id = rng.choice(ids) if rng.random() < 0.6 else f"new-{step}-{rng.randrange(3)}"
+        lat, lng = graph.coords(rng.randrange(graph.num_nodes))
+        node_docs.append({"nodeId": node_id, "name": "", "type": "waypoint", "active": True,
+                          "coordinates": {"lat": lat + rng.uniform(-2e-4, 2e-4), "lng": lng + rng.uniform(-2e-4, 2e-4)}})
+    if rng.random() < 0.3:
+        node_docs.append({"nodeId": rng.choice(ids), "active": False})
+    known = ids + [doc["nodeId"] for doc in node_docs]
+    edge_docs += [{"edgeId": f"new-{step}-{k}", "from": rng.choice(known), "to": rng.choice(known), "name": f"street {step}", "active": True}
+                  for k in range(rng.randrange(3))]
+    edge_ids = list(graph.edge_ids)
+    if rng.random() < 0.3:
+        # Re-point an existing edge
+        edge_docs.append({"edgeId": rng.choice(edge_ids), "from": rng.choice(known), "to": rng.choice(known), "name": "moved", "active": True})
+    for edge_id in rng.sample(edge_ids, rng.randrange(3)):
+        edge_docs.append({"edgeId": edge_id, "active": False})
+    return node_docs, edge_docs
+
+
+def as_sets(graph):
+    nodes = {graph.node_ids[i]: graph.coords(i) for i in range(graph.num_nodes)}
+    src, dst = graph.edge_src.tolist(), graph.edge_dst.tolist()
+    edges = {edge_id: (graph.node_ids[u], graph.node_ids[v], name) for edge_id, name, u, v in zip(graph.edge_ids, graph.edge_names, src, dst)}
+    return nodes, edges
+
+
+def test_patched_graph_matches_a_fresh_build():
+    graph, _ = load_graph_file(GRAPH_POINTS)
+    rng = random.Random(1)
+    for step in range(40):
+        node_docs, edge_docs = random_changes(graph, rng, step)
+        nodes = [(d["nodeId"], "", "waypoint", d["coordinates"]["lat"], d["coordinates"]["lng"]) for d in node_docs if d["active"]]
+        removed = [d["nodeId"] for d in node_docs if not d["active"]]
+        edges = [(d["edgeId"], d["from"], d["to"], d["name"]) for d in edge_docs if d["active"]]
+        removed_edges = [d["edgeId"] for d in edge_docs if not d["active"]]
+        patched, delta = graph.patched(nodes, removed, edges, removed_edges)
+
+        expected_nodes, expected_edges = as_sets(graph)
+        for node_id, _, _, lat, lng in nodes:
+            expected_nodes[node_id] = (lat, lng)
+        for node_id in removed:
+            expected_nodes.pop(node_id, None)
+        for edge_id, from_id, to_id, name in edges:
+            expected_edges[edge_id] = (from_id, to_id, name)
+        for edge_id in removed_edges:
+            expected_edges.pop(edge_id, None)
+        expected_edges = {edge_id: (a, b, name) for edge_id, (a, b, name) in expected_edges.items()
+                          if a != b and a in expected_nodes and b in expected_nodes}
+        assert as_sets(patched) == (expected_nodes, expected_edges)
+
+        records = list(expected_edges.items())
+        rebuilt = CompiledGraph.build(list(patched.node_ids), list(patched.names), list(patched.types), patched.lat, patched.lng,
+                                      [(a, b) for _, (a, b, _) in records], [edge_id for edge_id, _ in records], [name for _, (_, _, name) in records])
+        assert np.array_equal(patched.offsets, rebuilt.offsets)
+        assert np.array_equal(np.sort(patched.weights), np.sort(rebuilt.weights))
+        assert as_sets(rebuilt) == as_sets(patched)
+        for i, node_id in enumerate(graph.node_ids):
+            assert delta["remap"][i] == (patched.index_of(node_id) if patched.index_of(node_id) is not None else -1)
+        graph = patched
+
+
+def test_moved_spatial_index_matches_a_fresh_one():
+    graph, _ = load_graph_file(GRAPH_POINTS)
+    index = SpatialIndex(graph.lat, graph.lng)
+    rng = random.Random(2)
+    for step in range(40):
+        node_docs, _ = random_changes(graph, rng, step)
+        nodes = [(d["nodeId"], "", "waypoint", d["coordinates"]["lat"], d["coordinates"]["lng"]) for d in node_docs if d["active"]]
+        graph, delta = graph.patched(nodes, [d["nodeId"] for d in node_docs if not d["active"]])
+        index = index.moved(graph.lat, graph.lng, delta["remap"], delta["moved"])
+        fresh = SpatialIndex(graph.lat, graph.lng)
+        lats = graph.lat[:30] + 3e-5
+        lngs = graph.lng[:30] - 3e-5
+        assert np.allclose(index.query(lats, lngs, k=4)[0], fresh.query(lats, lngs, k=4)[0])
+        for got, want in zip(index.query_radius(lats, lngs, 40), fresh.query_radius(lats, lngs, 40)):
+            assert np.array_equal(got, want)
+
+
+def test_building_routes_stay_shortest_across_patches():
+    graph, _ = load_graph_file(GRAPH_POINTS)
+    rng = random.Random(3)
+    buildings = {f"building {i}": node_id for i, node_id in enumerate(rng.sample(list(dict.fromkeys(graph.node_ids)), 12))}
+    service = NavigationService(use_contraction_hierarchy=False)
+
+    async def scenario():
+        service.load_graph(graph, buildings)
+        for step in range(40):
+            node_docs, edge_docs = random_changes(service.graph, rng, step)
+            # Keep the buildings themselves in place
+            node_docs = [d for d in node_docs if d["nodeId"] not in buildings.values()]
+            await service.apply_graph_changes(node_docs, edge_docs)
+            for _ in range(15):
+                start, end = rng.sample(list(buildings), 2)
+                route = await service.find_path(start, end)
+                g = service.graph
+                expected = service._search(g.index_of(buildings[start]), g.index_of(buildings[end]), set(), "dijkstra")
+                assert (route is None) == (expected is None)
+                if expected is not None:
+                    path = [g.index_of(node_id) for node_id in route["path_nodes"]]
+                    weights = service.penalties["default"].weights
+                    assert abs(service._path_cost(path, weights) - service._path_cost(expected, weights)) < 1e-2
+
+    asyncio.run(scenario())
+
+
+def test_node_gets_its_edges_back_when_it_returns():
+    from backend.models.database import edges_collection, nodes_collection
+
+    def node(node_id, lng, name="", node_type="waypoint"):
+        return {"_id": node_id, "nodeId": node_id, "name": name, "type": node_type, "active": True,
+                "coordinates": {"lat": 40.0, "lng": lng}}
+
+    def edge(a, b):
+        return {"_id": f"{a}-{b}", "edgeId": f"{a}-{b}", "from": a, "to": b, "name": "", "active": True}
+
+    service = NavigationService(use_contraction_hierarchy=False)
+
+    async def scenario():
+        await nodes_collection.insert_many([node("n0", -80.0, "A Hall", "building"), node("n1", -79.9995), node("n2", -79.999, "B Hall", "building")])
+        await edges_collection.insert_many([edge("n0", "n1"), edge("n1", "n2")])
+        try:
+            await service.initialize(use_local_graph=False)
+            assert (await service.find_path("a hall", "b hall"))["path_nodes"] == ["n0", "n1", "n2"]
+
+            # Deactivate n1, then reactivate its stored document
+            await service.apply_graph_changes(node_docs=[{"nodeId": "n1", "active": False}])
+            assert await service.find_path("a hall", "b hall") is None
+            await service.apply_graph_changes(node_docs=[await nodes_collection.find_one({"_id": "n1"})])
+            assert (await service.find_path("a hall", "b hall"))["path_nodes"] == ["n0", "n1", "n2"]
+
+            # An edge posted before its endpoint exists is installed with the node
+            await edges_collection.insert_one(edge("n2", "n3"))
+            await service.apply_graph_changes(edge_docs=[edge("n2", "n3")])
+            await nodes_collection.insert_one(node("n3", -79.9985, "C Hall", "building"))
+            await service.apply_graph_changes(node_docs=[await nodes_collection.find_one({"_id": "n3"})])
+            assert (await service.find_path("a hall", "c hall"))["path_nodes"] == ["n0", "n1", "n2", "n3"]
+        finally:
+            await nodes_collection.delete_many({})
+            await edges_collection.delete_many({})
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+import os
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from navigation.graph_import import load_graph_file
+from navigation.graph_snapshot import MAGIC, SNAPSHOT_VERSION, load_snapshot, save_snapshot
+from test_graph_patch import as_sets, random_changes
+
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+ARRAYS = ("lat", "lng", "offsets", "targets", "weights", "edge_src", "edge_dst")
+STRINGS = ("node_ids", "names", "types", "edge_ids", "edge_names")
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return load_graph_file(GRAPH_POINTS)
+
+
+@pytest.fixture
+def snapshot_path(graph, tmp_path):
+    path = str(tmp_path / "graph.snap")
+    save_snapshot(path, graph[0], graph[1], source="test")
+    return path
+
+
+def test_snapshot_round_trip(graph, snapshot_path):
+    original, building_nodes = graph
+    loaded, loaded_buildings = load_snapshot(snapshot_path)
+
+    assert loaded_buildings == building_nodes
+    for name in ARRAYS:
+        array = getattr(loaded, name)
+        assert np.array_equal(array, getattr(original, name)), name
+        assert not array.flags.writeable  # A view into the mapping, not a copy
+    for name in STRINGS:
+        assert list(getattr(loaded, name)) == list(getattr(original, name)), name
+    for i in random.Random(0).sample(range(original.num_nodes), 50):
+        assert loaded.index_of(original.node_ids[i]) == original.index_of(original.node_ids[i])
+    assert loaded.index_of("no such node") is None
+    assert as_sets(loaded) == as_sets(original)
+
+
+def test_foreign_and_stale_files_are_rejected(snapshot_path, tmp_path):
+    foreign = tmp_path / "graph_points.txt"
+    foreign.write_bytes(open(GRAPH_POINTS, "rb").read(4096))
+    with pytest.raises(ValueError, match="bad magic"):
+        load_snapshot(str(foreign))
+
+    short = tmp_path / "short.snap"
+    short.write_bytes(MAGIC)
+    with pytest.raises(ValueError, match="too short"):
+        load_snapshot(str(short))
+
+    # Same file, but written by an older format version
+    with open(snapshot_path, "r+b") as f:
+        f.seek(len(MAGIC))
+        f.write(struct.pack("<I", SNAPSHOT_VERSION - 1))
+    with pytest.raises(ValueError, match=f"version {SNAPSHOT_VERSION - 1}.*export it again"):
+        load_snapshot(snapshot_path)
+
+
+def test_patching_a_snapshot_matches_patching_the_source(graph, snapshot_path):
+    in_memory, _ = graph
+    mapped, _ = load_snapshot(snapshot_path)
+    rng = random.Random(4)
+    for step in range(20):
+        node_docs, edge_docs = random_changes(in_memory, rng, step)
+        nodes = [(d["nodeId"], "", "waypoint", d["coordinates"]["lat"], d["coordinates"]["lng"]) for d in node_docs if d["active"]]
+        removed = [d["nodeId"] for d in node_docs if not d["active"]]
+        edges = [(d["edgeId"], d["from"], d["to"], d["name"]) for d in edge_docs if d["active"]]
+        removed_edges = [d["edgeId"] for d in edge_docs if not d["active"]]
+
+        in_memory, expected_delta = in_memory.patched(nodes, removed, edges, removed_edges)
+        mapped, delta = mapped.patched(nodes, removed, edges, removed_edges)
+
+        assert as_sets(mapped) == as_sets(in_memory)
+        assert np.array_equal(mapped.offsets, in_memory.offsets)
+        assert np.array_equal(mapped.weights, in_memory.weights)
+        assert np.array_equal(delta["remap"], expected_delta["remap"])
+        for node_id, *_ in nodes:
+            assert mapped.index_of(node_id) == in_memory.index_of(node_id)
@@ -0,0 +1,164 @@
+import asyncio
+
+from navigation.compiled_graph import CompiledGraph
+from navigation.navigation_service import NavigationService
+from navigation.obstacle_index import ObstacleIndex
+
+
+class FakeChangeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.events.get()
+
+
+class BrokenChangeStream(FakeChangeStream):
+    async def __aenter__(self):
+        raise RuntimeError("The $changeStream stage is only supported on replica sets")
+
+
+class FakeObstacles:
+    """Stands in for the obstacles collection: find() scans slowly, watch() replays queued events"""
+
+    def __init__(self, docs, change_streams=True):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.change_streams = change_streams
+        self.events = asyncio.Queue()
+        self.scans = 0
+
+    def find(self, query):
+        self.scans += 1
+        return self._scan(query)
+
+    async def _scan(self, query):
+        await asyncio.sleep(0.05)
+        for doc in list(self.docs.values()):
+            if all(doc.get(key) == value for key, value in query.items()):
+                yield doc
+
+    def watch(self, full_document=None):
+        return FakeChangeStream(self.events) if self.change_streams else BrokenChangeStream(self.events)
+
+
+def obstacle(obstacle_id, coords, severity="HIGH"):
+    lat, lng = coords
+    return {"_id": obstacle_id, "active": True, "ai_verified": True, "coords": {"lat": lat, "lng": lng},
+            "severity": severity, "obstacle_type": "debris", "ai_confidence": 1.0}
+
+
+def grid_service(collection):
+    # 3 x 3 grid with ~45 m edges, so an obstacle touches a single node
+    ids = [f"r{row}c{col}" for row in range(3) for col in range(3)]
+    lats = [40.0 + 0.0004 * row for row in range(3) for col in range(3)]
+    lngs = [-80.0 + 0.0005 * col for row in range(3) for col in range(3)]
+    edges = [(f"r{r}c{c}", f"r{r}c{c + 1}") for r in range(3) for c in range(2)] + \
+            [(f"r{r}c{c}", f"r{r + 1}c{c}") for r in range(2) for c in range(3)]
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(CompiledGraph.build(ids, [""] * 9, ["waypoint"] * 9, lats, lngs, edges), {})
+    service.obstacle_index = ObstacleIndex(collection, service._nodes_near_obstacles,
+                                           on_change=service._apply_obstacle, poll_interval=0.05)
+    return service
+
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_change_events_update_penalties():
+    async def scenario():
+        collection = FakeObstacles([])
+        service = grid_service(collection)
+        graph, penalties = service.graph, service.penalties["default"]
+        centre, corner = graph.index_of("r1c1"), graph.index_of("r2c2")
+        collection.docs["a"] = obstacle("a", graph.coords(centre))
+        index = service.obstacle_index
+        index.start()
+        try:
+            await until(lambda: index.mode == "change_stream" and "a" in index.obstacles)
+            assert penalties.blocked_nodes() == {centre}
+
+            epoch = index.epoch
+            await collection.events.put({"operationType": "insert", "documentKey": {"_id": "b"},
+                                         "fullDocument": obstacle("b", graph.coords(corner), "MEDIUM")})
+            await until(lambda: index.epoch > epoch)
+            assert penalties.affected_nodes() == {centre, corner}
+            lo, hi = graph.offsets[corner], graph.offsets[corner + 1]
+            assert (penalties.weights[lo:hi] == graph.weights[lo:hi] * 3.0).all()
+
+            epoch = index.epoch
+            await collection.events.put({"operationType": "update", "documentKey": {"_id": "a"},
+                                         "fullDocument": obstacle("a", graph.coords(centre), "LOW")})
+            await until(lambda: index.epoch > epoch)
+            assert penalties.blocked_nodes() == set()
+            assert centre in penalties.affected_nodes()
+
+            epoch = index.epoch
+            await collection.events.put({"operationType": "delete", "documentKey": {"_id": "b"}})
+            await until(lambda: index.epoch > epoch)
+            assert "b" not in index.obstacles
+            assert penalties.affected_nodes() == {centre}
+            assert (penalties.weights[lo:hi] == graph.weights[lo:hi]).all()
+        finally:
+            await index.stop()
+
+    asyncio.run(scenario())
+
+
+def test_polling_takes_over_without_change_streams():
+    async def scenario():
+        collection = FakeObstacles([], change_streams=False)
+        service = grid_service(collection)
+        graph, penalties = service.graph, service.penalties["default"]
+        centre = graph.index_of("r1c1")
+        index = service.obstacle_index
+        index.start()
+        try:
+            await until(lambda: index.mode == "polling")
+            epoch = index.epoch
+            collection.docs["a"] = obstacle("a", graph.coords(centre))
+            await until(lambda: "a" in index.obstacles)
+            assert index.epoch > epoch
+            assert penalties.blocked_nodes() == {centre}
+
+            epoch = index.epoch
+            collection.docs["a"] = {**collection.docs["a"], "active": False}
+            await until(lambda: "a" not in index.obstacles)
+            assert index.epoch > epoch
+            assert penalties.blocked_nodes() == set()
+        finally:
+            await index.stop()
+
+    asyncio.run(scenario())
+
+
+def test_overlapping_loads_share_one_scan():
+    async def scenario():
+        collection = FakeObstacles([])
+        service = grid_service(collection)
+        collection.docs["a"] = obstacle("a", service.graph.coords(service.graph.index_of("r1c1")))
+        index = service.obstacle_index
+
+        await asyncio.gather(*(index.load() for _ in range(5)))
+        assert collection.scans == 1
+        assert index.load_flight.stats() == {"in_flight": 0, "calls": 1, "shared": 4}
+        assert set(index.obstacles) == {"a"}
+
+        epoch = index.epoch
+        await index.load()  # Once finished, the next load scans again
+        assert collection.scans == 2
+        assert index.epoch == epoch  # Nothing changed
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+import pytest
+
+from backend.models import database
+from backend.models.database import obstacle_geo_fields, obstacles_collection
+from navigation.graph_import import load_graph_file
+from navigation.navigation_service import NavigationService
+
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+
+
+def obstacle(obstacle_id, lat, lng, located=True):
+    doc = {"_id": obstacle_id, "active": True, "ai_verified": True, "coords": {"lat": lat, "lng": lng},
+           "severity": "HIGH", "obstacle_type": "stairs", "ai_confidence": 0.9}
+    if located:
+        doc.update(obstacle_geo_fields(lat, lng))
+    return doc
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(database, "_obstacle_locations_migrated", False)
+    graph, _ = load_graph_file(GRAPH_POINTS)
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(graph, {})
+    yield service
+    asyncio.run(obstacles_collection.delete_many({}))
+
+
+def test_obstacles_without_location_are_read_until_migrated(service):
+    lat, lng = service.graph.coords(10)
+
+    async def scenario():
+        await obstacles_collection.insert_one(obstacle("legacy", lat, lng, located=False))
+        await service.obstacle_index.load()
+        assert service.graph.node_ids[10] in service.obstacle_index.obstacles["legacy"]["nodes"]
+
+        assert await database.migrate_obstacle_locations() == 1
+        await service.obstacle_index.load()
+        assert service._obstacle_bounds is not None  # Filtered on location from now on
+        assert "legacy" in service.obstacle_index.obstacles
+
+    asyncio.run(scenario())
+
+
+def test_obstacles_are_read_again_when_the_graph_grows(service, monkeypatch):
+    monkeypatch.setattr(database, "_obstacle_locations_migrated", True)
+    lat, lng = service.graph.coords(0)
+    far_lat = float(service.graph.lat.max()) + 0.01  # About 1 km past the graph
+
+    async def scenario():
+        await obstacles_collection.insert_one(obstacle("far", far_lat, lng))
+        await service.obstacle_index.load()
+        assert "far" not in service.obstacle_index.obstacles
+
+        await service.apply_graph_changes(
+            node_docs=[{"nodeId": "outpost", "name": "", "type": "waypoint", "active": True, "coordinates": {"lat": far_lat, "lng": lng}}],
+            edge_docs=[{"edgeId": "to-outpost", "from": service.graph.node_ids[0], "to": "outpost", "name": "", "active": True}],
+        )
+        assert service.obstacle_index.obstacles["far"]["nodes"] == {"outpost"}
+
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import os
+import random
+
+import pytest
+
+from navigation.compiled_graph import CompiledGraph
+from navigation.contraction_hierarchy import ContractionHierarchy
+from navigation.graph_import import load_graph_file
+from navigation.navigation_service import NavigationService
+
+GRAPH_POINTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "navigation", "graph_points.txt")
+
+
+@pytest.fixture(scope="module")
+def service():
+    graph, building_nodes = load_graph_file(GRAPH_POINTS)
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(graph, building_nodes)
+    return service
+
+
+def path_cost(service, path):
+    graph = service.graph
+    cost = 0.0
+    for a, b in zip(path, path[1:]):
+        neighbors, weights = graph.neighbors(a)
+        cost += min(w for n, w in zip(neighbors, weights) if n == b)
+    return cost
+
+
+def test_astar_matches_dijkstra_cost(service):
+    rng = random.Random(0)
+    n = service.graph.num_nodes
+    pairs = [(rng.randrange(n), rng.randrange(n)) for _ in range(500)]
+    for start, goal in pairs:
+        dijkstra = service._search(start, goal, set(), "dijkstra")
+        astar = service._search(start, goal, set(), "astar")
+        assert (dijkstra is None) == (astar is None)
+        if dijkstra is None:
+            continue
+        assert astar[0] == start and astar[-1] == goal
+        assert path_cost(service, astar) == pytest.approx(path_cost(service, dijkstra), rel=1e-6, abs=1e-6)
+
+
+def test_astar_respects_blocked_nodes(service):
+    rng = random.Random(1)
+    n = service.graph.num_nodes
+    blocked = set(rng.sample(range(n), n // 20))
+    free = [i for i in range(n) if i not in blocked]
+    for start, goal in itertools.islice(zip(rng.sample(free, 100), rng.sample(free, 100)), 100):
+        dijkstra = service._search(start, goal, blocked, "dijkstra")
+        astar = service._search(start, goal, blocked, "astar")
+        assert (dijkstra is None) == (astar is None)
+        if astar is not None:
+            assert blocked.isdisjoint(astar)
+            assert path_cost(service, astar) == pytest.approx(path_cost(service, dijkstra), rel=1e-6, abs=1e-6)
+
+
+def test_point_routes_start_next_to_a_blocked_node():
+    # 3 x 3 grid with ~45 m edges, so an obstacle blocks a single node
+    ids = [f"r{row}c{col}" for row in range(3) for col in range(3)]
+    lats = [40.0 + 0.0004 * row for row in range(3) for col in range(3)]
+    lngs = [-80.0 + 0.0005 * col for row in range(3) for col in range(3)]
+    edges = [(f"r{r}c{c}", f"r{r}c{c + 1}") for r in range(3) for c in range(2)] + \
+            [(f"r{r}c{c}", f"r{r + 1}c{c}") for r in range(2) for c in range(3)]
+    graph = CompiledGraph.build(ids, [""] * 9, ["waypoint"] * 9, lats, lngs, edges)
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(graph, {"goal hall": "r0c2"})
+    a, b = graph.index_of("r0c0"), graph.index_of("r0c1")
+    lat, lng = graph.coords(b)
+    service.obstacle_index.upsert({"_id": "blocker", "active": True, "ai_verified": True, "coords": {"lat": lat, "lng": lng},
+                                   "severity": "HIGH", "obstacle_type": "debris", "ai_confidence": 0.9})
+    assert service.penalties["default"].blocked_nodes() == {b}
+
+    a_lat, a_lng = graph.coords(a)
+    fixes = [(a_lat, a_lng), (a_lat, a_lng + (lng - a_lng) * 0.02)]  # On a, and just off it towards b
+    for fix in fixes:
+        single = asyncio.run(service.find_path_from_point(fix, end_building="goal hall"))
+        batch, = asyncio.run(service.find_paths_to_building([fix], "goal hall"))
+        for route in (single, batch):
+            assert route is not None
+            assert route["path_nodes"][0] == "r0c0" and "r0c1" not in route["path_nodes"]
+        assert single["path_nodes"] == batch["path_nodes"]
+
+
+def random_graph(seed, n=300):
+    rng = random.Random(seed)
+    ids = [f"n{i}" for i in range(n)]
+    lats = [40.0 + rng.random() * 0.01 for _ in range(n)]
+    lngs = [-80.0 + rng.random() * 0.01 for _ in range(n)]
+    edges = {(ids[i], ids[rng.randrange(n)]) for i in range(n) for _ in range(3)}
+    edges = [(a, b) for a, b in edges if a != b]
+    return CompiledGraph.build(ids, [""] * n, ["waypoint"] * n, lats, lngs, edges)
+
+
+def assert_matches_dijkstra(service, start, goal, path):
+    dijkstra = service._search(start, goal, set(), "dijkstra")
+    assert (path is None) == (dijkstra is None)
+    if path is not None:
+        assert path[0] == start and path[-1] == goal
+        assert path_cost(service, path) == pytest.approx(path_cost(service, dijkstra), rel=1e-9, abs=1e-6)
+
+
+def test_contraction_hierarchy_matches_dijkstra_on_a_random_graph():
+    graph = random_graph(2)
+    service = NavigationService(use_contraction_hierarchy=False)
+    service.load_graph(graph, {})
+    hierarchy = ContractionHierarchy(graph)
+    rng = random.Random(3)
+    for _ in range(300):
+        start, goal = rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)
+        result = hierarchy.query(start, goal)
+        assert_matches_dijkstra(service, start, goal, None if result is None else result[1])
+        if result is not None:
+            assert result[0] == pytest.approx(path_cost(service, result[1]), rel=1e-9, abs=1e-6)
+
+
+def test_routes_stay_exact_while_the_hierarchy_is_rebuilt():
+    service = NavigationService(use_contraction_hierarchy=True)
+    rng = random.Random(4)
+
+    async def scenario():
+        service.load_graph(random_graph(5), {})
+        await service._hierarchy_task
+        assert service.contraction_hierarchy is not None
+
+        # Replacing the graph drops the old hierarchy and contracts the new one in the background
+        service.load_graph(random_graph(6), {})
+        during = 0
+        while not service._hierarchy_task.done():
+            assert service.contraction_hierarchy is None
+            start, goal = rng.randrange(service.graph.num_nodes), rng.randrange(service.graph.num_nodes)
+            assert_matches_dijkstra(service, start, goal, service._route(start, goal))
+            during += 1
+            await asyncio.sleep(0)
+        assert during > 0
+
+        assert service.contraction_hierarchy is not None and service.contraction_hierarchy.graph is service.graph
+        for _ in range(200):
+            start, goal = rng.randrange(service.graph.num_nodes), rng.randrange(service.graph.num_nodes)
+            assert_matches_dijkstra(service, start, goal, service._route(start, goal, "ch"))
+
+    asyncio.run(scenario())
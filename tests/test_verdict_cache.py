@@ -0,0 +1,72 @@
+import io
+
+from PIL import Image
+
+from verdict_cache import ImageFingerprint, VerdictCache
+
+HERE = (40.0, -80.0)
+VERDICT = {"is_obstacle": True, "obstacle_type": "stairs", "severity": "HIGH", "confidence": 0.9}
+
+
+def png(image, **params) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, "PNG", **params)
+    return buf.getvalue()
+
+
+def gradient():
+    return Image.linear_gradient("L").resize((128, 96)).convert("RGB")
+
+
+def flip_bits(phash, count):
+    return phash ^ ((1 << count) - 1)
+
+
+def test_exact_digest_ignores_file_encoding():
+    image = gradient()
+    plain = ImageFingerprint.from_bytes(png(image))
+    recompressed = ImageFingerprint.from_bytes(png(image, compress_level=9, dpi=(300, 300)))
+    assert plain.digest == recompressed.digest
+
+    cache = VerdictCache(perceptual=False)
+    cache.put(plain, HERE, VERDICT)
+    assert cache.get(recompressed, (0.0, 0.0)) == VERDICT  # Exact hits don't depend on location
+    edited = image.copy()
+    edited.putpixel((0, 0), (255, 0, 0))
+    assert cache.get(ImageFingerprint.from_bytes(png(edited)), HERE) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_near_duplicates_hit_up_to_the_hamming_threshold():
+    cache = VerdictCache(phash_distance=6, phash_radius_m=30)
+    stored = ImageFingerprint("a" * 64, 0x0123456789ABCDEF)
+    cache.put(stored, HERE, VERDICT)
+
+    assert cache.get(ImageFingerprint("b" * 64, flip_bits(stored.phash, 6)), HERE) == VERDICT
+    assert cache.get(ImageFingerprint("c" * 64, flip_bits(stored.phash, 7)), HERE) is None
+    assert cache.get(ImageFingerprint("d" * 64, stored.phash), (40.001, -80.0)) is None  # ~110 m away
+
+    # A resized copy of a real image lands within the threshold
+    image = gradient()
+    resized = ImageFingerprint.from_bytes(png(image.resize((256, 192))))
+    cache.put(ImageFingerprint.from_bytes(png(image)), HERE, VERDICT)
+    assert cache.get(resized, HERE) == VERDICT
+
+    assert VerdictCache(perceptual=False).get(ImageFingerprint("b" * 64, stored.phash), HERE) is None
+
+
+def test_sqlite_cache_survives_restarts(tmp_path):
+    db_path = str(tmp_path / "verdicts.db")
+    stored = ImageFingerprint("a" * 64, 0xF123456789ABCDEF)  # Top bit set: stored as a signed integer
+    VerdictCache(db_path=db_path).put(stored, HERE, VERDICT)
+
+    restarted = VerdictCache(db_path=db_path)
+    assert restarted.stats()["entries"] == 0
+    assert restarted.get(ImageFingerprint("a" * 64, 0), (0.0, 0.0)) == VERDICT
+    assert restarted.stats()["entries"] == 1  # Promoted into memory
+
+    near = VerdictCache(db_path=db_path)
+    assert near.get(ImageFingerprint("b" * 64, flip_bits(stored.phash, 6)), HERE) == VERDICT
+    assert near.get(ImageFingerprint("c" * 64, flip_bits(stored.phash, 7)), HERE) is None
+
+    assert VerdictCache(db_path=db_path, ttl=-1).get(stored, HERE) is None  # Expired
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+FINGERPRINT_SIZE = 512  # Images are hashed at roughly this resolution
+
+
+class ImageFingerprint:
+    """Exact and perceptual hashes of one uploaded image"""
+
+    def __init__(self, digest: str, phash: int):
+        self.digest = digest  # sha256 of the decoded, orientation-normalised RGB pixels
+        self.phash = phash    # 64-bit difference hash; near-duplicates differ in few bits
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes) -> "ImageFingerprint":
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("RGB", (FINGERPRINT_SIZE, FINGERPRINT_SIZE))  # JPEGs decode at a reduced scale
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        # Hash pixels rather than file bytes, so metadata-only differences still match
+        digest = hashlib.sha256(f"{image.width}x{image.height}".encode() + image.tobytes()).hexdigest()
+        return cls(digest, difference_hash(image))
+
+
+def difference_hash(image: Image.Image) -> int:
+    """dHash: compare neighbouring pixels of a 9x8 grayscale thumbnail"""
+    small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def _distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Equirectangular distance in meters; plenty for the short ranges compared here"""
+    lat1, lng1 = map(math.radians, a)
+    lat2, lng2 = map(math.radians, b)
+    x = (lng2 - lng1) * math.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return 6371000 * math.hypot(x, y)
+
+
+class VerdictCache:
+    """
+    Cache of Gemini obstacle verdicts keyed by image content.
+
+    Lookups first try the exact pixel digest. With perceptual matching
+    enabled, a re-encoded or resized copy also hits when its dHash is
+    within phash_distance bits of a cached image reported within
+    phash_radius_m meters. Entries expire after ttl seconds and the
+    in-memory table keeps the max_entries most recently used ones. With
+    db_path set, verdicts are also written to SQLite so they survive
+    restarts and in-memory eviction.
+
+    Safe to use from the detection worker threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 86400,
+        db_path: Optional[str] = None,
+        perceptual: bool = True,
+        phash_distance: int = 6,
+        phash_radius_m: float = 30,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.phash_distance = phash_distance
+        self.phash_radius_m = phash_radius_m
+        self.hits = 0
+        self.misses = 0
+        # digest -> {"verdict", "phash", "coords", "stored_at"}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "digest TEXT PRIMARY KEY, phash INTEGER, lat REAL, lng REAL, verdict TEXT, stored_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_location ON verdicts (lat, lng)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Configure from VERDICT_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.getenv("VERDICT_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("VERDICT_CACHE_TTL_SECONDS", "86400")),
+            db_path=os.getenv("VERDICT_CACHE_DB") or None,
+            perceptual=os.getenv("VERDICT_CACHE_PERCEPTUAL", "1").lower() in ("1", "true", "yes"),
+            phash_distance=int(os.getenv("VERDICT_CACHE_PHASH_DISTANCE", "6")),
+            phash_radius_m=float(os.getenv("VERDICT_CACHE_PHASH_RADIUS_M", "30")),
+        )
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": self._db is not None,
+        }
+
+    def get(self, fingerprint: ImageFingerprint, coords: Tuple[float, float]) -> Optional[Dict]:
+        """Cached verdict for this image (or a near-duplicate nearby), or None"""
+        now = time.time()
+        with self._lock:
+            verdict = self._get_memory(fingerprint, coords, now)
+            if verdict is None and self._db is not None:
+                verdict = self._get_db(fingerprint, coords, now)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(verdict)
+
+    def put(self, fingerprint: ImageFingerprint, coords: Tuple[float, float], verdict: Dict):
+        now = time.time()
+        with self._lock:
+            self._remember(fingerprint.digest, fingerprint.phash, coords, verdict, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)",
+                    (fingerprint.digest, _to_signed(fingerprint.phash), coords[0], coords[1], json.dumps(verdict), now),
+                )
+                self._db.execute("DELETE FROM verdicts WHERE stored_at < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def _get_memory(self, fingerprint, coords, now) -> Optional[Dict]:
+        entry = self._entries.get(fingerprint.digest)
+        if entry is None and self.perceptual:
+            entry = next(
+                (e for e in reversed(self._entries.values()) if self._is_near_duplicate(e, fingerprint, coords)),
+                None,
+            )
+        if entry is None:
+            return None
+        if now - entry["stored_at"] > self.ttl:
+            self._entries.pop(entry["digest"], None)
+            return None
+        self._entries.move_to_end(entry["digest"])
+        return entry["verdict"]
+
+    def _get_db(self, fingerprint, coords, now) -> Optional[Dict]:
+        row = self._db.execute(
+            "SELECT digest, phash, lat, lng, verdict, stored_at FROM verdicts WHERE digest = ? AND stored_at >= ?",
+            (fingerprint.digest, now - self.ttl),
+        ).fetchone()
+        if row is None and self.perceptual:
+            # Bounding box around the report, then the exact distance and hash checks
+            dlat = self.phash_radius_m / 111320
+            dlng = dlat / max(math.cos(math.radians(coords[0])), 1e-6)
+            rows = self._db.execute(
+                "SELECT digest, phash, lat, lng, verdict, stored_at FROM verdicts "
+                "WHERE lat BETWEEN ? AND ? AND lng BETWEEN ? AND ? AND stored_at >= ?",
+                (coords[0] - dlat, coords[0] + dlat, coords[1] - dlng, coords[1] + dlng, now - self.ttl),
+            ).fetchall()
+            row = next(
+                (r for r in rows if self._is_near_duplicate(
+                    {"phash": r[1] & 0xFFFFFFFFFFFFFFFF, "coords": (r[2], r[3])}, fingerprint, coords)),
+                None,
+            )
+        if row is None:
+            return None
+        digest, phash, lat, lng, verdict_json, stored_at = row
+        verdict = json.loads(verdict_json)
+        # Promote into memory for the next lookup
+        self._remember(digest, phash & 0xFFFFFFFFFFFFFFFF, (lat, lng), verdict, stored_at)
+        return verdict
+
+    def _is_near_duplicate(self, entry: Dict, fingerprint: ImageFingerprint, coords) -> bool:
+        return (
+            bin(entry["phash"] ^ fingerprint.phash).count("1") <= self.phash_distance
+            and _distance_m(entry["coords"], coords) <= self.phash_radius_m
+        )
+
+    def _remember(self, digest, phash, coords, verdict, stored_at):
+        self._entries[digest] = {
+            "digest": digest,
+            "verdict": verdict,
+            "phash": phash,
+            "coords": tuple(coords),
+            "stored_at": stored_at,
+        }
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value